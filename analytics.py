@@ -0,0 +1,242 @@
+# column-oriented wallet activity over a block range, with vectorized summaries
+# usage: python analytics.py <infura_project_id> <address> [--blocks N] [--buckets N]
+
+import argparse
+import json
+import sys
+import time
+from decimal import Decimal
+
+import numpy as np
+from web3 import Web3
+
+from clients import chunked, get_web3, ordered_map
+from indexer import IN, OUT, SELF, get_index, index_exists
+from scanner import BLOCK_BATCH, SCAN_WINDOW, address_key, fetch_blocks, fetch_receipts
+
+GWEI = 10**9
+DEFAULT_BUCKETS = 20
+MAX_BUCKETS = 1000
+UNKNOWN_STATUS = -1  # no receipt could be fetched
+
+# Wei amounts don't fit in int64, so each is kept as whole gwei plus a wei
+# remainder; sums over both columns stay exact for any realistic wallet
+COLUMNS = (
+    ("block", np.int64),
+    ("direction", np.int8),
+    ("value_gwei", np.int64),
+    ("value_wei", np.int64),
+    ("fee_gwei", np.int64),
+    ("fee_wei", np.int64),
+    ("gas_used", np.int64),
+    ("status", np.int8),
+)
+
+
+class Activity:
+    def __init__(self, address, start_block, end_block, columns):
+        self.address = address
+        self.start_block = start_block
+        self.end_block = end_block
+        self.columns = columns  # name -> 1-d array, one entry per matched transaction
+
+    def __len__(self):
+        return len(self.columns["block"])
+
+    @classmethod
+    def from_rows(cls, address, start_block, end_block, rows):
+        # rows: (block, direction, value, fee, gas used, status) tuples with wei as Python ints
+        block, direction, value, fee, gas_used, status = zip(*rows) if rows else ((),) * 6
+        value_gwei, value_wei = _split_wei(value)
+        fee_gwei, fee_wei = _split_wei(fee)
+        data = {
+            "block": block, "direction": direction, "value_gwei": value_gwei, "value_wei": value_wei,
+            "fee_gwei": fee_gwei, "fee_wei": fee_wei, "gas_used": gas_used, "status": status,
+        }
+        return cls(address, start_block, end_block,
+                   {name: np.asarray(data[name], dtype=dtype) for name, dtype in COLUMNS})
+
+    def _wei_sum(self, prefix, mask):
+        return int(self.columns[prefix + "_gwei"][mask].sum()) * GWEI + int(self.columns[prefix + "_wei"][mask].sum())
+
+    def _eth(self, prefix):
+        return self.columns[prefix + "_gwei"] / GWEI + self.columns[prefix + "_wei"] / 10**18
+
+    def histogram(self, buckets=DEFAULT_BUCKETS):
+        # Equal-width block buckets over the whole range, empty ones included
+        span = self.end_block - self.start_block + 1
+        buckets = max(1, min(buckets, span))
+        width = -(-span // buckets)
+        index = (self.columns["block"] - self.start_block) // width
+        count = -(-span // width)
+        direction = self.columns["direction"]
+        value = self._eth("value")
+        return {
+            "bucket_width": width,
+            "bucket_start": (self.start_block + np.arange(count) * width).tolist(),
+            "transactions": np.bincount(index, minlength=count).tolist(),
+            "received_eth": np.bincount(index, weights=np.where(direction == IN, value, 0.0), minlength=count).tolist(),
+            "sent_eth": np.bincount(index, weights=np.where(direction == OUT, value, 0.0), minlength=count).tolist(),
+            "failed": np.bincount(index, weights=self.columns["status"] == 0, minlength=count).astype(np.int64).tolist(),
+        }
+
+    def summary(self, buckets=DEFAULT_BUCKETS):
+        direction = self.columns["direction"]
+        status = self.columns["status"]
+        incoming = direction == IN
+        outgoing = direction == OUT
+        # The sender pays gas, self transfers included
+        paying = direction != IN
+        with_receipt = status != UNKNOWN_STATUS
+        failed = int(np.count_nonzero(status == 0))
+        settled = int(np.count_nonzero(with_receipt))
+
+        received = self._wei_sum("value", incoming)
+        sent = self._wei_sum("value", outgoing)
+        fees = self._wei_sum("fee", paying)
+        net = received - sent - fees
+        blocks = self.columns["block"]
+        return {
+            "address": self.address,
+            "start_block": self.start_block,
+            "end_block": self.end_block,
+            "transactions": len(self),
+            "incoming": int(np.count_nonzero(incoming)),
+            "outgoing": int(np.count_nonzero(outgoing)),
+            "self": int(np.count_nonzero(direction == SELF)),
+            "active_blocks": int(np.unique(blocks).size),
+            "first_block": int(blocks.min()) if len(self) else None,
+            "last_block": int(blocks.max()) if len(self) else None,
+            # Wei totals as strings so JSON clients don't round them
+            "received_wei": str(received),
+            "sent_wei": str(sent),
+            "fees_paid_wei": str(fees),
+            "net_flow_wei": str(net),
+            "received_eth": _to_eth(received),
+            "sent_eth": _to_eth(sent),
+            "fees_paid_eth": _to_eth(fees),
+            "net_flow_eth": _to_eth(net),
+            "gas_used": int(self.columns["gas_used"][paying].sum()),
+            "failed": failed,
+            "failure_rate": failed / settled if settled else 0.0,
+            "histogram": self.histogram(buckets),
+        }
+
+
+def _to_eth(wei):
+    # Web3.from_wei rejects negative amounts, and net flow can be negative
+    return float(Decimal(wei) / GWEI**2)
+
+
+def _split_wei(amounts):
+    gwei, wei = [], []
+    for amount in amounts:
+        whole, rest = divmod(amount, GWEI)
+        gwei.append(whole)
+        wei.append(rest)
+    return gwei, wei
+
+
+def activity_rows(infura_project_id, block_numbers, key):
+    # One batch for the blocks, one for the receipts of the wallet's transactions
+    matched = []
+    for block in fetch_blocks(infura_project_id, block_numbers):
+        if block is None:
+            continue
+        for tx in block["transactions"]:
+            sender = address_key(tx["from"]) == key
+            recipient = tx["to"] is not None and address_key(tx["to"]) == key
+            if sender or recipient:
+                matched.append((tx, SELF if sender and recipient else OUT if sender else IN))
+    if not matched:
+        return []
+
+    receipts = fetch_receipts(infura_project_id, [tx for tx, _ in matched])
+    rows = []
+    for tx, direction in matched:
+        receipt = receipts.get(tx["hash"])
+        if receipt:
+            gas_used = int(receipt["gasUsed"], 16)
+            price = int(receipt.get("effectiveGasPrice") or tx.get("gasPrice") or "0x0", 16)
+            status = int(receipt["status"], 16)
+        else:
+            gas_used, price, status = 0, 0, UNKNOWN_STATUS
+        rows.append((int(tx["blockNumber"], 16), direction, int(tx["value"], 16), gas_used * price, gas_used, status))
+    return rows
+
+
+def index_rows(infura_project_id, index, address, start_block, end_block):
+    # activity_rows from the address index's postings; the index has no gas
+    # price, so the receipts of the wallet's own sends are fetched for their fees
+    postings = index.postings(address, start_block, end_block)
+    paying = [{"hash": "0x" + p[6].hex()} for p in postings if p[3] != IN and p[5] is not None]
+    receipts = fetch_receipts(infura_project_id, paying) if paying else {}
+    rows = []
+    for _, block, _, direction, value, status, tx_hash, _, gas_used in reversed(postings):
+        if status is None:
+            rows.append((block, direction, int(value), 0, 0, UNKNOWN_STATUS))
+            continue
+        fee = 0
+        if direction != IN:
+            receipt = receipts.get("0x" + tx_hash.hex())
+            fee = gas_used * int(receipt.get("effectiveGasPrice") or "0x0", 16) if receipt else 0
+        rows.append((block, direction, int(value), fee, gas_used, status))
+    return rows
+
+
+def load_activity(infura_project_id, address, start_block, end_block, window=SCAN_WINDOW, batch_size=BLOCK_BATCH,
+                  index=None):
+    # Read the part of the range `index` holds from it, scan the rest in
+    # parallel block batches, and keep only the numeric columns
+    key = address_key(address)
+    rows = []
+    scan_from = start_block
+    indexed_to = index.indexed_through(start_block, end_block) if index is not None else None
+    if indexed_to is not None:
+        rows = index_rows(infura_project_id, index, address, start_block, indexed_to)
+        scan_from = indexed_to + 1
+
+    def work(chunk):
+        return activity_rows(infura_project_id, chunk, key)
+
+    for chunk_rows in ordered_map(work, chunked(range(scan_from, end_block + 1), batch_size), window):
+        rows.extend(chunk_rows)
+    return Activity.from_rows(Web3.to_checksum_address(address), start_block, end_block, rows)
+
+
+def wallet_stats(infura_project_id, address, num_blocks=20, start_block=None, end_block=None,
+                 buckets=DEFAULT_BUCKETS):
+    # Summary of the last `num_blocks` blocks, or of an explicit range
+    if end_block is None:
+        end_block = get_web3(infura_project_id).eth.block_number
+    if start_block is None:
+        start_block = max(0, end_block - num_blocks)
+    if start_block > end_block:
+        raise ValueError("start_block is after end_block")
+    buckets = min(buckets, MAX_BUCKETS)
+    # An address index built by indexer.py answers the blocks it already holds
+    index = get_index() if index_exists() else None
+    activity = load_activity(infura_project_id, address, start_block, end_block, index=index)
+    return activity.summary(buckets)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("infura_project_id")
+    parser.add_argument("address")
+    parser.add_argument("--blocks", type=int, default=20, help="blocks back from the latest to analyse")
+    parser.add_argument("--buckets", type=int, default=DEFAULT_BUCKETS, help="histogram buckets")
+    args = parser.parse_args()
+
+    if not Web3.is_address(args.address):
+        print("Error: invalid address")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    stats = wallet_stats(args.infura_project_id, args.address, args.blocks, buckets=args.buckets)
+    print(json.dumps(stats, indent=2))
+    print(f"Analysed {stats['transactions']} transactions in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# load test: Flask app under gunicorn vs the ASGI app under uvicorn, one worker each,
+# against a local JSON-RPC stub with simulated upstream latency
+
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+import rpc_stub
+
+ADDRESS = "0x000000000000000000000000000000000000dEaD"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def load(url, total, concurrency):
+    body = {"infura_project_id": "bench", "sender_address": ADDRESS}
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = 0
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                async with session.post(url + "/get-wallet-balance", json=body) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+    return total / elapsed, errors
+
+
+def bench(command, stub_url, total, concurrency):
+    port = free_port()
+    env = dict(os.environ, RPC_URL_TEMPLATE=stub_url + "/v3/{}", PORT=str(port))
+    process = subprocess.Popen(
+        [arg.replace("$PORT", str(port)) for arg in command],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        return asyncio.run(load(f"http://127.0.0.1:{port}", total, concurrency))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(total=500, concurrency=100, latency=0.05):
+    server, stub_url = rpc_stub.serve(rpc_stub.StubChain(latency=latency))
+    servers = {
+        "flask/gunicorn (1 sync worker)": ["gunicorn", "script1:app", "--bind", "127.0.0.1:$PORT", "--workers", "1"],
+        "fastapi/uvicorn (1 worker)": ["uvicorn", "script1_asgi:app", "--host", "127.0.0.1", "--port", "$PORT", "--log-level", "warning"],
+    }
+    print(f"{total} requests, {concurrency} concurrent, {latency * 1000:.0f} ms upstream latency")
+    for name, command in servers.items():
+        rate, errors = bench(command, stub_url, total, concurrency)
+        print(f"{name:32} {rate:8.1f} req/s  errors={errors}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    args = [float(arg) for arg in sys.argv[1:]]
+    main(*[int(arg) for arg in args[:2]], *args[2:])
@@ -0,0 +1,62 @@
+# warm vs cold scan over a recorded fixture chain, with and without the on-disk block store
+# usage: python bench_blockstore.py [fixture.json] [blocks]
+
+import os
+import sys
+import tempfile
+import time
+
+import blockstore
+import cache
+import clients
+import rpc_stub
+from scanner import address_matcher, scan_blocks
+
+
+def make_fixture(path, blocks):
+    # Record a fixture from the synthetic stub chain when none is supplied
+    server, url = rpc_stub.serve(rpc_stub.StubChain(block_number=blocks + 100))
+    clients.INFURA_URL = url + "/v3/{}"
+    rpc_stub.record_fixture("record", 1, blocks + 100, path)
+    server.shutdown()
+    clients.clear()
+
+
+def run_scan(chain, start_block, end_block, address):
+    before = sum(chain.calls.values())
+    started = time.perf_counter()
+    matches = list(scan_blocks("bench", start_block, end_block, address_matcher([address])))
+    return time.perf_counter() - started, sum(chain.calls.values()) - before, len(matches)
+
+
+def main(fixture_path=None, blocks=1000):
+    workdir = tempfile.mkdtemp()
+    if fixture_path is None:
+        fixture_path = os.path.join(workdir, "fixture.json")
+        make_fixture(fixture_path, blocks)
+
+    chain = rpc_stub.FixtureChain(fixture_path, latency=0.02)
+    server, url = rpc_stub.serve(chain)
+    clients.INFURA_URL = url + "/v3/{}"
+
+    finalized = cache.get_finalized_block("bench")
+    start_block = max(min(chain.blocks), finalized - blocks + 1)
+    address = chain.blocks[finalized]["transactions"][0]["from"]
+    print(f"scanning blocks {start_block}..{finalized} for {address}")
+
+    blockstore.STORE_PATH = ""
+    elapsed, calls, found = run_scan(chain, start_block, finalized, address)
+    print(f"no store:   {elapsed:7.3f} s  {calls:5d} RPC calls  {found} matches")
+
+    blockstore.STORE_PATH = os.path.join(workdir, "blocks.sqlite3")
+    for label in ("cold store", "warm store"):
+        elapsed, calls, found = run_scan(chain, start_block, finalized, address)
+        print(f"{label}: {elapsed:7.3f} s  {calls:5d} RPC calls  {found} matches")
+
+    size = os.path.getsize(blockstore.STORE_PATH)
+    print(f"store size: {size / 1024:.0f} KiB for {finalized - start_block + 1} blocks")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None, int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,94 @@
+# per-invocation wall time of the one-shot scripts against cli.py, in-process and
+# through the resident daemon, all against the local chain simulator in rpc_stub.py
+# usage: python bench_cli.py [runs] [latency]
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import rpc_stub
+
+PROJECT = "bench"
+PYTHON = sys.executable
+
+
+def timed_runs(argv, env, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([PYTHON] + argv, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def wait_for_socket(path, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("cli.py daemon did not start")
+        time.sleep(0.05)
+
+
+def main(runs=10, latency=0.01):
+    chain = rpc_stub.StubChain(block_number=20000, latency=latency, txs_per_block=20, seed=1)
+    server, url = rpc_stub.serve(chain)
+    workdir = tempfile.mkdtemp(prefix="bench-cli-")
+    socket_path = os.path.join(workdir, "cli.sock")
+    env = dict(
+        os.environ,
+        RPC_URL_TEMPLATE=url + "/v3/{}",
+        WS_URL_TEMPLATE="",
+        BLOCK_STORE_PATH="",
+        ADDRESS_INDEX_PATH=os.path.join(workdir, "address_index.sqlite3"),
+        CLI_SOCKET=socket_path,
+    )
+    address = rpc_stub.account(1)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def script(name):
+        return os.path.join(here, name)
+
+    cases = [
+        ("python -c pass", ["-c", "pass"]),
+        ("import web3, eth_account", ["-c", "import web3, eth_account"]),
+        ("cli.py --help", [script("cli.py"), "--help"]),
+        ("script3.py balance", [script("script3.py"), PROJECT, address]),
+        ("cli.py balance (in-process)", [script("cli.py"), "--no-daemon", "balance", PROJECT, address]),
+        ("script6.py history", [script("script6.py"), PROJECT, address]),
+        ("cli.py history (in-process)", [script("cli.py"), "--no-daemon", "history", PROJECT, address]),
+    ]
+    daemon_cases = [
+        ("cli.py balance (daemon)", [script("cli.py"), "balance", PROJECT, address]),
+        ("cli.py history (daemon)", [script("cli.py"), "history", PROJECT, address]),
+        ("cli.py new-wallet (daemon)", [script("cli.py"), "new-wallet"]),
+    ]
+
+    print(f"{runs} runs each, {latency * 1000:.0f} ms simulated RPC latency")
+    print(f"{'command':32s} {'median ms':>10s} {'min ms':>8s}")
+
+    def report(name, samples):
+        print(f"{name:32s} {statistics.median(samples):10.1f} {min(samples):8.1f}")
+        sys.stdout.flush()
+
+    for name, argv in cases:
+        report(name, timed_runs(argv, env, runs))
+
+    daemon = subprocess.Popen([PYTHON, script("cli.py"), "daemon"], env=env, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_socket(socket_path, daemon)
+        for name, argv in daemon_cases:
+            timed_runs(argv, env, 1)  # first request fills the daemon's caches
+            report(name, timed_runs(argv, env, runs))
+    finally:
+        daemon.terminate()
+        daemon.wait()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    main(runs, latency)
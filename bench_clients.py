@@ -0,0 +1,64 @@
+# benchmark /get-wallet-balance with a fresh Web3 client per request vs the pooled registry
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+
+import clients
+import rpc_stub
+import script1
+
+ADDRESS = "0x000000000000000000000000000000000000dEaD"
+
+
+def fresh_get_web3(infura_project_id):
+    return Web3(Web3.HTTPProvider(clients.rpc_url(infura_project_id)))
+
+
+def fresh_is_connected(infura_project_id):
+    return fresh_get_web3(infura_project_id).is_connected()
+
+
+def run(requests_total, threads):
+    body = {"infura_project_id": "bench", "sender_address": ADDRESS}
+
+    def worker(count):
+        client = script1.app.test_client()
+        for _ in range(count):
+            response = client.post("/get-wallet-balance", json=body)
+            assert response.status_code == 200, response.get_json()
+
+    per_thread = requests_total // threads
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(worker, [per_thread] * threads))
+    elapsed = time.perf_counter() - start
+    return per_thread * threads / elapsed
+
+
+def main(requests_total=2000, threads=8):
+    server, url = rpc_stub.serve()
+    clients.INFURA_URL = url + "/v3/{}"
+
+    # Before: build Web3/HTTPProvider and probe the node on every request
+    pooled = (script1.get_web3, script1.is_connected)
+    script1.get_web3, script1.is_connected = fresh_get_web3, fresh_is_connected
+    before = run(requests_total, threads)
+
+    # After: pooled registry with keep-alive sessions
+    script1.get_web3, script1.is_connected = pooled
+    after = run(requests_total, threads)
+
+    print(f"fresh client per request: {before:8.1f} req/s")
+    print(f"pooled client registry:   {after:8.1f} req/s")
+    print(f"speedup: {after / before:.2f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+    else:
+        main()
@@ -0,0 +1,86 @@
+# get_balance latency against flaky, tail-heavy upstreams: one endpoint vs the router over three
+# Slow answers (what hedging is for) and failed ones (what retries are for) are
+# simulated separately so each feature's effect shows in its own percentiles
+# usage: python bench_router.py [requests] [threads]
+
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from web3 import Web3
+
+import clients
+import router
+import rpc_stub
+
+# Distinct address per request, so single-flight never collapses the load
+ADDRESSES = [Web3.to_checksum_address(rpc_stub.account(i)) for i in range(20000)]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(requests_total, threads, offset=0):
+    web3 = clients.get_web3("bench")
+
+    def one(i):
+        started = time.perf_counter()
+        try:
+            web3.eth.get_balance(ADDRESSES[(offset + i) % len(ADDRESSES)])
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(threads) as pool:
+        samples = list(pool.map(one, range(requests_total)))
+    errors = samples.count(None)
+    samples = [s for s in samples if s is not None]
+    return statistics.median(samples), percentile(samples, 0.99), percentile(samples, 0.999), errors
+
+
+def measure(templates, hedged, requests_total, threads):
+    clients.clear()
+    clients.RPC_ENDPOINTS = [(template, None) for template in templates]
+    router.HEDGED_METHODS = ("eth_getBalance",) if hedged else ()
+    # Warm up so the hedge delay comes from measured p95 latencies
+    run(200, threads, offset=len(ADDRESSES) // 2)
+    before = clients.get_client("bench").router.stats()
+    result = run(requests_total, threads)
+    after = clients.get_client("bench").router.stats()
+    failed = sum(e["errors"] for e in after["endpoints"]) - sum(e["errors"] for e in before["endpoints"])
+    return result + (after["hedges"] - before["hedges"], after["hedge_wins"] - before["hedge_wins"], failed)
+
+
+def main(requests_total=2000, threads=8):
+    # Every stub serves the same synthetic chain with 5 ms latency
+    scenarios = (
+        ("3% of answers take 300 ms", dict(tail_rate=0.03, tail_latency=0.3)),
+        ("2% of answers are HTTP 500", dict(fail_rate=0.02)),
+    )
+    configs = (
+        ("single endpoint", 1, False),
+        ("router, 3 endpoints", 3, False),
+        ("router, 3, hedged", 3, True),
+    )
+    print(f"{requests_total} requests on {threads} threads")
+    for title, faults in scenarios:
+        upstreams = [rpc_stub.serve(rpc_stub.StubChain(latency=0.005, seed=seed, **faults)) for seed in range(3)]
+        templates = [url + "/v3/{}" for _, url in upstreams]
+        print(f"\n{title}")
+        for name, count, hedged in configs:
+            p50, p99, p999, errors, hedges, wins, failed = measure(templates[:count], hedged, requests_total, threads)
+            print(f"  {name:20s} p50 {p50 * 1000:6.1f} ms  p99 {p99 * 1000:6.1f} ms  p99.9 {p999 * 1000:6.1f} ms  "
+                  f"errors {errors:3d}  upstream failures {failed:3d}  hedged {hedges} (won {wins})")
+            sys.stdout.flush()
+        for server, _ in upstreams:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 8)
+    else:
+        main()
@@ -0,0 +1,237 @@
+# offline benchmark suite: Flask routes, the script5/6 block scanners and the script7 monitor,
+# all against the local chain simulator in rpc_stub.py; needs no network access
+# usage: python bench_suite.py [--requests N] [--threads N] [--latency S] [--save FILE]
+#                              [--baseline FILE] [--tolerance F]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Keep every on-disk store out of the working tree and off by default, and poll
+# fast enough for the simulator's short blocks; set before the repo modules read them
+WORKDIR = tempfile.mkdtemp(prefix="bench-suite-")
+os.environ.setdefault("BLOCK_STORE_PATH", "")
+os.environ.setdefault("ADDRESS_INDEX_PATH", os.path.join(WORKDIR, "address_index.sqlite3"))
+os.environ.setdefault("MONITOR_STATE_PATH", os.path.join(WORKDIR, "monitor_state.sqlite3"))
+os.environ.setdefault("HEAD_POLL_INTERVAL", "0.05")
+os.environ.setdefault("FOLLOW_POLL_INTERVAL", "0.05")
+
+from eth_account import Account  # noqa: E402
+from web3 import Web3  # noqa: E402
+
+import clients  # noqa: E402
+import rpc_stub  # noqa: E402
+import script1  # noqa: E402
+import script5  # noqa: E402
+import script6  # noqa: E402
+import script7  # noqa: E402
+from clients import ordered_map  # noqa: E402
+
+PROJECT = "bench"
+BLOCK_TIME = 0.25  # simulator seconds per block while the monitor runs; the head is fixed before that
+# Allowed growth in RPC calls per operation before it counts as a regression; the
+# counts include background pollers (heads, receipts, fees), hence the slack
+RPC_TOLERANCE = 0.25
+RPC_SLACK = 0.5
+MONITOR_SECONDS = 5.0
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def measure(chain, operations, threads):
+    # Run the callables on `threads` threads; per-operation latency, overall
+    # throughput, and the JSON-RPC calls and HTTP round trips they cost
+    calls_before, trips_before = sum(chain.calls.values()), chain.round_trips
+    latencies = []
+
+    def timed(operation):
+        started = time.perf_counter()
+        operation()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    latencies.extend(ordered_map(timed, operations, threads))
+    elapsed = time.perf_counter() - started
+    count = len(latencies)
+    return {
+        "ops": count,
+        "ops_per_s": count / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "rpc_per_op": (sum(chain.calls.values()) - calls_before) / count,
+        "trips_per_op": (chain.round_trips - trips_before) / count,
+    }
+
+
+def route_scenarios(chain, requests_total):
+    client = script1.app.test_client()
+    population = [Web3.to_checksum_address(rpc_stub.account(i)) for i in range(200)]
+    sender = Account.from_key(b"\x07" * 32)
+
+    def post(path, body, expect=(200,)):
+        def operation():
+            response = client.post(path, json=body)
+            response.get_data()  # drain streamed bodies so the whole route is timed
+            assert response.status_code in expect, (path, response.status_code, response.get_data()[:200])
+        return operation
+
+    sent = []
+
+    def send(i):
+        def operation():
+            response = client.post("/send_transaction", json={
+                "infura_project_id": PROJECT, "sender_address": sender.address, "private_key": sender.key.hex(),
+                "recipient_address": population[i % len(population)], "eth_amount": 0.0001,
+                "wait_for_receipt": False,
+            })
+            assert response.status_code == 202, response.get_json()
+            sent.append(response.get_json()["transaction_hash"])
+        return operation
+
+    def lookup(i):
+        def operation():
+            response = client.get(f"/transaction/{sent[i % len(sent)]}?infura_project_id={PROJECT}")
+            assert response.status_code == 200, response.get_json()
+        return operation
+
+    signed = [Account.sign_transaction({"to": population[i], "value": i, "gas": 21000, "gasPrice": 10**9,
+                                        "nonce": i, "chainId": rpc_stub.CHAIN_ID}, sender.key).rawTransaction.hex()
+              for i in range(10)]
+
+    yield "POST /get-wallet-balance", lambda: [
+        post("/get-wallet-balance", {"infura_project_id": PROJECT, "sender_address": population[i % 200]})
+        for i in range(requests_total)]
+    yield "POST /get-wallet-balances x100", lambda: [
+        post("/get-wallet-balances", {"infura_project_id": PROJECT, "addresses": population[i % 100:i % 100 + 100]})
+        for i in range(max(1, requests_total // 10))]
+    yield "POST /send_transaction", lambda: [send(i) for i in range(max(1, requests_total // 4))]
+    yield "GET /transaction/<hash>", lambda: [lookup(i) for i in range(requests_total)]
+    yield "POST /verify x10", lambda: [
+        post("/verify", {"raw_transactions": signed}) for _ in range(max(1, requests_total // 10))]
+
+
+def scanner_scenarios():
+    quiet = rpc_stub.account(10**6)  # outside the simulator's population: every block is scanned
+
+    def silent(fn, *args):
+        def operation():
+            with contextlib.redirect_stdout(io.StringIO()):
+                fn(*args)
+        return operation
+
+    yield "script5 find_latest (500 blocks)", lambda: [
+        silent(script5.find_latest_transaction, PROJECT, quiet, 500) for _ in range(3)]
+    yield "script6 previous (20 blocks)", lambda: [
+        silent(script6.check_previous_transactions, PROJECT, rpc_stub.account(1), 20) for _ in range(10)]
+
+
+def monitor_scenario(chain):
+    # Follow the simulated chain for MONITOR_SECONDS and time how long each
+    # matching transaction takes to arrive after its block became the head.
+    # The monitor runs forever, so this scenario goes last and is left running.
+    lags = []
+
+    def on_transaction(tx):
+        number = tx["blockNumber"]
+        produced = chain.started + (number - chain.start_block) * BLOCK_TIME
+        lags.append(time.monotonic() - produced)
+
+    addresses = [rpc_stub.account(i) for i in range(5)]
+    # Start producing blocks from the current head
+    with chain.lock:
+        chain.started = time.monotonic()
+        chain.block_time = BLOCK_TIME
+    head_before = chain.block_number
+    calls_before, trips_before = sum(chain.calls.values()), chain.round_trips
+    with contextlib.redirect_stdout(io.StringIO()):
+        threading.Thread(target=script7.monitor_transactions, daemon=True,
+                         args=(PROJECT, addresses, on_transaction, lambda tx: None, None)).start()
+        time.sleep(MONITOR_SECONDS)
+    blocks = max(1, chain.block_number - head_before)
+    return {
+        "ops": len(lags),
+        "ops_per_s": len(lags) / MONITOR_SECONDS,
+        "p50_ms": percentile(lags, 0.50) * 1000,
+        "p99_ms": percentile(lags, 0.99) * 1000,
+        "rpc_per_op": (sum(chain.calls.values()) - calls_before) / blocks,  # per block followed
+        "trips_per_op": (chain.round_trips - trips_before) / blocks,
+    }
+
+
+def compare(results, baseline, tolerance):
+    # Slower latency or throughput beyond `tolerance`, or more RPC work per
+    # operation beyond RPC_TOLERANCE, against a saved run
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for field in ("p50_ms", "p99_ms"):
+            if result[field] > base[field] * (1 + tolerance) + 1:
+                regressions.append(f"{name}: {field} {base[field]:.1f} -> {result[field]:.1f}")
+        if result["ops_per_s"] < base["ops_per_s"] / (1 + tolerance):
+            regressions.append(f"{name}: ops/s {base['ops_per_s']:.1f} -> {result['ops_per_s']:.1f}")
+        for field in ("rpc_per_op", "trips_per_op"):
+            if result[field] > base[field] * (1 + RPC_TOLERANCE) + RPC_SLACK:
+                regressions.append(f"{name}: {field} {base[field]:.2f} -> {result[field]:.2f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400, help="requests per route scenario")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.01, help="simulated upstream round trip, seconds")
+    parser.add_argument("--save", help="write the results as JSON, e.g. to use as a baseline later")
+    parser.add_argument("--baseline", help="results JSON to compare against; exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative slowdown in timings")
+    parser.add_argument("--skip-monitor", action="store_true")
+    args = parser.parse_args()
+
+    # A fixed head keeps cache behaviour, and so the RPC counts, identical run to run
+    chain = rpc_stub.StubChain(block_number=20000, latency=args.latency, txs_per_block=20, seed=1)
+    server, url = rpc_stub.serve(chain)
+    ws_server, ws_url = rpc_stub.serve_ws(chain)
+    clients.INFURA_URL = url + "/v3/{}"
+    clients.INFURA_WS_URL = ws_url + "/ws/v3/{}"
+
+    print(f"{'scenario':36s} {'ops':>6s} {'ops/s':>9s} {'p50 ms':>8s} {'p99 ms':>8s} {'rpc/op':>7s} {'trips/op':>8s}")
+    results = {}
+
+    def report(name, result):
+        results[name] = result
+        print(f"{name:36s} {result['ops']:6d} {result['ops_per_s']:9.1f} {result['p50_ms']:8.1f} "
+              f"{result['p99_ms']:8.1f} {result['rpc_per_op']:7.2f} {result['trips_per_op']:8.2f}")
+        sys.stdout.flush()
+
+    for name, build in route_scenarios(chain, args.requests):
+        report(name, measure(chain, build(), args.threads))
+    for name, build in scanner_scenarios():
+        report(name, measure(chain, build(), 1))
+    if not args.skip_monitor:
+        report("script7 monitor (lag per tx, rpc per block)", monitor_scenario(chain))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("no regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# keys per second from wallets.iter_wallets with 1..N worker processes
+# usage: python bench_wallets.py [count] [max_workers]
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import wallets
+
+
+def run(count, workers):
+    if workers == 1:
+        started = time.perf_counter()
+        for _ in wallets.iter_wallets(count, workers=1):
+            pass
+        return count / (time.perf_counter() - started)
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Start the workers before timing so interpreter start-up isn't counted
+        list(pool.map(wallets._generate_chunk, [1] * workers))
+        started = time.perf_counter()
+        for _ in wallets.iter_wallets(count, pool=pool, workers=workers):
+            pass
+        return count / (time.perf_counter() - started)
+
+
+def main(count=4000, max_workers=os.cpu_count() or 1):
+    backend = wallets.keys.PrivateKey(b"\x01" * 32).backend.__class__.__name__
+    print(f"secp256k1 backend: {backend}, {os.cpu_count()} CPUs")
+    workers = 1
+    baseline = None
+    while workers <= max_workers:
+        rate = run(count, workers)
+        baseline = baseline or rate
+        print(f"{workers:3d} workers: {rate:10.1f} keys/s  ({rate / baseline:.2f}x)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    main(count, max_workers)
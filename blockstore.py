@@ -0,0 +1,152 @@
+# persistent SQLite store for finalized blocks and receipts, shared by the scanners
+
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+STORE_PATH = os.environ.get("BLOCK_STORE_PATH", "block_store.sqlite3")  # empty string disables the store
+MAX_BYTES = int(float(os.environ.get("BLOCK_STORE_MAX_MB", 512)) * 1024 * 1024)
+PRUNE_FRACTION = 0.1  # share of the oldest blocks dropped when over the size cap
+PRUNE_CHECK_EVERY = 200  # blocks written between size checks
+
+# Only the fields the scanners and indexers read are kept
+BLOCK_FIELDS = ("number", "hash", "parentHash", "timestamp", "baseFeePerGas", "transactions")
+TX_FIELDS = ("hash", "blockNumber", "transactionIndex", "from", "to", "value", "gasPrice", "nonce")
+RECEIPT_FIELDS = (
+    "transactionHash", "blockNumber", "transactionIndex", "from", "to",
+    "gasUsed", "effectiveGasPrice", "status", "contractAddress",
+)
+
+
+def compact_block(block):
+    compact = {key: block[key] for key in BLOCK_FIELDS if key in block}
+    compact["transactions"] = [
+        {key: tx[key] for key in TX_FIELDS if key in tx} if isinstance(tx, dict) else tx
+        for tx in block["transactions"]
+    ]
+    return compact
+
+
+def compact_receipt(receipt):
+    return {key: receipt[key] for key in RECEIPT_FIELDS if key in receipt}
+
+
+def _pack(value):
+    return zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+
+
+def _unpack(data):
+    return json.loads(zlib.decompress(data))
+
+
+class BlockStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.writes_since_check = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS blocks (
+                chain_id INTEGER NOT NULL,
+                number INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (chain_id, number)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS receipts (
+                chain_id INTEGER NOT NULL,
+                tx_hash BLOB NOT NULL,
+                block_number INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (chain_id, tx_hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS receipts_by_block ON receipts (chain_id, block_number);
+        """)
+
+    def get_blocks(self, chain_id, numbers):
+        if not numbers:
+            return {}
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT number, data FROM blocks WHERE chain_id = ? AND number IN ({','.join('?' * len(numbers))})",
+                [chain_id, *numbers],
+            ).fetchall()
+        return {number: _unpack(data) for number, data in rows}
+
+    def put_blocks(self, chain_id, blocks):
+        if not blocks:
+            return
+        rows = [(chain_id, int(block["number"], 16), _pack(compact_block(block))) for block in blocks]
+        with self.lock:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?)", rows)
+            self.writes_since_check += len(rows)
+            if self.writes_since_check >= PRUNE_CHECK_EVERY:
+                self.writes_since_check = 0
+                self._prune()
+
+    def get_receipts(self, chain_id, tx_hashes):
+        if not tx_hashes:
+            return {}
+        keys = [bytes.fromhex(h[2:]) for h in tx_hashes]
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT tx_hash, data FROM receipts WHERE chain_id = ? AND tx_hash IN ({','.join('?' * len(keys))})",
+                [chain_id, *keys],
+            ).fetchall()
+        return {"0x" + tx_hash.hex(): _unpack(data) for tx_hash, data in rows}
+
+    def put_receipts(self, chain_id, receipts):
+        if not receipts:
+            return
+        rows = [
+            (chain_id, bytes.fromhex(r["transactionHash"][2:]), int(r["blockNumber"], 16), _pack(compact_receipt(r)))
+            for r in receipts
+        ]
+        with self.lock:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO receipts VALUES (?, ?, ?, ?)", rows)
+
+    def size(self):
+        page_count, = self.db.execute("PRAGMA page_count").fetchone()
+        freelist, = self.db.execute("PRAGMA freelist_count").fetchone()
+        page_size, = self.db.execute("PRAGMA page_size").fetchone()
+        return (page_count - freelist) * page_size
+
+    def _prune(self):
+        # Caller holds self.lock. Drop the oldest blocks (and their receipts)
+        # until the store fits under the cap again.
+        while self.size() > MAX_BYTES:
+            count, = self.db.execute("SELECT COUNT(*) FROM blocks").fetchone()
+            if not count:
+                break
+            cutoff, = self.db.execute(
+                "SELECT number FROM blocks ORDER BY number LIMIT 1 OFFSET ?",
+                (max(1, int(count * PRUNE_FRACTION)) - 1,),
+            ).fetchone()
+            with self.db:
+                self.db.execute("DELETE FROM blocks WHERE number <= ?", (cutoff,))
+                self.db.execute("DELETE FROM receipts WHERE block_number <= ?", (cutoff,))
+            self.db.execute("PRAGMA incremental_vacuum")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_block_store():
+    global _store
+    if not STORE_PATH:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = BlockStore(STORE_PATH)
+        return _store
@@ -0,0 +1,135 @@
+# block-aware read cache for balances and chain metadata
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from web3 import Web3
+
+import metrics
+from clients import get_web3
+from heads import get_head
+
+MAX_ENTRIES = int(os.environ.get("READ_CACHE_SIZE", 10000))
+FINALIZED_TTL = float(os.environ.get("FINALIZED_TTL", 30))  # seconds
+FINALITY_DEPTH = 64  # blocks behind the head treated as final when the node has no "finalized" tag
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # key -> (value, expires_at or None)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key, _MISSING)
+            if entry is not _MISSING and (entry[1] is None or entry[1] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not _MISSING:
+                del self.entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def discard_if(self, predicate):
+        with self.lock:
+            for key in [k for k in self.entries if predicate(k)]:
+                del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+cache = LRUCache(MAX_ENTRIES)
+
+
+def _collect_cache_stats():
+    stats = cache.stats()
+    yield "read_cache_hits_total", "counter", "Read cache lookups answered from memory", [({}, stats["hits"])]
+    yield "read_cache_misses_total", "counter", "Read cache lookups that went to the node", [({}, stats["misses"])]
+    yield "read_cache_hit_ratio", "gauge", "Share of read cache lookups that hit", [({}, stats["hit_ratio"])]
+    yield "read_cache_entries", "gauge", "Entries held in the read cache", [({}, stats["entries"])]
+
+
+metrics.register_collector(_collect_cache_stats)
+_purged_heads = {}  # project -> head the balance entries were last purged at
+_purge_lock = threading.Lock()
+
+
+def _purge_old_balances(infura_project_id, head):
+    # Once the head advances, balances keyed by older blocks can never be hit again
+    with _purge_lock:
+        if _purged_heads.get(infura_project_id, -1) >= head:
+            return
+        _purged_heads[infura_project_id] = head
+    cache.discard_if(lambda key: key[0] == "balance" and key[1] == infura_project_id and key[3] < head)
+
+
+def get_chain_id(infura_project_id):
+    # The chain ID never changes, so it is cached for the life of the process
+    key = ("chain_id", infura_project_id)
+    chain_id = cache.get(key)
+    if chain_id is None:
+        chain_id = get_web3(infura_project_id).eth.chain_id
+        cache.set(key, chain_id)
+    return chain_id
+
+
+def get_finalized_block(infura_project_id):
+    key = ("finalized", infura_project_id)
+    finalized = cache.get(key)
+    if finalized is None:
+        web3 = get_web3(infura_project_id)
+        try:
+            finalized = web3.eth.get_block("finalized")["number"]
+        except ValueError:
+            finalized = max(0, get_head(infura_project_id) - FINALITY_DEPTH)
+        cache.set(key, finalized, FINALIZED_TTL)
+    return finalized
+
+
+def get_cached_balance(infura_project_id, address, block_number):
+    return cache.get(("balance", infura_project_id, address.lower(), block_number))
+
+
+def set_cached_balance(infura_project_id, address, block_number, balance):
+    _purge_old_balances(infura_project_id, block_number)
+    cache.set(("balance", infura_project_id, address.lower(), block_number), balance)
+
+
+def get_balance(infura_project_id, address):
+    # Balances only change with a new block, so key them by the current head
+    address = Web3.to_checksum_address(address)
+    head = get_head(infura_project_id)
+    balance = get_cached_balance(infura_project_id, address, head)
+    if balance is None:
+        web3 = get_web3(infura_project_id)
+        try:
+            balance = web3.eth.get_balance(address, head)
+        except ValueError:
+            # The node behind the load balancer may not have the new head yet
+            return web3.eth.get_balance(address)
+        set_cached_balance(infura_project_id, address, head, balance)
+    return balance
@@ -0,0 +1,359 @@
+# one CLI for the wallet scripts: balance, send, latest, history, watch, verify, new-wallet
+# Heavy modules (web3, eth_account, the RPC clients) are imported by the
+# subcommand that needs them. With `python cli.py daemon` running, commands are
+# answered by that process over a Unix socket, so connections, caches and
+# nonce state stay warm between invocations; without it they run in-process.
+# usage: python cli.py [--socket PATH] [--no-daemon] <command> ...
+# Results are printed as JSON; `watch` runs in the foreground and prints as it goes
+
+import argparse
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+
+# Requests can carry private keys, so the socket lives in a directory only this
+# user can enter: $XDG_RUNTIME_DIR when the session has one, else under ~/.cache
+SOCKET_PATH = os.environ.get("CLI_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache"), "eth-cli", "daemon.sock")
+CONNECT_TIMEOUT = 0.5  # seconds to reach the daemon before running in-process instead
+LOCAL_ONLY = ("watch", "daemon")  # never forwarded to the daemon
+
+
+class CommandError(Exception):
+    pass
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def check_address(address):
+    from web3 import Web3
+
+    if not Web3.is_address(address):
+        raise CommandError(f"Invalid address: {address}")
+    return Web3.to_checksum_address(address)
+
+
+def cmd_balance(args):
+    from balances import iter_balances
+
+    addresses = list(args.addresses) + (read_lines(args.file) if args.file else [])
+    if not addresses:
+        raise CommandError("no wallet addresses given")
+    return list(iter_balances(args.infura_project_id, addresses, args.block))
+
+
+def cmd_send(args):
+    from decimal import Decimal
+
+    from web3 import Web3
+
+    from cache import get_chain_id
+    from clients import get_web3
+    from fees import max_cost, quote_fees
+    from nonces import get_nonce_manager, sign_and_send
+    from receipts import REPLACE_STUCK, get_tracker
+
+    # Same flow as script4 minus the connection probe: the first RPC fails just as clearly
+    web3 = get_web3(args.infura_project_id)
+    sender = check_address(args.sender_address)
+    tx = dict({
+        'to': check_address(args.recipient_address),
+        'value': Web3.to_wei(Decimal(args.amount), 'ether'),
+        'gas': 21000,
+        'chainId': get_chain_id(args.infura_project_id),
+    }, **quote_fees(args.infura_project_id, args.speed))
+
+    balance = web3.eth.get_balance(sender)
+    if balance < max_cost(tx):
+        raise CommandError(f"Insufficient funds: balance {Web3.from_wei(balance, 'ether')} ETH, "
+                           f"required {Web3.from_wei(max_cost(tx), 'ether')} ETH")
+
+    tx_hash, _, nonce = sign_and_send(web3, get_nonce_manager(args.infura_project_id), sender, tx, args.private_key)
+    tracker = get_tracker(args.infura_project_id)
+    # The key is only kept (in this process, or the daemon) for --speed-up
+    speed_up = args.speed_up or REPLACE_STUCK
+    tracked = tracker.track(tx_hash, sender, dict(tx, nonce=nonce), args.private_key if speed_up else None, args.speed)
+    if args.no_wait:
+        return {'transaction_hash': tracked, 'nonce': nonce, 'status': 'pending'}
+    return tracker.wait(tracked, args.timeout)
+
+
+def cmd_latest(args):
+    from script5 import find_latest_transaction
+
+    return find_latest_transaction(args.infura_project_id, check_address(args.address), args.blocks, verbose=False)
+
+
+def cmd_history(args):
+    if args.stats:
+        from analytics import wallet_stats
+
+        return wallet_stats(args.infura_project_id, check_address(args.address), args.blocks)
+
+    from script6 import check_previous_transactions
+
+    return check_previous_transactions(args.infura_project_id, check_address(args.address), args.blocks, verbose=False)
+
+
+def cmd_watch(args):
+    from script7 import monitor_transactions
+
+    addresses = list(args.addresses) + (read_lines(args.file) if args.file else [])
+    if not addresses:
+        raise CommandError("no wallet addresses given")
+    monitor_transactions(args.infura_project_id, [check_address(a) for a in addresses], state_path=args.state)
+
+
+def cmd_verify(args):
+    from signing import recover_senders
+
+    raw_transactions = list(args.raw_transactions) + (read_lines(args.file) if args.file else [])
+    if not raw_transactions:
+        raise CommandError("no raw transactions given")
+    results = recover_senders(raw_transactions)
+    if args.expect:
+        expected = args.expect.lower()
+        for result in results:
+            result['is_valid_signature'] = result.get('sender', '').lower() == expected
+    return results
+
+
+def cmd_new_wallet(args):
+    from wallets import iter_wallets
+
+    return list(iter_wallets(args.count))
+
+
+def cmd_daemon(args):
+    serve(args.socket)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py")
+    parser.add_argument("--socket", default=SOCKET_PATH, help="daemon socket path")
+    parser.add_argument("--no-daemon", action="store_true", help="always run in this process")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    balance = commands.add_parser("balance", help="ETH balance of one or more wallets")
+    balance.add_argument("infura_project_id")
+    balance.add_argument("addresses", nargs="*")
+    balance.add_argument("--file", help="file with one wallet address per line")
+    balance.add_argument("--block", help="block number or tag to pin every balance to")
+    balance.set_defaults(func=cmd_balance)
+
+    send = commands.add_parser("send", help="send ETH with type-2 fees")
+    send.add_argument("infura_project_id")
+    send.add_argument("sender_address")
+    send.add_argument("private_key")
+    send.add_argument("recipient_address")
+    send.add_argument("--amount", default="0.01", help="ETH to send")
+    send.add_argument("--speed", choices=("fast", "normal", "cheap"), default="normal", help="fee level to pay")
+    send.add_argument("--no-wait", action="store_true", help="return once the transaction is broadcast")
+    send.add_argument("--speed-up", action="store_true",
+                      help="re-send with higher fees if unmined for a few blocks (keeps the key in memory meanwhile)")
+    send.add_argument("--timeout", type=float, default=600, help="seconds to wait for the receipt")
+    send.set_defaults(func=cmd_send)
+
+    latest = commands.add_parser("latest", help="latest transaction of a wallet")
+    latest.add_argument("infura_project_id")
+    latest.add_argument("address")
+    latest.add_argument("--blocks", type=int, default=1000, help="blocks back from the head to search")
+    latest.set_defaults(func=cmd_latest)
+
+    history = commands.add_parser("history", help="transactions of a wallet in recent blocks")
+    history.add_argument("infura_project_id")
+    history.add_argument("address")
+    history.add_argument("--blocks", type=int, default=20, help="blocks back from the head to scan")
+    history.add_argument("--stats", action="store_true", help="summary totals instead of the transactions")
+    history.set_defaults(func=cmd_history)
+
+    watch = commands.add_parser("watch", help="follow new blocks and print matching transactions")
+    watch.add_argument("infura_project_id")
+    watch.add_argument("addresses", nargs="*")
+    watch.add_argument("--file", help="file with one wallet address per line")
+    watch.add_argument("--state", default=os.environ.get("MONITOR_STATE_PATH", "monitor_state.sqlite3"),
+                       help="checkpoint file kept across restarts, empty to disable")
+    watch.set_defaults(func=cmd_watch)
+
+    verify = commands.add_parser("verify", help="recover the signers of raw transactions, offline")
+    verify.add_argument("raw_transactions", nargs="*")
+    verify.add_argument("--file", help="file with one raw transaction per line")
+    verify.add_argument("--expect", help="address every transaction should be signed by")
+    verify.set_defaults(func=cmd_verify)
+
+    new_wallet = commands.add_parser("new-wallet", help="generate wallets offline")
+    new_wallet.add_argument("--count", type=int, default=1)
+    new_wallet.set_defaults(func=cmd_new_wallet)
+
+    daemon = commands.add_parser("daemon", help="serve commands over the Unix socket until stopped")
+    daemon.set_defaults(func=cmd_daemon)
+    return parser
+
+
+def run(args):
+    # (exit code, JSON-able result or error message)
+    try:
+        return 0, args.func(args)
+    except CommandError as e:
+        return 1, str(e)
+    except Exception as e:
+        return 1, f"{type(e).__name__}: {e}"
+
+
+def absolute_paths(argv):
+    # The daemon has its own working directory, so file arguments are resolved here
+    resolved = list(argv)
+    for i, arg in enumerate(resolved[:-1]):
+        if arg in ("--file", "--state") and resolved[i + 1]:
+            resolved[i + 1] = os.path.abspath(resolved[i + 1])
+    return resolved
+
+
+def private_directory(path):
+    # Create the socket's directory owner-only; refuse one someone else can write to
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise CommandError(f"{directory} must be owned by you and writable only by you")
+    return directory
+
+
+def trusted_socket(path):
+    # A socket file this user owns, in a directory no one else can swap it out of
+    try:
+        info = os.lstat(path)
+        directory = os.stat(os.path.dirname(os.path.abspath(path)))
+    except OSError:
+        return False
+    return (stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+            and directory.st_uid == os.getuid() and not directory.st_mode & 0o022)
+
+
+def peer_uid(client):
+    # Linux only; elsewhere the file checks in trusted_socket have to do
+    if not hasattr(socket, "SO_PEERCRED"):
+        return os.getuid()
+    credentials = client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", credentials)[1]
+
+
+def call_daemon(path, argv):
+    # One request per connection: a JSON line out, a JSON document back.
+    # Returns None when no daemon is listening, or when the socket or the process
+    # behind it belongs to another user; nothing is sent to those.
+    if not os.path.exists(path):
+        return None
+    if not trusted_socket(path):
+        print(f"Warning: ignoring {path}, not a socket owned by you in a private directory", file=sys.stderr)
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(CONNECT_TIMEOUT)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None
+    if peer_uid(client) != os.getuid():
+        client.close()
+        print(f"Warning: ignoring {path}, the daemon runs as another user", file=sys.stderr)
+        return None
+    with client:
+        client.settimeout(None)
+        client.sendall(json.dumps({"argv": argv}).encode() + b"\n")
+        client.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    reply = json.loads(b"".join(chunks))
+    return reply["code"], reply["result"]
+
+
+def serve(path):
+    import signal
+    import socketserver
+
+    # Load everything the commands use up front so the first request is warm too
+    import analytics  # noqa: F401
+    import balances  # noqa: F401
+    import nonces  # noqa: F401
+    import receipts  # noqa: F401
+    import script5  # noqa: F401
+    import script6  # noqa: F401
+    import signing  # noqa: F401
+    import wallets  # noqa: F401
+
+    private_directory(path)
+    if call_daemon(path, None) is not None:
+        raise CommandError(f"A daemon is already listening on {path}")
+    if os.path.exists(path):
+        os.unlink(path)  # left behind by a daemon that didn't shut down cleanly
+
+    parser = build_parser()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline() or b"{}")
+            if request.get("argv") is None:
+                code, result = 0, "pong"
+            else:
+                try:
+                    code, result = run(parser.parse_args(request["argv"]))
+                except SystemExit:
+                    # argparse rejected arguments the client's own parser accepted
+                    code, result = 2, f"Invalid arguments: {' '.join(request['argv'])}"
+            self.wfile.write(json.dumps({"code": code, "result": result}, default=str).encode())
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    # Owner-only socket: requests can carry private keys
+    umask = os.umask(0o077)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(umask)
+    # Stopped with SIGTERM or Ctrl-C; either way the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {path}", file=sys.stderr)
+    sys.stderr.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    reply = None
+    if args.command not in LOCAL_ONLY and not args.no_daemon:
+        # Forward only the subcommand's own arguments
+        command_argv = argv[argv.index(args.command):]
+        reply = call_daemon(args.socket, absolute_paths(command_argv))
+    code, result = reply if reply is not None else run(args)
+
+    if code:
+        print(f"Error: {result}", file=sys.stderr)
+    elif result is not None:
+        print(json.dumps(result, indent=2, default=str))
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
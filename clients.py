@@ -0,0 +1,477 @@
+# process-wide registry of Web3 clients, keyed by Infura project ID
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import AsyncWeb3, AsyncHTTPProvider, Web3, HTTPProvider
+from web3._utils.encoding import Web3JsonEncoder
+
+import metrics
+from router import NON_IDEMPOTENT, RateLimitedError, Router, parse_endpoints
+from singleflight import SingleFlight
+
+INFURA_URL = os.environ.get("RPC_URL_TEMPLATE", "https://sepolia.infura.io/v3/{}")
+# Comma-separated upstream URL templates, each optionally suffixed with
+# "#rps=N" for its quota; when unset, INFURA_URL is the only upstream
+RPC_ENDPOINTS = parse_endpoints(os.environ.get("RPC_ENDPOINTS", ""))
+INFURA_WS_URL = os.environ.get("WS_URL_TEMPLATE", "wss://sepolia.infura.io/ws/v3/{}")  # empty string disables WebSockets
+
+# Registry limits, overridable from the environment
+POOL_MAXSIZE = int(os.environ.get("WEB3_POOL_MAXSIZE", 20))  # keep-alive connections per client
+MAX_CLIENTS = int(os.environ.get("WEB3_MAX_CLIENTS", 64))  # LRU bound on cached clients
+IDLE_TTL = float(os.environ.get("WEB3_IDLE_TTL", 300))  # seconds before an unused client is dropped
+PROBE_TTL = float(os.environ.get("WEB3_PROBE_TTL", 30))  # seconds a successful is_connected() is trusted
+REQUEST_TIMEOUT = float(os.environ.get("WEB3_REQUEST_TIMEOUT", 10))
+BATCH_SIZE = int(os.environ.get("RPC_BATCH_SIZE", 100))  # calls per JSON-RPC batch, under provider limits
+BATCH_WINDOW = int(os.environ.get("RPC_BATCH_WINDOW", 4))  # batches in flight at once
+
+
+def endpoints(infura_project_id):
+    return [(template.format(infura_project_id), rate) for template, rate in RPC_ENDPOINTS or [(INFURA_URL, None)]]
+
+
+def rpc_url(infura_project_id):
+    return endpoints(infura_project_id)[0][0]
+
+
+def ws_url(infura_project_id):
+    return INFURA_WS_URL.format(infura_project_id) if INFURA_WS_URL else None
+
+
+RPC_DURATION = metrics.Histogram("rpc_request_duration_seconds", "JSON-RPC call time seen by web3 callers", ("method",))
+RPC_ERRORS = metrics.Counter("rpc_errors_total", "Failed JSON-RPC calls by method and kind", ("method", "kind"))
+RPC_IN_FLIGHT = metrics.Gauge("rpc_requests_in_flight", "web3 JSON-RPC calls currently waiting on a response")
+RPC_BATCH_DURATION = metrics.Histogram("rpc_batch_duration_seconds", "Upstream round trip per JSON-RPC batch")
+RPC_BATCH_CALLS = metrics.Counter("rpc_batch_calls_total", "Calls sent upstream inside JSON-RPC batches", ("method",))
+
+
+def error_kind(error):
+    if isinstance(error, RateLimitedError):
+        return "rate_limited"
+    if isinstance(error, requests.Timeout):
+        return "timeout"
+    if isinstance(error, requests.RequestException):
+        return "http"
+    return "other"
+
+
+def metrics_middleware(make_request, w3):
+    # Per-method latency and failures for every call made through web3,
+    # single-flight waits included since that is what the caller sees
+    def middleware(method, params):
+        RPC_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception as e:
+            RPC_ERRORS.inc(method, error_kind(e))
+            raise
+        finally:
+            RPC_IN_FLIGHT.dec()
+            RPC_DURATION.observe(time.perf_counter() - started, method)
+        if "error" in response:
+            RPC_ERRORS.inc(method, "rpc")
+        return response
+    return middleware
+
+
+# ---------------------------------------------------------------------------
+# Synchronous clients (Flask / gunicorn threads)
+
+def flight_key(method, params):
+    return method, json.dumps(params, cls=Web3JsonEncoder, sort_keys=True)
+
+
+class PooledHTTPProvider(HTTPProvider):
+    # HTTPProvider that posts through the client's router, on one shared
+    # keep-alive session instead of web3's per-thread session cache, so every
+    # worker thread reuses the same bounded connection pools. Identical reads
+    # already in flight are joined instead of sent again.
+    def __init__(self, endpoint_uri, router, flights):
+        super().__init__(endpoint_uri)
+        self.router = router
+        self.flights = flights
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        if method in NON_IDEMPOTENT:
+            return self.decode_rpc_response(self.router.post(request_data, [method]))
+        # Callers share the raw body (see _response_body) and decode their own copy of it
+        body = self.flights.do(method, flight_key(method, params), lambda: self.router.post(request_data, [method]))
+        return self.decode_rpc_response(body)
+
+
+def new_session(hosts=1):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=POOL_MAXSIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class Client:
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.url = rpc_url(infura_project_id)
+        upstreams = endpoints(infura_project_id)
+        self.session = new_session(len(upstreams))
+        self.router = Router(upstreams, self.session, REQUEST_TIMEOUT)
+        self.flights = SingleFlight()
+        self.web3 = Web3(PooledHTTPProvider(self.url, self.router, self.flights))
+        self.web3.middleware_onion.add(metrics_middleware, "metrics")
+        self.last_used = time.monotonic()
+        self.last_probe = None
+
+    def close(self):
+        self.session.close()
+
+
+_clients = OrderedDict()
+_async_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+def _evict_idle(registry, now):
+    # Oldest entries sit at the front, so stop at the first one still fresh
+    while registry:
+        project_id, client = next(iter(registry.items()))
+        if now - client.last_used < IDLE_TTL:
+            break
+        del registry[project_id]
+        client.close()
+
+
+def _lookup(registry, factory, infura_project_id):
+    now = time.monotonic()
+    with _clients_lock:
+        _evict_idle(registry, now)
+        client = registry.get(infura_project_id)
+        if client is None:
+            client = factory(infura_project_id)
+            registry[infura_project_id] = client
+            if len(registry) > MAX_CLIENTS:
+                _, evicted = registry.popitem(last=False)
+                evicted.close()
+        else:
+            registry.move_to_end(infura_project_id)
+        client.last_used = now
+    return client
+
+
+def get_client(infura_project_id):
+    return _lookup(_clients, Client, infura_project_id)
+
+
+def get_web3(infura_project_id):
+    return get_client(infura_project_id).web3
+
+
+class ProjectRegistry:
+    # Per-project singletons (head pollers, trackers, nonce managers, ...)
+    # bounded like the client registries, since project IDs come from
+    # callers: unused for IDLE_TTL, or least recently used beyond
+    # MAX_CLIENTS, an entry is dropped and its close() called. Entries whose
+    # busy() is true hold state someone is waiting on and are kept.
+    def __init__(self, factory):
+        self.factory = factory
+        self.entries = OrderedDict()  # project ID -> (entry, last used)
+        self.lock = threading.Lock()
+
+    def get(self, infura_project_id):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.pop(infura_project_id, (None, None))[0]
+            if entry is None:
+                entry = self.factory(infura_project_id)
+            evicted = self._evict(now)
+            self.entries[infura_project_id] = (entry, now)
+        for old in evicted:
+            if hasattr(old, "close"):
+                old.close()
+        return entry
+
+    def _evict(self, now):
+        # Caller holds self.lock; oldest first, room is made for one more entry
+        evicted = []
+        excess = len(self.entries) + 1 - MAX_CLIENTS
+        for project_id, (entry, last_used) in list(self.entries.items()):
+            if excess <= 0 and now - last_used < IDLE_TTL:
+                break
+            if hasattr(entry, "busy") and entry.busy():
+                continue
+            del self.entries[project_id]
+            evicted.append(entry)
+            excess -= 1
+        return evicted
+
+
+class RPCError(ValueError):
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+        self.code = error.get("code")
+        self.message = error.get("message")
+
+
+def rpc_batch(infura_project_id, calls):
+    # Send (method, params) pairs as one JSON-RPC batch over the pooled session.
+    # Results come back in call order; failed calls are returned as RPCError
+    # instances rather than raised so one bad entry doesn't sink the batch.
+    # Reads already in flight, in another batch or a web3 call, are waited on, not resent.
+    if not calls:
+        return []
+    client = get_client(infura_project_id)
+    sent = []
+    slots = []  # per call: index into sent, or the key of a flight led elsewhere
+    owned = {}  # key -> index into sent, for flights this batch leads
+    joined = {}  # key -> flight led by another caller
+    for method, params in calls:
+        if method in NON_IDEMPOTENT:
+            slots.append(len(sent))
+            sent.append((method, params))
+            continue
+        key = flight_key(method, params)
+        if key not in owned and key not in joined:
+            leader, flight = client.flights.begin(method, key)
+            if leader:
+                owned[key] = len(sent)
+                sent.append((method, params))
+            else:
+                joined[key] = flight
+        slots.append(owned.get(key, key))
+
+    try:
+        results = _post_batch(client, sent)
+    except Exception as e:
+        for key in owned:
+            client.flights.finish(key, error=e)
+        raise
+    for key, index in owned.items():
+        client.flights.finish(key, _response_body(results[index]))
+    return [results[slot] if isinstance(slot, int) else _response_result(joined[slot].wait()) for slot in slots]
+
+
+# Flights hold a raw JSON-RPC response body whichever path leads them, so a
+# batch entry can join a web3 call for the same read and the other way round
+
+def _response_body(result):
+    item = {"error": result.error} if isinstance(result, RPCError) else {"result": result}
+    return json.dumps(dict(item, jsonrpc="2.0", id=0)).encode()
+
+
+def _response_result(body):
+    item = json.loads(body)
+    return RPCError(item["error"]) if "error" in item else item.get("result")
+
+
+def _post_batch(client, calls):
+    if not calls:
+        return []
+    payload = [
+        {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        for request_id, (method, params) in enumerate(calls)
+    ]
+    methods = [method for method, _ in calls]
+    for method in set(methods):
+        RPC_BATCH_CALLS.inc(method, amount=methods.count(method))
+    started = time.perf_counter()
+    try:
+        body = json.loads(client.router.post(json.dumps(payload).encode(), methods))
+    except Exception as e:
+        RPC_ERRORS.inc("batch", error_kind(e))
+        raise
+    finally:
+        RPC_BATCH_DURATION.observe(time.perf_counter() - started)
+    if isinstance(body, dict):
+        # Some providers answer a rejected batch with a single error object
+        RPC_ERRORS.inc("batch", "rpc")
+        raise RPCError(body.get("error") or {"message": "Invalid batch response"})
+    by_id = {item.get("id"): item for item in body}
+    results = []
+    for request_id, method in enumerate(methods):
+        item = by_id.get(request_id)
+        if item is None:
+            results.append(RPCError({"message": "Missing response in batch"}))
+        elif "error" in item:
+            RPC_ERRORS.inc(method, "rpc")
+            results.append(RPCError(item["error"]))
+        else:
+            results.append(item.get("result"))
+    return results
+
+
+def coalescing_stats():
+    # Calls seen and calls collapsed onto an identical in-flight request, per method
+    calls, collapsed = {}, {}
+    with _clients_lock:
+        clients = list(_clients.values())
+    for client in clients:
+        stats = client.flights.stats()
+        for method, count in stats["calls"].items():
+            calls[method] = calls.get(method, 0) + count
+        for method, count in stats["collapsed"].items():
+            collapsed[method] = collapsed.get(method, 0) + count
+    return {"calls": calls, "collapsed": collapsed}
+
+
+def _collect_rpc_stats():
+    # Single-flight and router counters summed over the live clients; they
+    # restart from zero when an idle client is evicted
+    coalescing = coalescing_stats()
+    yield ("rpc_singleflight_calls_total", "counter", "Reads offered to single-flight, by method",
+           [({"method": m}, n) for m, n in coalescing["calls"].items()])
+    yield ("rpc_singleflight_collapsed_total", "counter", "Reads answered by an identical in-flight request",
+           [({"method": m}, n) for m, n in coalescing["collapsed"].items()])
+
+    with _clients_lock:
+        clients = list(_clients.values())
+    hosts = {}
+    hedges = hedge_wins = 0
+    for client in clients:
+        stats = client.router.stats()
+        hedges += stats["hedges"]
+        hedge_wins += stats["hedge_wins"]
+        for endpoint in stats["endpoints"]:
+            host = hosts.setdefault(endpoint["host"], {"requests": 0, "errors": 0, "rate_limited": 0,
+                                                       "latency": 0.0, "cooling_down": 0})
+            for field in ("requests", "errors", "rate_limited"):
+                host[field] += endpoint[field]
+            host["latency"] = max(host["latency"], endpoint["latency"] or 0.0)
+            host["cooling_down"] = max(host["cooling_down"], int(endpoint["cooling_down"]))
+    for field, name, kind, help_text in (
+        ("requests", "rpc_upstream_requests_total", "counter", "Upstream HTTP requests by endpoint host"),
+        ("errors", "rpc_upstream_errors_total", "counter", "Failed upstream HTTP requests by endpoint host"),
+        ("rate_limited", "rpc_upstream_rate_limited_total", "counter",
+         "Upstream 429 and quota-exceeded answers by endpoint host"),
+        ("latency", "rpc_upstream_latency_seconds", "gauge", "Moving average upstream round trip by endpoint host"),
+        ("cooling_down", "rpc_upstream_cooling_down", "gauge", "1 while the router keeps traffic off an endpoint"),
+    ):
+        yield name, kind, help_text, [({"host": h}, v[field]) for h, v in hosts.items()]
+    yield "rpc_hedges_total", "counter", "Hedged duplicate requests sent", [({}, hedges)]
+    yield "rpc_hedge_wins_total", "counter", "Hedged requests that answered first", [({}, hedge_wins)]
+
+
+metrics.register_collector(_collect_rpc_stats)
+
+
+def chunked(items, size):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+_window_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="rpc-window")
+
+
+def ordered_map(fn, items, window=BATCH_WINDOW):
+    # Like map(), but keeps up to `window` calls running on a shared thread pool
+    # and yields results in input order as soon as each one is ready
+    items = iter(items)
+    in_flight = deque()
+    try:
+        for item in items:
+            in_flight.append(_window_pool.submit(fn, item))
+            if len(in_flight) >= window:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        # The consumer stopped early; don't start work nobody will read
+        for future in in_flight:
+            future.cancel()
+
+
+def rpc_batches(infura_project_id, calls, window=BATCH_WINDOW):
+    # rpc_batch for any number of calls: BATCH_SIZE calls per batch, `window`
+    # batches in flight, results still in call order
+    results = []
+    for part in ordered_map(lambda chunk: rpc_batch(infura_project_id, chunk), chunked(calls, BATCH_SIZE), window):
+        results.extend(part)
+    return results
+
+
+def is_connected(infura_project_id):
+    # Only probe the node when the last successful probe has gone stale
+    client = get_client(infura_project_id)
+    now = time.monotonic()
+    if client.last_probe is not None and now - client.last_probe < PROBE_TTL:
+        return True
+    if not client.web3.is_connected():
+        # web3 swallows the probe's error; a quota problem is not a dead node
+        if client.router.throttled():
+            raise RateLimitedError("All RPC endpoints are over their rate limit")
+        return False
+    client.last_probe = now
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Asynchronous clients (ASGI / uvicorn event loop)
+
+class PooledAsyncHTTPProvider(AsyncHTTPProvider):
+    # AsyncHTTPProvider counterpart of PooledHTTPProvider on an aiohttp session.
+    # Posts go through the project's synchronous client's router, so failover,
+    # retries, hedging, quotas and endpoint health are shared by both paths.
+    def __init__(self, endpoint_uri, infura_project_id, session):
+        super().__init__(endpoint_uri)
+        self.infura_project_id = infura_project_id
+        self.session = session
+
+    async def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        router = get_client(self.infura_project_id).router
+        return self.decode_rpc_response(await router.post_async(self.session, request_data, [method]))
+
+
+class AsyncClient:
+    # Must be created from inside the running event loop
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.url = rpc_url(infura_project_id)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_MAXSIZE),
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+        )
+        self.web3 = AsyncWeb3(PooledAsyncHTTPProvider(self.url, infura_project_id, self.session))
+        self.last_used = time.monotonic()
+        self.last_probe = None
+
+    def close(self):
+        asyncio.ensure_future(self.session.close())
+
+
+def get_async_client(infura_project_id):
+    return _lookup(_async_clients, AsyncClient, infura_project_id)
+
+
+def get_async_web3(infura_project_id):
+    return get_async_client(infura_project_id).web3
+
+
+async def async_is_connected(infura_project_id):
+    client = get_async_client(infura_project_id)
+    now = time.monotonic()
+    if client.last_probe is not None and now - client.last_probe < PROBE_TTL:
+        return True
+    if not await client.web3.is_connected():
+        # web3 swallows the probe's error; a quota problem is not a dead node
+        if get_client(infura_project_id).router.throttled():
+            raise RateLimitedError("All RPC endpoints are over their rate limit")
+        return False
+    client.last_probe = now
+    return True
+
+
+def clear():
+    with _clients_lock:
+        for registry in (_clients, _async_clients):
+            while registry:
+                _, client = registry.popitem()
+                client.close()
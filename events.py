@@ -0,0 +1,185 @@
+# one shared block follower per project, fanned out to many stream subscribers
+
+import asyncio
+import os
+import queue
+import threading
+
+from clients import ProjectRegistry
+from follower import BlockFollower
+from scanner import address_key, fetch_receipts, transaction_details
+
+QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 256))  # undelivered events per subscriber before it is dropped
+IDLE_SHUTDOWN = 30  # seconds the follower keeps running with no subscribers
+
+OVERFLOW = {"type": "overflow"}  # last event a subscriber sees when it fell too far behind
+
+
+class Subscription:
+    def __init__(self, addresses=None, loop=None):
+        # None means head events only; addresses are matched as 20-byte keys.
+        # With an event loop, readers use get_async and hold no thread while waiting
+        self.keys = frozenset(address_key(address) for address in addresses) if addresses else frozenset()
+        self.queue = queue.Queue(QUEUE_SIZE + 1)
+        self.closed = False
+        self.loop = loop
+        self.wakeup = asyncio.Event() if loop is not None else None
+
+    def _notify(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def put(self, event):
+        # Never blocks the follower: a subscriber whose queue is full gets one
+        # overflow marker and is cut loose, so a slow tab can't stall the rest
+        if self.closed:
+            return False
+        try:
+            if self.queue.qsize() >= QUEUE_SIZE:
+                raise queue.Full
+            self.queue.put_nowait(event)
+            self._notify()
+            return True
+        except queue.Full:
+            self.closed = True
+            self.queue.put_nowait(OVERFLOW)
+            self._notify()
+            return False
+
+    def get(self, timeout):
+        # Next event, or None if nothing arrived within timeout
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def get_async(self, timeout):
+        # get() for the subscription's event loop; cleared before checking the
+        # queue so a put from the follower thread in between still wakes us
+        self.wakeup.clear()
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+
+class EventHub:
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.lock = threading.Lock()
+        self.subscriptions = []
+        self.by_key = {}  # 20-byte address -> subscriptions watching it, rebuilt on (un)subscribe
+        self.follower = None
+        self.idle_timer = None
+
+    def _reindex(self):
+        # Caller holds self.lock
+        by_key = {}
+        for subscription in self.subscriptions:
+            for key in subscription.keys:
+                by_key.setdefault(key, []).append(subscription)
+        self.by_key = by_key
+
+    def subscribe(self, addresses=None, loop=None):
+        subscription = Subscription(addresses, loop)
+        with self.lock:
+            self.subscriptions.append(subscription)
+            self._reindex()
+            if self.idle_timer is not None:
+                self.idle_timer.cancel()
+                self.idle_timer = None
+            if self.follower is None:
+                self.follower = BlockFollower(self.infura_project_id)
+                threading.Thread(target=self._run, args=(self.follower,), daemon=True).start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.closed = True
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+                self._reindex()
+            if not self.subscriptions and self.follower is not None and self.idle_timer is None:
+                self.idle_timer = threading.Timer(IDLE_SHUTDOWN, self._stop_if_idle)
+                self.idle_timer.daemon = True
+                self.idle_timer.start()
+
+    def busy(self):
+        with self.lock:
+            return bool(self.subscriptions)
+
+    def close(self):
+        # Dropped from the registry with no subscribers: stop following now
+        with self.lock:
+            if self.idle_timer is not None:
+                self.idle_timer.cancel()
+                self.idle_timer = None
+            if not self.subscriptions and self.follower is not None:
+                self.follower.stop()
+                self.follower = None
+
+    def _stop_if_idle(self):
+        with self.lock:
+            self.idle_timer = None
+            if not self.subscriptions and self.follower is not None:
+                self.follower.stop()
+                self.follower = None
+
+    def _publish(self, event, block):
+        with self.lock:
+            subscriptions, by_key = list(self.subscriptions), self.by_key
+        block_number = int(block["number"], 16)
+        overflowed = []
+        head = {"type": "head" if event == "block" else "retract", "number": block_number, "hash": block["hash"]}
+        for subscription in subscriptions:
+            if not subscription.put(head):
+                overflowed.append(subscription)
+
+        # Match the block once against every subscriber's addresses together
+        matched = []
+        for tx in block["transactions"]:
+            targets = set(by_key.get(address_key(tx["from"]), ()))
+            if tx["to"] is not None:
+                targets.update(by_key.get(address_key(tx["to"]), ()))
+            if targets:
+                matched.append((tx, targets))
+        if not matched:
+            return overflowed
+
+        if event == "block":
+            receipts = fetch_receipts(self.infura_project_id, [tx for tx, _ in matched])
+            kind = "transaction"
+        else:
+            receipts = {}
+            kind = "retracted_transaction"
+        for tx, targets in matched:
+            details = transaction_details(tx, receipts.get(tx["hash"]))
+            details["type"] = kind
+            details["value"] = str(details["value"])
+            for subscription in targets:
+                if not subscription.put(details):
+                    overflowed.append(subscription)
+        return overflowed
+
+    def _run(self, follower):
+        for event, block in follower.events():
+            try:
+                for subscription in self._publish(event, block):
+                    self.unsubscribe(subscription)
+            except Exception as e:
+                print(f"Event hub error: {e}")
+
+
+_hubs = ProjectRegistry(EventHub)
+
+
+def get_event_hub(infura_project_id):
+    return _hubs.get(infura_project_id)
@@ -0,0 +1,240 @@
+# stream matched transactions for an address set and block range to NDJSON,
+# Arrow IPC or Parquet, written in bounded batches while the blocks are scanned
+# usage: python export.py <infura_project_id> <address>[,<address>...] --from BLOCK [--to BLOCK]
+#                         [--format ndjson|arrow|parquet] [--output PATH]
+# Arrow and Parquet need pyarrow, which is optional
+
+import argparse
+import json
+import os
+import sys
+import time
+from decimal import Decimal
+
+from web3 import Web3
+
+from clients import chunked, get_web3, ordered_map
+from scanner import BLOCK_BATCH, SCAN_WINDOW, address_matcher, scan_chunk
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 10000))  # rows buffered before a batch is written
+# Seconds a partial Arrow/Parquet batch waits before it is written anyway, so a
+# sparse range keeps streaming; NDJSON rows are written as soon as they are found
+EXPORT_FLUSH_SECONDS = float(os.environ.get("EXPORT_FLUSH_SECONDS", 5))
+FORMATS = ("ndjson", "arrow", "parquet")
+MIMETYPES = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.file",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (column, arrow type); wei values get 38 decimal digits, far above total supply
+FIELDS = (
+    ("block_number", "int64"),
+    ("transaction_index", "int32"),
+    ("hash", "string"),
+    ("from", "string"),
+    ("to", "string"),
+    ("value_wei", "decimal"),
+    ("gas_used", "int64"),
+    ("effective_gas_price", "int64"),
+    ("status", "int8"),
+)
+
+
+def export_details(tx, receipt):
+    # Exact integers only; no Decimal ether conversion per row
+    return {
+        "block_number": int(tx["blockNumber"], 16),
+        "transaction_index": int(tx["transactionIndex"], 16),
+        "hash": tx["hash"],
+        "from": Web3.to_checksum_address(tx["from"]),
+        "to": Web3.to_checksum_address(tx["to"]) if tx["to"] else None,
+        "value_wei": int(tx["value"], 16),
+        "gas_used": int(receipt["gasUsed"], 16) if receipt else None,
+        "effective_gas_price": int(receipt.get("effectiveGasPrice") or tx["gasPrice"], 16) if receipt else None,
+        "status": int(receipt["status"], 16) if receipt else None,
+    }
+
+
+class NdjsonWriter:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def write_batch(self, rows):
+        # Wei as a string so JSON readers don't round it
+        self.sink.write("".join(json.dumps(dict(row, value_wei=str(row["value_wei"]))) + "\n" for row in rows).encode())
+
+    def close(self):
+        pass
+
+
+class ArrowWriter:
+    # Arrow IPC file (memory-mappable) or Parquet, one record batch / row group per write
+    def __init__(self, sink, output_format):
+        types = {
+            "int64": pyarrow.int64(), "int32": pyarrow.int32(), "int8": pyarrow.int8(),
+            "string": pyarrow.string(), "decimal": pyarrow.decimal128(38, 0),
+        }
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in FIELDS])
+        if output_format == "arrow":
+            self.writer = pyarrow.ipc.new_file(sink, self.schema)
+        else:
+            self.writer = pyarrow.parquet.ParquetWriter(sink, self.schema, compression="zstd")
+
+    def write_batch(self, rows):
+        columns = {name: [row[name] for row in rows] for name, _ in FIELDS}
+        columns["value_wei"] = [Decimal(value) for value in columns["value_wei"]]
+        batch = pyarrow.RecordBatch.from_pydict(columns, schema=self.schema)
+        if isinstance(self.writer, pyarrow.parquet.ParquetWriter):
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+
+class BufferSink:
+    # File-like target that hands written bytes back out, for streaming responses
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def check_format(output_format):
+    if output_format not in FORMATS:
+        raise ValueError(f"'format' must be one of {', '.join(FORMATS)}")
+    if output_format != "ndjson" and pyarrow is None:
+        raise ValueError(f"format '{output_format}' requires pyarrow")
+
+
+def open_writer(sink, output_format):
+    check_format(output_format)
+    return NdjsonWriter(sink) if output_format == "ndjson" else ArrowWriter(sink, output_format)
+
+
+def iter_batches(infura_project_id, addresses, start_block, end_block, batch_rows=EXPORT_BATCH_ROWS,
+                 flush_seconds=EXPORT_FLUSH_SECONDS):
+    # Lists of at most batch_rows rows in block order. A partial batch is also
+    # handed out when a scan window finishes flush_seconds after the last one;
+    # only the batch being filled and the scanner's window of blocks are held
+    match = address_matcher(addresses)
+
+    def work(chunk):
+        return scan_chunk(infura_project_id, chunk, match, details=export_details)
+
+    batch = []
+    flushed = time.monotonic()
+    for rows in ordered_map(work, chunked(range(start_block, end_block + 1), BLOCK_BATCH), SCAN_WINDOW):
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                yield batch
+                batch, flushed = [], time.monotonic()
+        if batch and time.monotonic() - flushed >= flush_seconds:
+            yield batch
+            batch, flushed = [], time.monotonic()
+    if batch:
+        yield batch
+
+
+def flush_seconds_for(output_format):
+    # NDJSON has no batch structure to fill, so rows go out as they are found
+    return 0 if output_format == "ndjson" else EXPORT_FLUSH_SECONDS
+
+
+def iter_export(infura_project_id, addresses, start_block, end_block, output_format="ndjson",
+                batch_rows=EXPORT_BATCH_ROWS):
+    # Encoded bytes: any header the format writes up front, one chunk per
+    # written batch and a final one for any footer
+    sink = BufferSink()
+    writer = open_writer(sink, output_format)
+    yield sink.drain()
+    for batch in iter_batches(infura_project_id, addresses, start_block, end_block, batch_rows,
+                              flush_seconds_for(output_format)):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def export(infura_project_id, addresses, start_block, end_block, output, output_format="ndjson",
+           batch_rows=EXPORT_BATCH_ROWS):
+    # Write to a binary file object; returns the rows written
+    rows = 0
+    writer = open_writer(output, output_format)
+    try:
+        for batch in iter_batches(infura_project_id, addresses, start_block, end_block, batch_rows,
+                                  flush_seconds_for(output_format)):
+            writer.write_batch(batch)
+            rows += len(batch)
+            if output_format == "ndjson":
+                output.flush()
+    finally:
+        writer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("infura_project_id")
+    parser.add_argument("addresses", help="comma separated")
+    parser.add_argument("--from", dest="start_block", type=int, required=True)
+    parser.add_argument("--to", dest="end_block", type=int, help="defaults to the latest block")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--output", help="file to write; stdout when omitted")
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS)
+    args = parser.parse_args()
+
+    addresses = [a.strip() for a in args.addresses.split(",") if a.strip()]
+    invalid = [a for a in addresses if not Web3.is_address(a)]
+    if invalid or not addresses:
+        print(f"Error: invalid addresses: {', '.join(invalid) or '(none given)'}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        check_format(args.format)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    end_block = args.end_block if args.end_block is not None else get_web3(args.infura_project_id).eth.block_number
+    started = time.perf_counter()
+    if args.output:
+        with open(args.output, "wb") as output:
+            rows = export(args.infura_project_id, addresses, args.start_block, end_block, output,
+                          args.format, args.batch_rows)
+    else:
+        rows = export(args.infura_project_id, addresses, args.start_block, end_block, sys.stdout.buffer,
+                      args.format, args.batch_rows)
+    print(f"Exported {rows} transactions from blocks {args.start_block}-{end_block} "
+          f"in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
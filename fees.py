@@ -0,0 +1,138 @@
+# EIP-1559 fee quotes from a rolling eth_feeHistory window, refreshed once per block
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+
+from web3 import Web3
+
+from clients import ProjectRegistry, get_web3
+from heads import get_head_poller
+
+HISTORY_BLOCKS = int(os.environ.get("FEE_HISTORY_BLOCKS", 20))  # blocks in the rolling window
+MIN_PRIORITY_FEE = int(os.environ.get("MIN_PRIORITY_FEE", 10**8))  # wei; floor for quiet chains with zero tips
+IDLE_SHUTDOWN = 300  # seconds without a quote before the oracle stops following heads
+ESTIMATE_MARGIN = 1.2  # headroom on eth_estimateGas for contract calls
+TRANSFER_GAS = 21000
+
+# speed -> (reward percentile for the tip, blocks of full base fee growth the max fee survives)
+SPEEDS = {
+    "fast": (90, 6),
+    "normal": (50, 3),
+    "cheap": (10, 1),
+}
+PERCENTILES = sorted({percentile for percentile, _ in SPEEDS.values()})
+BASE_FEE_GROWTH = 1.125  # largest base fee increase from one block to the next
+
+
+class FeeOracle:
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.lock = threading.Lock()
+        self.rewards = deque(maxlen=HISTORY_BLOCKS)  # per block: tips at PERCENTILES
+        self.next_base_fee = None
+        self.newest_block = None
+        self.last_quote = time.monotonic()
+        self.following = False
+
+    def _fetch(self, newest, count):
+        history = get_web3(self.infura_project_id).eth.fee_history(count, newest, PERCENTILES)
+        return history['baseFeePerGas'][-1], history.get('reward') or []
+
+    def _refresh(self, head):
+        # Only the blocks since the last update are fetched; the window slides
+        with self.lock:
+            newest = self.newest_block
+        if newest is not None and head <= newest:
+            return
+        count = HISTORY_BLOCKS if newest is None else min(head - newest, HISTORY_BLOCKS)
+        next_base_fee, rewards = self._fetch(head, count)
+        with self.lock:
+            if self.newest_block is not None and head <= self.newest_block:
+                return
+            self.rewards.extend(rewards)
+            self.next_base_fee = next_base_fee
+            self.newest_block = head
+
+    def _on_head(self, block_number):
+        with self.lock:
+            idle = time.monotonic() - self.last_quote > IDLE_SHUTDOWN
+            if idle:
+                # Nobody is quoting; drop the window so the next quote starts fresh
+                self.following = False
+                self.rewards.clear()
+                self.newest_block = self.next_base_fee = None
+        if idle:
+            get_head_poller(self.infura_project_id).unsubscribe(self._on_head)
+            return
+        self._refresh(block_number)
+
+    def _ensure_following(self):
+        with self.lock:
+            self.last_quote = time.monotonic()
+            if self.following and self.newest_block is not None:
+                return
+            self.following = True
+        poller = get_head_poller(self.infura_project_id)
+        poller.subscribe(self._on_head)
+        # First quote: load the window now instead of waiting for the next head
+        self._refresh(poller.get_head())
+
+    def close(self):
+        # Dropped from the registry: stop following heads
+        with self.lock:
+            self.following = False
+            self.rewards.clear()
+            self.newest_block = self.next_base_fee = None
+        get_head_poller(self.infura_project_id).unsubscribe(self._on_head)
+
+    def quote(self, speed="normal"):
+        # Type-2 fee fields for a latency target, served from the in-memory window
+        percentile, growth_blocks = SPEEDS[speed]
+        self._ensure_following()
+        with self.lock:
+            column = PERCENTILES.index(percentile)
+            tips = [reward[column] for reward in self.rewards if reward]
+            next_base_fee = self.next_base_fee
+        tip = max(int(statistics.median(tips)) if tips else 0, MIN_PRIORITY_FEE)
+        max_fee = int(next_base_fee * BASE_FEE_GROWTH ** growth_blocks) + tip
+        return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': tip}
+
+    def stats(self):
+        with self.lock:
+            return {
+                'newest_block': self.newest_block,
+                'next_base_fee': self.next_base_fee,
+                'window': len(self.rewards),
+            }
+
+
+def estimate_gas(infura_project_id, tx, sender=None):
+    # Plain ETH transfers always cost 21000; anything carrying calldata is estimated
+    if not tx.get('data') and not tx.get('input') and tx.get('to'):
+        return TRANSFER_GAS
+    call = {k: v for k, v in tx.items() if k not in ('gas', 'nonce', 'maxFeePerGas', 'maxPriorityFeePerGas', 'gasPrice')}
+    if sender:
+        call['from'] = sender
+    for field in ('to', 'from'):
+        if call.get(field):
+            call[field] = Web3.to_checksum_address(call[field])
+    return int(get_web3(infura_project_id).eth.estimate_gas(call) * ESTIMATE_MARGIN)
+
+
+def max_cost(tx):
+    # Worst case the sender can be charged: value plus gas at the fee cap
+    return tx['value'] + tx['gas'] * tx.get('maxFeePerGas', tx.get('gasPrice', 0))
+
+
+_oracles = ProjectRegistry(FeeOracle)
+
+
+def get_fee_oracle(infura_project_id):
+    return _oracles.get(infura_project_id)
+
+
+def quote_fees(infura_project_id, speed="normal"):
+    return get_fee_oracle(infura_project_id).quote(speed)
@@ -0,0 +1,137 @@
+# reorg-aware chain follower: newHeads over WebSocket, polling as the fallback
+
+import asyncio
+import json
+import os
+import random
+import time
+
+import websockets
+
+from cache import FINALITY_DEPTH
+from clients import get_web3, ws_url
+from scanner import BLOCK_BATCH, fetch_blocks
+
+POLL_INTERVAL = float(os.environ.get("FOLLOW_POLL_INTERVAL", 4))  # seconds between polls when not subscribed
+WS_IDLE_TIMEOUT = float(os.environ.get("WS_IDLE_TIMEOUT", 60))  # seconds without a head before reconnecting
+MAX_BACKOFF = 30  # seconds between reconnect attempts, at most
+REORG_DEPTH = FINALITY_DEPTH  # recent blocks kept to detect orphans
+
+
+class BlockFollower:
+    # events() yields ("block", block) for each new canonical block, in order,
+    # and ("retract", block) for each block orphaned by a reorg, newest first.
+    # Blocks are full (transactions included) and compacted like the scanner's.
+    def __init__(self, infura_project_id, start_block=None, mode="auto", parent_hash=None):
+        self.infura_project_id = infura_project_id
+        self.mode = mode  # "auto" subscribes when a WebSocket URL is configured, "poll" never does
+        self.blocks = {}  # number -> block for the last REORG_DEPTH canonical blocks
+        self.tip = start_block - 1 if start_block is not None else None
+        if start_block is not None and parent_hash is not None:
+            # Hash of the block before start_block, from an earlier run, so a
+            # reorg that happened in between is detected and retracted too
+            self.blocks[self.tip] = {"number": hex(self.tip), "hash": parent_hash, "transactions": []}
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+    def _latest_head(self):
+        block = get_web3(self.infura_project_id).eth.get_block("latest")
+        return block["number"], block["hash"].hex()
+
+    def _retract(self):
+        block = self.blocks.pop(self.tip, None)
+        self.tip -= 1
+        return ("retract", block) if block is not None else None
+
+    def _catch_up(self, head):
+        # Fetch tip+1..head in batches, checking each block's parent against
+        # the one we emitted; on a mismatch, retract our tip and refetch
+        while self.tip < head and not self.stopped:
+            numbers = list(range(self.tip + 1, min(head, self.tip + BLOCK_BATCH) + 1))
+            for block in fetch_blocks(self.infura_project_id, numbers):
+                if block is None:
+                    return  # the node has not caught up; the next head retries
+                parent = self.blocks.get(self.tip)
+                if parent is not None and block["parentHash"] != parent["hash"]:
+                    yield self._retract()
+                    break
+                self.tip += 1
+                self.blocks[self.tip] = block
+                yield ("block", block)
+            for number in [n for n in self.blocks if n <= self.tip - REORG_DEPTH]:
+                del self.blocks[number]
+
+    def _advance(self, number, block_hash):
+        if self.tip is None:
+            # No start block: follow from the current head onwards, remembering
+            # its hash so a reorg of the head itself is still noticed
+            self.tip = number
+            self.blocks[number] = {"number": hex(number), "hash": block_hash, "transactions": []}
+            return
+        if number <= self.tip:
+            known = self.blocks.get(number)
+            if known is None or known["hash"] == block_hash:
+                return  # duplicate or stale notification
+            # Same-height or shorter reorg: drop everything from that height up
+            while self.tip >= number:
+                event = self._retract()
+                if event:
+                    yield event
+        yield from self._catch_up(number)
+
+    def _ws_heads(self, url):
+        # One subscription; yields (number, hash) until the socket fails. The
+        # current head comes first so blocks missed while disconnected are backfilled.
+        loop = asyncio.new_event_loop()
+        ws = None
+
+        async def subscribe():
+            ws = await websockets.connect(url, ping_interval=None, max_size=None)
+            await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+            return ws
+
+        try:
+            ws = loop.run_until_complete(subscribe())
+            reply = json.loads(loop.run_until_complete(asyncio.wait_for(ws.recv(), WS_IDLE_TIMEOUT)))
+            if "error" in reply:
+                raise ValueError(reply["error"].get("message", reply["error"]))
+            yield self._latest_head()
+            while not self.stopped:
+                message = json.loads(loop.run_until_complete(asyncio.wait_for(ws.recv(), WS_IDLE_TIMEOUT)))
+                if message.get("method") == "eth_subscription":
+                    head = message["params"]["result"]
+                    yield int(head["number"], 16), head["hash"]
+        finally:
+            if ws is not None:
+                loop.run_until_complete(ws.close())
+            loop.close()
+
+    def _poll(self, duration):
+        deadline = time.monotonic() + duration
+        while not self.stopped:
+            try:
+                yield from self._advance(*self._latest_head())
+            except Exception as e:
+                print(f"Block follower poll error: {e}")
+            if time.monotonic() >= deadline:
+                return
+            time.sleep(POLL_INTERVAL)
+
+    def events(self):
+        url = ws_url(self.infura_project_id) if self.mode == "auto" else None
+        backoff = 1
+        while not self.stopped:
+            if url is None:
+                yield from self._poll(float("inf"))
+                continue
+            try:
+                for head in self._ws_heads(url):
+                    yield from self._advance(*head)
+                    backoff = 1
+            except Exception as e:
+                print(f"newHeads subscription lost ({e}); polling for {backoff}s before reconnecting")
+            # Keep following by polling while the socket is down, then retry with jittered backoff
+            yield from self._poll(backoff * random.uniform(0.5, 1.5))
+            backoff = min(backoff * 2, MAX_BACKOFF)
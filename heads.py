@@ -0,0 +1,106 @@
+# one shared chain-head poller per Infura project
+
+import os
+import threading
+import time
+
+from clients import ProjectRegistry, get_web3
+
+POLL_INTERVAL = float(os.environ.get("HEAD_POLL_INTERVAL", 1.0))  # seconds between eth_blockNumber calls
+IDLE_SHUTDOWN = 60  # seconds without readers or subscribers before the poller thread exits
+
+
+class HeadPoller:
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.head = None
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_read = time.monotonic()
+        self.closed = False
+
+    def _ensure_running(self):
+        # Caller holds self.lock
+        if self.closed:
+            return
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def get_head(self):
+        with self.lock:
+            self.last_read = time.monotonic()
+            self._ensure_running()
+            head = self.head
+        if head is None:
+            # First read before the poller has reported anything
+            head = get_web3(self.infura_project_id).eth.block_number
+            self._advance(head)
+        return head
+
+    def subscribe(self, callback):
+        # callback(block_number) runs on the poller thread for every new head
+        with self.lock:
+            if callback not in self.subscribers:
+                self.subscribers.append(callback)
+            self._ensure_running()
+
+    def unsubscribe(self, callback):
+        with self.lock:
+            if callback in self.subscribers:
+                self.subscribers.remove(callback)
+
+    def busy(self):
+        # Trackers, oracles or followers are riding this poller
+        with self.lock:
+            return bool(self.subscribers)
+
+    def close(self):
+        # Dropped from the registry: stop polling and keep no head, so a
+        # caller still holding this poller reads the chain directly
+        with self.lock:
+            self.closed = True
+            self.head = None
+
+    def _advance(self, block_number):
+        with self.lock:
+            if self.closed:
+                return
+            if self.head is not None and block_number <= self.head:
+                return
+            self.head = block_number
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            try:
+                callback(block_number)
+            except Exception as e:
+                print(f"Head subscriber error: {e}")
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if self.closed:
+                    self.thread = None
+                    return
+                if not self.subscribers and time.monotonic() - self.last_read > IDLE_SHUTDOWN:
+                    # Nobody is reading; forget the head so the next reader refetches it
+                    self.thread = None
+                    self.head = None
+                    return
+            try:
+                self._advance(get_web3(self.infura_project_id).eth.block_number)
+            except Exception as e:
+                print(f"Head poller error: {e}")
+            time.sleep(POLL_INTERVAL)
+
+
+_pollers = ProjectRegistry(HeadPoller)
+
+
+def get_head_poller(infura_project_id):
+    return _pollers.get(infura_project_id)
+
+
+def get_head(infura_project_id):
+    return get_head_poller(infura_project_id).get_head()
@@ -0,0 +1,296 @@
+# incremental address -> transaction index
+# finalized blocks are written to SQLite; the unfinalized tip is kept in memory
+# usage: python indexer.py <infura_project_id> [--from BLOCK] [--follow]
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from web3 import Web3
+
+from cache import get_chain_id, get_finalized_block
+from clients import chunked, ordered_map
+from heads import get_head
+from scanner import BLOCK_BATCH, SCAN_WINDOW, address_key, fetch_block_receipts, fetch_blocks
+
+INDEX_PATH = os.environ.get("ADDRESS_INDEX_PATH", "address_index.sqlite3")
+INITIAL_BACKFILL = int(os.environ.get("INDEX_INITIAL_BACKFILL", 10000))  # blocks indexed when starting empty
+FOLLOW_INTERVAL = float(os.environ.get("INDEX_FOLLOW_INTERVAL", 12))  # seconds between catch-up passes
+FOLLOW_IDLE_SHUTDOWN = 300  # seconds without readers before a background follower exits
+
+OUT, IN, SELF = 0, 1, 2
+DIRECTIONS = {OUT: "out", IN: "in", SELF: "self"}
+
+
+def block_postings(block, receipts):
+    # (address, block, tx index, direction, value, status, tx hash, counterparty, gas used) per side of every transfer
+    postings = []
+    for tx in block["transactions"]:
+        receipt = receipts.get(tx["hash"])
+        sender = address_key(tx["from"])
+        recipient = address_key(tx["to"]) if tx["to"] else None
+        common = (
+            int(tx["blockNumber"], 16), int(tx["transactionIndex"], 16),
+        )
+        details = (
+            str(int(tx["value"], 16)),
+            int(receipt["status"], 16) if receipt else None,
+            bytes.fromhex(tx["hash"][2:]),
+        )
+        gas_used = int(receipt["gasUsed"], 16) if receipt else None
+        if sender == recipient:
+            postings.append((sender, *common, SELF, *details, sender, gas_used))
+            continue
+        postings.append((sender, *common, OUT, *details, recipient, gas_used))
+        if recipient is not None:
+            postings.append((recipient, *common, IN, *details, sender, gas_used))
+    return postings
+
+
+def posting_details(posting):
+    # Same shape as the scanners' transaction details
+    address, block_number, _, direction, value, status, tx_hash, counterparty, gas_used = posting
+    address = Web3.to_checksum_address(address)
+    counterparty = Web3.to_checksum_address(counterparty) if counterparty else None
+    sender, recipient = (counterparty, address) if direction == IN else (address, counterparty)
+    return {
+        "blockNumber": block_number,
+        "from": sender,
+        "to": recipient,
+        "value": Web3.from_wei(int(value), "ether"),
+        "hash": "0x" + tx_hash.hex(),
+        "gasUsed": gas_used,
+        "status": status,
+        "direction": DIRECTIONS[direction],
+    }
+
+
+class AddressIndex:
+    def __init__(self, path=INDEX_PATH):
+        self.lock = threading.Lock()
+        self.ingest_lock = threading.Lock()  # one catch-up pass at a time per index
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS postings (
+                address BLOB NOT NULL,
+                block INTEGER NOT NULL,
+                tx_index INTEGER NOT NULL,
+                direction INTEGER NOT NULL,
+                value TEXT NOT NULL,
+                status INTEGER,
+                tx_hash BLOB NOT NULL,
+                counterparty BLOB,
+                gas_used INTEGER,
+                PRIMARY KEY (address, block, tx_index, direction)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        # Hot tier: postings for blocks above the finalized checkpoint, kept in
+        # memory and extended block by block as the head moves
+        self.hot_blocks = {}  # block number -> (block hash, postings)
+        self.hot = {}  # address -> postings, rebuilt from hot_blocks
+        self.hot_head = None
+
+    def _meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def indexed_range(self):
+        # (first, last) block covered by disk and hot tier together, or None when empty
+        with self.lock:
+            first, checkpoint = self._meta("first_block"), self._meta("checkpoint")
+            if first is None:
+                return None
+            return first, max(checkpoint, self.hot_head or checkpoint)
+
+    def indexed_through(self, start_block, end_block):
+        # Last block of start_block..end_block the index can answer from
+        # start_block on, or None when it doesn't reach start_block; blocks
+        # after it are for the caller to scan
+        indexed = self.indexed_range()
+        if indexed is None or not indexed[0] <= start_block <= indexed[1]:
+            return None
+        return min(indexed[1], end_block)
+
+    def _index_blocks(self, infura_project_id, block_numbers):
+        # (block, postings) per block, in order
+        blocks = [b for b in fetch_blocks(infura_project_id, block_numbers) if b is not None]
+        if len(blocks) != len(block_numbers):
+            raise RuntimeError(f"Could not fetch every block in {block_numbers[0]}..{block_numbers[-1]}")
+        receipts = fetch_block_receipts(infura_project_id, blocks)
+        return [(block, block_postings(block, receipts)) for block in blocks]
+
+    def _index_range(self, infura_project_id, start_block, end_block):
+        indexed = []
+        for blocks in ordered_map(lambda chunk: self._index_blocks(infura_project_id, chunk),
+                                  chunked(range(start_block, end_block + 1), BLOCK_BATCH), SCAN_WINDOW):
+            indexed.extend(blocks)
+        return indexed
+
+    def ingest(self, infura_project_id, start_block=None):
+        with self.ingest_lock:
+            return self._ingest(infura_project_id, start_block)
+
+    def _ingest(self, infura_project_id, start_block=None):
+        # Write finalized blocks after the checkpoint to disk, then rebuild the hot tier
+        chain_id = get_chain_id(infura_project_id)
+        finalized = get_finalized_block(infura_project_id)
+        with self.lock:
+            indexed_chain, checkpoint = self._meta("chain_id"), self._meta("checkpoint")
+        if indexed_chain is not None and indexed_chain != chain_id:
+            raise ValueError(f"Index was built for chain {indexed_chain}, not {chain_id}")
+        if checkpoint is None:
+            if start_block is None:
+                start_block = max(0, finalized - INITIAL_BACKFILL)
+            checkpoint = start_block - 1
+            with self.lock, self.db:
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('chain_id', ?)", (chain_id,))
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('first_block', ?)", (start_block,))
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('checkpoint', ?)", (checkpoint,))
+
+        chunks = chunked(range(checkpoint + 1, finalized + 1), BLOCK_BATCH)
+        work = lambda chunk: (chunk[-1], [p for _, ps in self._index_blocks(infura_project_id, chunk) for p in ps])
+        for last_block, postings in ordered_map(work, chunks, SCAN_WINDOW):
+            # Postings and checkpoint commit together, so a crash never skips blocks
+            with self.lock, self.db:
+                self.db.executemany("INSERT OR REPLACE INTO postings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", postings)
+                # Never moves backwards, even with another process ingesting the same file
+                self.db.execute("INSERT INTO meta VALUES ('checkpoint', ?) "
+                                "ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)", (last_block,))
+
+        return self._refresh_hot(infura_project_id, finalized)
+
+    def _refresh_hot(self, infura_project_id, finalized):
+        # Drop blocks that are now finalized (they are on disk) and fetch only
+        # the ones past the last hot block. A new block whose parent isn't the
+        # hot tip means a reorg, and the unfinalized range is fetched again.
+        head = get_head(infura_project_id)
+        hot_blocks = {n: block for n, block in self.hot_blocks.items() if finalized < n <= head}
+        tip = max(hot_blocks, default=finalized)
+        fetched = self._index_range(infura_project_id, tip + 1, head)
+        if fetched and tip in hot_blocks and fetched[0][0]["parentHash"] != hot_blocks[tip][0]:
+            hot_blocks, fetched = {}, self._index_range(infura_project_id, finalized + 1, head)
+        hot_blocks.update((int(block["number"], 16), (block["hash"], postings)) for block, postings in fetched)
+
+        hot = {}
+        for number in sorted(hot_blocks):
+            for posting in hot_blocks[number][1]:
+                hot.setdefault(posting[0], []).append(posting)
+        with self.lock:
+            self.hot_blocks, self.hot, self.hot_head = hot_blocks, hot, head
+        return head
+
+    def postings(self, address, start_block=0, end_block=None, limit=None):
+        # Raw posting rows, newest first, from the hot tier and then disk
+        key = address_key(address)
+        end_block = end_block if end_block is not None else 2**63 - 1
+        with self.lock:
+            hot = [p for p in self.hot.get(key, []) if start_block <= p[1] <= end_block]
+            query = "SELECT * FROM postings WHERE address = ? AND block BETWEEN ? AND ? ORDER BY block DESC, tx_index DESC"
+            params = [key, start_block, end_block]
+            if limit is not None:
+                query += " LIMIT ?"
+                params.append(limit)
+            cold = self.db.execute(query, params).fetchall()
+        return (sorted(hot, key=lambda p: (p[1], p[2]), reverse=True) + cold)[:limit]
+
+    def history(self, address, start_block=0, end_block=None, limit=None):
+        return [posting_details(p) for p in self.postings(address, start_block, end_block, limit)]
+
+    def latest(self, address):
+        history = self.history(address, limit=1)
+        return history[0] if history else None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_followers = {}
+
+
+def get_index(path=INDEX_PATH):
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = AddressIndex(path)
+        return index
+
+
+def index_exists(path=INDEX_PATH):
+    return os.path.exists(path)
+
+
+def follow(infura_project_id, index, interval=FOLLOW_INTERVAL):
+    while True:
+        try:
+            index.ingest(infura_project_id)
+        except Exception as e:
+            print(f"Indexer error: {e}")
+        time.sleep(interval)
+
+
+class IndexFollower:
+    # One background catch-up loop per index file, however many projects read
+    # it. The loop keeps the project ID that started it; an ID that has never
+    # ingested successfully stops the loop at its first error instead of
+    # retrying forever, and the loop exits once nobody has read for a while.
+    def __init__(self, index):
+        self.index = index
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_read = time.monotonic()
+
+    def touch(self, infura_project_id):
+        with self.lock:
+            self.last_read = time.monotonic()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, args=(infura_project_id,), daemon=True)
+                self.thread.start()
+
+    def _run(self, infura_project_id):
+        succeeded = False
+        while True:
+            with self.lock:
+                if time.monotonic() - self.last_read > FOLLOW_IDLE_SHUTDOWN:
+                    self.thread = None
+                    return
+            try:
+                self.index.ingest(infura_project_id)
+                succeeded = True
+            except Exception as e:
+                print(f"Indexer error: {e}")
+                if not succeeded:
+                    with self.lock:
+                        self.thread = None
+                    return
+            time.sleep(FOLLOW_INTERVAL)
+
+
+def start_follower(infura_project_id, path=INDEX_PATH):
+    # Keep the index at `path` caught up while it is being read
+    index = get_index(path)
+    with _indexes_lock:
+        follower = _followers.get(path)
+        if follower is None:
+            follower = _followers[path] = IndexFollower(index)
+    follower.touch(infura_project_id)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("infura_project_id")
+    parser.add_argument("--from", dest="start_block", type=int, help="first block to index when the index is empty")
+    parser.add_argument("--follow", action="store_true", help="keep indexing new blocks")
+    args = parser.parse_args()
+
+    index = get_index()
+    head = index.ingest(args.infura_project_id, args.start_block)
+    print(f"Indexed blocks {index.indexed_range()[0]} to {head}")
+    sys.stdout.flush()
+    if args.follow:
+        follow(args.infura_project_id, index)
@@ -0,0 +1,165 @@
+# in-process counters, gauges and histograms rendered in the Prometheus text format
+
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values tuple -> value
+        self.lock = threading.Lock()
+        with _registry_lock:
+            _metrics.append(self)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for labels, value in items:
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # Per-bucket counts are kept non-cumulative so an observation is one
+        # bisect and three additions; they are summed up at scrape time
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        for labels, (counts, total, count) in items:
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", dict(base, le=_format_value(bound)), cumulative
+            yield self.name + "_sum", base, total
+            yield self.name + "_count", base, count
+
+
+def register_collector(collect):
+    # collect() returns (name, kind, help, [(labels dict, value), ...]) tuples
+    # for values that already live elsewhere (cache and router stats) and are
+    # only read at scrape time
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+        for key, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render():
+    with _registry_lock:
+        metrics = list(_metrics)
+        collectors = list(_collectors)
+
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for collect in collectors:
+        try:
+            families = list(collect())
+        except Exception as e:
+            lines.append(f"# collector error: {e}")
+            continue
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+HTTP_DURATION = Histogram("http_request_duration_seconds", "Flask request handling time by route", ("route", "method"))
+HTTP_REQUESTS = Counter("http_requests_total", "Flask responses by route and status code", ("route", "method", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Flask requests currently being handled, open streams included")
+
+
+def instrument_flask(app):
+    # Route-level timing with the URL rule as the label, so path parameters
+    # such as addresses and hashes never become label values
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+
+    @app.after_request
+    def _count_response(response):
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+        return response
+
+    @app.teardown_request
+    def _stop_timer(error=None):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        HTTP_IN_FLIGHT.dec()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_DURATION.observe(time.perf_counter() - started, route, request.method)
+
+    return app
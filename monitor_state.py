@@ -0,0 +1,87 @@
+# durable cursor and emitted-transaction log for the wallet monitor
+
+import hashlib
+import os
+import sqlite3
+import threading
+
+STATE_PATH = os.environ.get("MONITOR_STATE_PATH", "monitor_state.sqlite3")
+REORG_DEPTH = 64  # emitted hashes kept below the cursor in case those blocks are reorged
+
+
+def watch_id(chain_id, addresses):
+    # Same chain and address set -> same cursor, whatever order the addresses came in
+    key = ",".join(sorted({address.lower() for address in addresses}))
+    return hashlib.sha256(f"{chain_id}:{key}".encode()).hexdigest()
+
+
+class MonitorState:
+    def __init__(self, path, watch):
+        self.watch = watch
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS cursors (
+                watch TEXT PRIMARY KEY,
+                block INTEGER NOT NULL,
+                block_hash TEXT
+            );
+            CREATE TABLE IF NOT EXISTS emitted (
+                watch TEXT NOT NULL,
+                tx_hash BLOB NOT NULL,
+                block INTEGER NOT NULL,
+                PRIMARY KEY (watch, tx_hash)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS emitted_by_block ON emitted (watch, block);
+        """)
+
+    def cursor(self):
+        # (last fully processed block, its hash or None), or None on first run
+        with self.lock:
+            return self.db.execute(
+                "SELECT block, block_hash FROM cursors WHERE watch = ?", (self.watch,),
+            ).fetchone()
+
+    def is_emitted(self, tx_hash):
+        with self.lock:
+            return self.db.execute(
+                "SELECT 1 FROM emitted WHERE watch = ? AND tx_hash = ?", (self.watch, bytes.fromhex(tx_hash[2:])),
+            ).fetchone() is not None
+
+    def emitted_in(self, block_number):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT tx_hash FROM emitted WHERE watch = ? AND block = ?", (self.watch, block_number),
+            ).fetchall()
+        return ["0x" + tx_hash.hex() for tx_hash, in rows]
+
+    def mark(self, tx):
+        # Called right after a transaction is delivered, so a crash can repeat
+        # at most the one event that was in flight
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO emitted VALUES (?, ?, ?)",
+                (self.watch, bytes.fromhex(tx["hash"][2:]), tx["blockNumber"]),
+            )
+
+    def commit(self, block_number, block_hash):
+        # Move the cursor past a fully delivered block
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)", (self.watch, block_number, block_hash))
+            self.db.execute(
+                "DELETE FROM emitted WHERE watch = ? AND block < ?", (self.watch, block_number - REORG_DEPTH),
+            )
+
+    def retract(self, block_number):
+        # Forget a reorged block: its transactions may be emitted again from the new branch
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM emitted WHERE watch = ? AND block = ?", (self.watch, block_number))
+            self.db.execute(
+                "INSERT OR REPLACE INTO cursors VALUES (?, ?, NULL)", (self.watch, block_number - 1),
+            )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,192 @@
+# in-process nonce allocation per sender address
+
+import asyncio
+import threading
+import time
+
+from web3 import Web3
+
+from clients import BATCH_SIZE, ProjectRegistry, RPCError, chunked, get_web3, rpc_batch
+from signing import SIGNING_DURATION, recover_sender, sign_transactions
+
+# Node error messages that mean our local nonce has fallen behind the chain
+STALE_NONCE_ERRORS = ("nonce too low", "replacement transaction underpriced")
+
+
+def is_stale_nonce(error):
+    message = str(error).lower()
+    return any(text in message for text in STALE_NONCE_ERRORS)
+
+
+class NonceManager:
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.next_nonce = {}  # checksum address -> next nonce to hand out
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _address_lock(self, address):
+        with self.lock:
+            lock = self.locks.get(address)
+            if lock is None:
+                lock = self.locks[address] = threading.Lock()
+            return lock
+
+    def _seed(self, address):
+        # Seed once from the pending count so queued mempool transactions are skipped
+        if address not in self.next_nonce:
+            web3 = get_web3(self.infura_project_id)
+            self.next_nonce[address] = web3.eth.get_transaction_count(address, 'pending')
+
+    def allocate(self, address, count=1):
+        # Reserve `count` consecutive nonces and return the first one
+        address = Web3.to_checksum_address(address)
+        with self._address_lock(address):
+            self._seed(address)
+            nonce = self.next_nonce[address]
+            self.next_nonce[address] = nonce + count
+            return nonce
+
+    def busy(self):
+        # An allocation is being made right now
+        with self.lock:
+            return any(lock.locked() for lock in self.locks.values())
+
+    def peek(self, address):
+        address = Web3.to_checksum_address(address)
+        with self._address_lock(address):
+            self._seed(address)
+            return self.next_nonce[address]
+
+    def release(self, address, nonce, count=1):
+        # Give back nonces that were never broadcast. If later nonces have been
+        # handed out since, rolling back would collide, so reseed instead.
+        address = Web3.to_checksum_address(address)
+        with self._address_lock(address):
+            if self.next_nonce.get(address) == nonce + count:
+                self.next_nonce[address] = nonce
+            else:
+                self.next_nonce.pop(address, None)
+
+    def resync(self, address):
+        # Forget the local counter; the next allocation reseeds from the node
+        address = Web3.to_checksum_address(address)
+        with self._address_lock(address):
+            self.next_nonce.pop(address, None)
+
+
+def sign_and_send(web3, nonces, sender_address, tx, private_key, retries=1):
+    # Fill in a locally allocated nonce, sign, check the signature and
+    # broadcast. When the node reports the nonce as stale, resync from the
+    # chain and try again. Returns (tx hash, signed tx, nonce used).
+    for attempt in range(retries + 1):
+        nonce = nonces.allocate(sender_address)
+        try:
+            started = time.perf_counter()
+            signed_tx = web3.eth.account.sign_transaction(dict(tx, nonce=nonce), private_key)
+            # Check the signature once, offline, before anything is broadcast
+            if recover_sender(signed_tx.rawTransaction).lower() != sender_address.lower():
+                raise ValueError("Private key does not match the sender address")
+            SIGNING_DURATION.observe(time.perf_counter() - started, "single")
+            return web3.eth.send_raw_transaction(signed_tx.rawTransaction), signed_tx, nonce
+        except ValueError as e:
+            # The exact same signed transaction is already in the pool (e.g. a
+            # retried broadcast), so it went out under this nonce
+            if "already known" in str(e).lower():
+                return signed_tx.hash, signed_tx, nonce
+            if is_stale_nonce(e):
+                nonces.resync(sender_address)
+                if attempt < retries:
+                    continue
+            else:
+                nonces.release(sender_address, nonce)
+            raise
+        except Exception:
+            nonces.release(sender_address, nonce)
+            raise
+
+
+async def async_sign_and_send(web3, nonces, sender_address, tx, private_key, retries=1):
+    # sign_and_send for AsyncWeb3 on the event loop: the same allocator, with
+    # its first (seeding) allocation per sender run off the loop
+    loop = asyncio.get_running_loop()
+    for attempt in range(retries + 1):
+        nonce = await loop.run_in_executor(None, nonces.allocate, sender_address)
+        try:
+            started = time.perf_counter()
+            signed_tx = web3.eth.account.sign_transaction(dict(tx, nonce=nonce), private_key)
+            if recover_sender(signed_tx.rawTransaction).lower() != sender_address.lower():
+                raise ValueError("Private key does not match the sender address")
+            SIGNING_DURATION.observe(time.perf_counter() - started, "single")
+            return await web3.eth.send_raw_transaction(signed_tx.rawTransaction), signed_tx, nonce
+        except ValueError as e:
+            if "already known" in str(e).lower():
+                return signed_tx.hash, signed_tx, nonce
+            if is_stale_nonce(e):
+                nonces.resync(sender_address)
+                if attempt < retries:
+                    continue
+            else:
+                nonces.release(sender_address, nonce)
+            raise
+        except Exception:
+            nonces.release(sender_address, nonce)
+            raise
+
+
+UNKNOWN_BROADCAST = "unknown, check chain"  # batch failed in flight; it may or may not have been broadcast
+
+
+def sign_and_send_batch(infura_project_id, nonces, sender_address, txs, private_key):
+    # Reserve one run of consecutive nonces, sign every transaction (on the
+    # process pool for large batches), check a signature offline and broadcast
+    # the raw transactions in JSON-RPC batches, in nonce order. Returns one
+    # {'nonce', 'transaction_hash'} or {'nonce', 'error'} per transaction;
+    # UNKNOWN_BROADCAST errors carry the transaction_hash too.
+    first_nonce = nonces.allocate(sender_address, len(txs))
+    try:
+        signed = sign_transactions([dict(tx, nonce=first_nonce + i) for i, tx in enumerate(txs)], private_key)
+        if recover_sender(signed[0]['raw_transaction']).lower() != sender_address.lower():
+            raise ValueError("Private key does not match the sender address")
+    except Exception:
+        nonces.release(sender_address, first_nonce, len(txs))
+        raise
+
+    # One batch at a time so the node sees the nonces in order. When a batch
+    # fails outright it may still have reached the node, so its transactions
+    # are reported as unknown (with their hashes, to check and track) and the
+    # batches after it are not sent; the ones already out keep their results
+    sent = []
+    for chunk in chunked([("eth_sendRawTransaction", [s['raw_transaction']]) for s in signed], BATCH_SIZE):
+        try:
+            sent.extend(rpc_batch(infura_project_id, chunk))
+        except Exception as e:
+            print(f"Broadcast of nonces {first_nonce + len(sent)}+ failed: {e}")
+            break
+
+    results = []
+    for i, signed_tx in enumerate(signed):
+        nonce = first_nonce + i
+        if i >= len(sent):
+            if i < len(sent) + BATCH_SIZE:
+                results.append({'nonce': nonce, 'error': UNKNOWN_BROADCAST,
+                                'transaction_hash': signed_tx['transaction_hash']})
+            else:
+                results.append({'nonce': nonce, 'error': 'not sent'})
+        elif isinstance(sent[i], RPCError) and "already known" not in str(sent[i].message).lower():
+            results.append({'nonce': nonce, 'error': sent[i].message})
+        else:
+            results.append({'nonce': nonce, 'transaction_hash': signed_tx['transaction_hash']})
+    if any('error' in result for result in results):
+        # A rejected or unknown nonce leaves a gap that holds up the later ones;
+        # reseed so the next allocation starts from what the node actually has
+        nonces.resync(sender_address)
+    return results
+
+
+# A dropped manager costs one reseed from the node's pending count per sender
+_managers = ProjectRegistry(NonceManager)
+
+
+def get_nonce_manager(infura_project_id):
+    return _managers.get(infura_project_id)
@@ -0,0 +1,247 @@
+# background receipt tracker: one batched receipt poll per block for every pending hash,
+# and, for sends that opt in, rebroadcasting stuck ones with bumped fees under the same nonce
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from eth_account import Account
+from web3 import Web3
+
+import metrics
+from clients import ProjectRegistry, RPCError, rpc_batches
+from fees import quote_fees
+from heads import get_head_poller
+from nonces import get_nonce_manager
+
+MAX_FINISHED = 10000  # finished records kept for /transaction lookups
+DROP_CHECK_BLOCKS = 25  # blocks without a receipt before checking whether the node dropped a hash
+REPLACE_AFTER_BLOCKS = int(os.environ.get("REPLACE_AFTER_BLOCKS", 3))  # blocks unmined before a fee bump, 0 disables
+# Fee bumping is opt-in: per send (replace_stuck / --speed-up), or for every send
+# with REPLACE_STUCK=1. The private key of an opted-in transaction is held in
+# this process's memory until the hash is mined, dropped or can't be bumped further.
+REPLACE_STUCK = os.environ.get("REPLACE_STUCK", "") == "1"
+REPLACE_BUMP = 1.125  # fee multiplier per replacement; nodes require at least +10%
+MIN_BUMP = 1.1
+REPLACE_MAX_FEE = int(float(os.environ.get("REPLACE_MAX_FEE_GWEI", 200)) * 10**9)  # fee ceiling in wei
+
+RECEIPT_WAIT = metrics.Histogram("receipt_wait_seconds", "Time callers spent blocked on a receipt, by outcome", ("status",))
+CONFIRMATION = metrics.Histogram("transaction_confirmation_seconds", "Submission to mined receipt, by status", ("status",))
+REPLACEMENTS = metrics.Counter("transaction_replacements_total", "Fee-bumped replacements broadcast")
+
+
+class ReceiptTracker:
+    def __init__(self, infura_project_id):
+        self.infura_project_id = infura_project_id
+        self.records = OrderedDict()  # tx hash -> status dict
+        self.pending = set()
+        self.condition = threading.Condition()
+        self.last_block = None
+        self.aliases = {}  # replacement hash -> hash the record was first tracked under
+        self.replaceable = {}  # tracked hash -> {'tx', 'private_key', 'speed', 'hashes'} while fee bumps are allowed
+
+    def track(self, tx_hash, sender_address, tx=None, private_key=None, speed="normal"):
+        # Passing the signed transaction fields (nonce included) and key opts in
+        # to fee bumping: a hash left unmined for REPLACE_AFTER_BLOCKS is re-signed
+        # with higher fees, never below the quote for the speed it was sent at
+        tx_hash = tx_hash if isinstance(tx_hash, str) else Web3.to_hex(tx_hash)
+        with self.condition:
+            self.records[tx_hash] = {
+                'status': 'pending',
+                'transaction_hash': tx_hash,
+                'sender_address': sender_address,
+                'submitted_at': time.time(),
+                'submitted_block': self.last_block,
+            }
+            self.pending.add(tx_hash)
+            if tx is not None and private_key is not None and REPLACE_AFTER_BLOCKS:
+                self.replaceable[tx_hash] = {'tx': tx, 'private_key': private_key, 'speed': speed, 'hashes': [tx_hash]}
+            # Ride the shared head poller while anything is pending
+            get_head_poller(self.infura_project_id).subscribe(self._on_head)
+        return tx_hash
+
+    def busy(self):
+        with self.condition:
+            return bool(self.pending)
+
+    def get(self, tx_hash):
+        with self.condition:
+            record = self.records.get(self.aliases.get(tx_hash, tx_hash))
+            return dict(record) if record else None
+
+    def wait(self, tx_hash, timeout):
+        # Block until the hash leaves the pending state or the timeout expires
+        with self.condition:
+            tx_hash = self.aliases.get(tx_hash, tx_hash)
+            if tx_hash not in self.records:
+                return None
+            started = time.perf_counter()
+            self.condition.wait_for(lambda: tx_hash not in self.pending, timeout)
+            record = dict(self.records[tx_hash])
+        RECEIPT_WAIT.observe(time.perf_counter() - started, record['status'])
+        return record
+
+    def _on_head(self, block_number):
+        self.last_block = block_number
+        try:
+            self._poll()
+        except Exception as e:
+            print(f"Receipt tracker error: {e}")
+        with self.condition:
+            if not self.pending:
+                get_head_poller(self.infura_project_id).unsubscribe(self._on_head)
+
+    def _poll(self):
+        # Every hash broadcast for a pending record is polled; any of them may be the one mined
+        with self.condition:
+            queried = [(h, b) for h in self.pending
+                       for b in (self.replaceable[h]['hashes'] if h in self.replaceable else [h])]
+        if not queried:
+            return
+
+        receipts = rpc_batches(self.infura_project_id, [("eth_getTransactionReceipt", [b]) for _, b in queried])
+        mined = {h: (b, r) for (h, b), r in zip(queried, receipts) if r and not isinstance(r, RPCError)}
+        unmined = sorted({h for h, _ in queried if h not in mined})
+        self._check_dropped([h for h in unmined if h not in self.replaceable])
+        self._replace_stuck([h for h in unmined if h in self.replaceable])
+        if not mined:
+            return
+
+        # Fetch the senders' updated balances in a second batch
+        with self.condition:
+            senders = {self.records[h]['sender_address'] for h in mined}
+        senders = sorted(senders)
+        balances = rpc_batches(self.infura_project_id, [("eth_getBalance", [s, "latest"]) for s in senders])
+        balances = {
+            s: float(Web3.from_wei(int(b, 16), 'ether'))
+            for s, b in zip(senders, balances) if not isinstance(b, RPCError)
+        }
+
+        with self.condition:
+            for tx_hash, (mined_hash, receipt) in mined.items():
+                record = self.records[tx_hash]
+                record['transaction_hash'] = mined_hash
+                self.replaceable.pop(tx_hash, None)
+                record['status'] = 'success' if int(receipt['status'], 16) == 1 else 'failed'
+                CONFIRMATION.observe(time.time() - record['submitted_at'], record['status'])
+                record['block_number'] = int(receipt['blockNumber'], 16)
+                record['updated_balance'] = balances.get(record['sender_address'])
+                self.pending.discard(tx_hash)
+            self._trim()
+            self.condition.notify_all()
+
+    def _check_dropped(self, hashes):
+        # Hashes the node no longer knows about will never be mined; release
+        # the sender's nonce so the local allocator resyncs from the chain
+        with self.condition:
+            stale = []
+            for tx_hash in hashes:
+                record = self.records[tx_hash]
+                if record['submitted_block'] is None:
+                    record['submitted_block'] = self.last_block
+                elif self.last_block - record['submitted_block'] >= DROP_CHECK_BLOCKS:
+                    stale.append(tx_hash)
+            # A replaced record is checked under its latest broadcast hash
+            latest = [self.records[h]['transaction_hash'] for h in stale]
+        if not stale:
+            return
+
+        transactions = rpc_batches(self.infura_project_id, [("eth_getTransactionByHash", [h]) for h in latest])
+        dropped = [h for h, tx in zip(stale, transactions) if tx is None]
+        with self.condition:
+            for tx_hash in dropped:
+                record = self.records[tx_hash]
+                record['status'] = 'dropped'
+                self.pending.discard(tx_hash)
+                get_nonce_manager(self.infura_project_id).resync(record['sender_address'])
+            if dropped:
+                self.condition.notify_all()
+
+    def _replace_stuck(self, hashes):
+        # Re-sign every transaction unmined for REPLACE_AFTER_BLOCKS with the same
+        # nonce and its own fees raised by REPLACE_BUMP (or to the current quote
+        # for its speed if higher), capped at REPLACE_MAX_FEE, and broadcast
+        # them in one batch
+        replacements = []
+        with self.condition:
+            for tx_hash in hashes:
+                record = self.records[tx_hash]
+                if record['submitted_block'] is None:
+                    record['submitted_block'] = self.last_block
+                elif self.last_block - record['submitted_block'] >= REPLACE_AFTER_BLOCKS:
+                    replacements.append((tx_hash, self.replaceable[tx_hash]))
+        if not replacements:
+            return
+
+        quotes = {speed: quote_fees(self.infura_project_id, speed) for speed in {s['speed'] for _, s in replacements}}
+        signed = []
+        for tx_hash, state in replacements:
+            tx = bump_fees(state['tx'], quotes[state['speed']])
+            if tx is None:
+                # Already at the ceiling; from here on it is only watched for drops
+                with self.condition:
+                    self.replaceable.pop(tx_hash, None)
+                continue
+            signed_tx = Account.sign_transaction(tx, state['private_key'])
+            signed.append((tx_hash, tx, Web3.to_hex(signed_tx.hash), Web3.to_hex(signed_tx.rawTransaction)))
+        if not signed:
+            return
+
+        sent = rpc_batches(self.infura_project_id, [("eth_sendRawTransaction", [raw]) for *_, raw in signed], 1)
+        with self.condition:
+            for (tx_hash, tx, new_hash, _), result in zip(signed, sent):
+                state = self.replaceable.get(tx_hash)
+                if state is None:
+                    continue
+                if isinstance(result, RPCError) and "already known" not in str(result.message).lower():
+                    if "underpriced" not in str(result.message).lower():
+                        # Nonce used or funds short: stop bumping and let the
+                        # receipt and drop checks settle the earlier hashes
+                        self.replaceable.pop(tx_hash, None)
+                    continue
+                record = self.records[tx_hash]
+                state['tx'] = tx
+                state['hashes'].append(new_hash)
+                self.aliases[new_hash] = tx_hash
+                REPLACEMENTS.inc()
+                record['replaced_hashes'] = state['hashes'][:-1]
+                record['transaction_hash'] = new_hash
+                record['submitted_block'] = self.last_block
+
+    def _trim(self):
+        # Drop the oldest finished records once over the cap
+        excess = len(self.records) - len(self.pending) - MAX_FINISHED
+        for tx_hash in list(self.records):
+            if excess <= 0:
+                break
+            if tx_hash not in self.pending:
+                for replaced in self.records[tx_hash].get('replaced_hashes', []) + [self.records[tx_hash]['transaction_hash']]:
+                    self.aliases.pop(replaced, None)
+                del self.records[tx_hash]
+                excess -= 1
+
+
+def bump_fees(tx, quote):
+    # Fee fields for a replacement of tx, or None if the ceiling leaves no room
+    # for the minimum bump a node accepts. Legacy transactions bump gasPrice.
+    if 'gasPrice' in tx:
+        gas_price = min(max(math.ceil(tx['gasPrice'] * REPLACE_BUMP), quote['maxFeePerGas']), REPLACE_MAX_FEE)
+        if gas_price < tx['gasPrice'] * MIN_BUMP:
+            return None
+        return dict(tx, gasPrice=gas_price)
+
+    max_fee = min(max(math.ceil(tx['maxFeePerGas'] * REPLACE_BUMP), quote['maxFeePerGas']), REPLACE_MAX_FEE)
+    tip = min(max(math.ceil(tx['maxPriorityFeePerGas'] * REPLACE_BUMP), quote['maxPriorityFeePerGas']), max_fee)
+    if max_fee < tx['maxFeePerGas'] * MIN_BUMP or tip < tx['maxPriorityFeePerGas'] * MIN_BUMP:
+        return None
+    return dict(tx, maxFeePerGas=max_fee, maxPriorityFeePerGas=tip)
+
+
+# A tracker with nothing pending can be dropped, and its finished records with it
+_trackers = ProjectRegistry(ReceiptTracker)
+
+
+def get_tracker(infura_project_id):
+    return _trackers.get(infura_project_id)
@@ -0,0 +1,395 @@
+# health-aware routing of JSON-RPC posts across several upstream endpoints
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+
+RETRIES = int(os.environ.get("RPC_RETRIES", 2))  # extra attempts for idempotent reads
+BACKOFF_BASE = float(os.environ.get("RPC_BACKOFF_BASE", 0.1))  # seconds, doubled per attempt, jittered
+HEDGE_DELAY = float(os.environ.get("RPC_HEDGE_DELAY", 0.3))  # seconds before hedging until p95 is known
+HEDGE_MIN_SAMPLES = 20  # latencies needed before an endpoint's own p95 is trusted
+LATENCY_SAMPLES = 200  # recent successful latencies kept per endpoint
+MAX_COOLDOWN = 30  # seconds an endpoint is skipped after repeated failures, at most
+
+# Sending these twice could double-spend or double-submit, so they are never retried or hedged
+NON_IDEMPOTENT = ("eth_sendRawTransaction", "eth_sendTransaction")
+# Tail-sensitive reads worth a second, hedged request
+HEDGED_METHODS = tuple(os.environ.get("RPC_HEDGED_METHODS", "eth_getBalance").split(","))
+RATE_LIMIT_CODES = (-32005, 429)  # JSON-RPC error codes providers use for "over quota"
+
+
+class RateLimitedError(requests.HTTPError):
+    # Every endpoint is over quota; callers should surface this as 503
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate  # tokens per second, None for unlimited
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self, cost=1):
+        # Take `cost` tokens, or return the seconds until they would be available.
+        # Batches larger than the burst are let through on a full bucket and
+        # leave it in debt, so they are never starved.
+        if self.rate is None:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            needed = min(cost, self.burst)
+            if self.tokens >= needed:
+                self.tokens -= cost
+                return 0
+            return (needed - self.tokens) / self.rate
+
+
+class Endpoint:
+    def __init__(self, url, rate=None):
+        self.url = url
+        self.bucket = TokenBucket(rate)
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.latency = None  # moving average of successful round trips, seconds
+        self.error_rate = 0.0  # moving average of failures (0..1)
+        self.failures = 0  # consecutive failures
+        self.throttled = False  # last failure was a rate limit
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def record_success(self, elapsed):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(elapsed)
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            self.error_rate *= 0.8
+            self.failures = 0
+            self.throttled = False
+
+    def record_failure(self, retry_after=None):
+        with self.lock:
+            self.requests += 1
+            self.errors += 1
+            self.error_rate = 0.8 * self.error_rate + 0.2
+            self.failures += 1
+            self.throttled = retry_after is not None
+            if retry_after is not None:
+                self.rate_limited += 1
+                cooldown = retry_after
+            else:
+                cooldown = min(MAX_COOLDOWN, 0.25 * 2 ** self.failures)
+            self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+
+    def available(self, now):
+        return now >= self.cooldown_until
+
+    def score(self):
+        # Lower is better: slow endpoints and flaky endpoints both rank down;
+        # untried endpoints rank first so every endpoint gets measured
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + 10 * self.error_rate) + self.error_rate
+
+    def p95(self):
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DELAY
+            ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def stats(self):
+        with self.lock:
+            return {
+                "host": urlsplit(self.url).netloc,  # never echo project IDs or keys in the path
+                "requests": self.requests,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "latency": self.latency,
+                "error_rate": self.error_rate,
+                "cooling_down": not self.available(time.monotonic()),
+            }
+
+
+def parse_endpoints(spec):
+    # "https://a/{},https://b/{}#rps=25" -> [(template, rate or None), ...]
+    endpoints = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        template, _, options = entry.partition("#")
+        rate = None
+        for option in options.split("&"):
+            key, _, value = option.partition("=")
+            if key == "rps" and value:
+                rate = float(value)
+        endpoints.append((template, rate))
+    return endpoints
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rpc-hedge")
+
+
+class Router:
+    def __init__(self, endpoints, session, timeout):
+        self.endpoints = [Endpoint(url, rate) for url, rate in endpoints]
+        self.session = session
+        self.timeout = timeout
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _ranked(self, exclude=()):
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e not in exclude]
+        ready = [e for e in candidates if e.available(now)]
+        # When every endpoint is cooling down, try the one that recovers first
+        return sorted(ready, key=Endpoint.score) or sorted(candidates, key=lambda e: e.cooldown_until)[:1]
+
+    def _try_pick(self, cost, exclude=()):
+        # (healthiest endpoint that has tokens, 0), (None, seconds until one
+        # has them), or (None, None) when there is no candidate at all
+        ranked = self._ranked(exclude)
+        if not ranked:
+            return None, None
+        waits = []
+        for endpoint in ranked:
+            wait_for = endpoint.bucket.try_acquire(cost)
+            if not wait_for:
+                return endpoint, 0
+            waits.append(wait_for)
+        return None, min(waits)
+
+    def _pick(self, cost, exclude=()):
+        # Healthiest endpoint that has tokens; wait for tokens up to the request timeout
+        deadline = time.monotonic() + self.timeout
+        while True:
+            endpoint, delay = self._try_pick(cost, exclude)
+            if not delay:
+                return endpoint
+            if time.monotonic() + delay > deadline:
+                raise RateLimitedError("All RPC endpoints are over their rate limit")
+            time.sleep(delay)
+
+    async def _pick_async(self, cost, exclude=()):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            endpoint, delay = self._try_pick(cost, exclude)
+            if not delay:
+                return endpoint
+            if time.monotonic() + delay > deadline:
+                raise RateLimitedError("All RPC endpoints are over their rate limit")
+            await asyncio.sleep(delay)
+
+    def _send(self, endpoint, data, idempotent=True):
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                endpoint.url, data=data, timeout=self.timeout, headers={"Content-Type": "application/json"},
+            )
+        except (requests.ConnectionError, requests.Timeout):
+            endpoint.record_failure()
+            raise
+        return self._settle(endpoint, started, response, idempotent)
+
+    async def _send_async(self, session, endpoint, data, idempotent=True):
+        # Same as _send on an aiohttp session; the answer is wrapped in a
+        # requests.Response and failures raised as requests exceptions, so
+        # both paths share _settle and the retry rules in post()
+        started = time.monotonic()
+        try:
+            async with session.post(endpoint.url, data=data, headers={"Content-Type": "application/json"},
+                                    timeout=aiohttp.ClientTimeout(total=self.timeout)) as reply:
+                response = requests.Response()
+                response.status_code, response.reason, response.url = reply.status, reply.reason, endpoint.url
+                response.headers.update(reply.headers)
+                response._content = await reply.read()
+        except asyncio.TimeoutError as e:
+            endpoint.record_failure()
+            raise requests.Timeout(f"Timed out after {self.timeout}s") from e
+        except aiohttp.ClientError as e:
+            endpoint.record_failure()
+            raise requests.ConnectionError(str(e)) from e
+        return self._settle(endpoint, started, response, idempotent)
+
+    def _settle(self, endpoint, started, response, idempotent):
+        # Record how the endpoint did and return the body, or raise
+        if response.status_code == 429:
+            endpoint.record_failure(retry_after=float(response.headers.get("Retry-After") or 1))
+            raise RateLimitedError(f"{response.status_code} Too Many Requests", response=response)
+        if response.status_code >= 500:
+            endpoint.record_failure()
+            response.raise_for_status()
+        response.raise_for_status()
+        if _rate_limited_body(response.content):
+            endpoint.record_failure(retry_after=1)
+            if not idempotent:
+                # Other entries of a write batch may have gone through; hand
+                # back the per-entry errors instead of sending them all again
+                return response.content
+            raise RateLimitedError("RPC endpoint quota exceeded", response=response)
+        endpoint.record_success(time.monotonic() - started)
+        return response.content
+
+    def _hedged(self, data, cost):
+        # Send to the best endpoint; if it hasn't answered by its p95, send the
+        # same read to the next best and take whichever succeeds first
+        primary = self._pick(cost)
+        first = _hedge_pool.submit(self._send, primary, data)
+        done, _ = wait([first], timeout=primary.p95())
+        if done:
+            return first.result()
+        try:
+            secondary = self._pick(cost, exclude=[primary])
+        except RateLimitedError:
+            secondary = None
+        if secondary is None:
+            return first.result()
+        self.hedges += 1
+        second = _hedge_pool.submit(self._send, secondary, data)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _hedged_async(self, session, data, cost):
+        primary = await self._pick_async(cost)
+        first = asyncio.ensure_future(self._send_async(session, primary, data))
+        done, _ = await asyncio.wait([first], timeout=primary.p95())
+        if done:
+            return first.result()
+        try:
+            secondary = await self._pick_async(cost, exclude=[primary])
+        except RateLimitedError:
+            secondary = None
+        if secondary is None:
+            return await first
+        self.hedges += 1
+        second = asyncio.ensure_future(self._send_async(session, secondary, data))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is second:
+                            self.hedge_wins += 1
+                        return future.result()
+                    error = future.exception()
+        finally:
+            # The loser's answer is no longer wanted
+            for future in pending:
+                future.cancel()
+        raise error
+
+    def _retry_delay(self, attempt):
+        # The endpoint that failed is cooling down, so while others are left
+        # untried a retry goes straight to the next one; jittered backoff only
+        # starts once every endpoint has had a go
+        if attempt < len(self.endpoints):
+            return 0
+        return BACKOFF_BASE * 2 ** (attempt - len(self.endpoints)) * random.uniform(0.5, 1.5)
+
+    def _plan(self, methods):
+        # (idempotent, hedge, token cost) for a request carrying `methods`
+        idempotent = not any(method in NON_IDEMPOTENT for method in methods)
+        hedge = idempotent and len(self.endpoints) > 1 and all(method in HEDGED_METHODS for method in methods)
+        return idempotent, hedge, len(methods)
+
+    def post(self, data, methods):
+        # POST an encoded JSON-RPC request or batch and return the raw body.
+        # Reads are retried on other endpoints, then with jittered backoff; writes are
+        # only retried after an HTTP 429, when nothing in the request was processed.
+        idempotent, hedge, cost = self._plan(methods)
+        error = None
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                time.sleep(self._retry_delay(attempt))
+            try:
+                if hedge:
+                    return self._hedged(data, cost)
+                return self._send(self._pick(cost), data, idempotent)
+            except requests.RequestException as e:
+                if not _retryable(e, idempotent):
+                    raise
+                error = e
+        raise error
+
+    async def post_async(self, session, data, methods):
+        # post() for the event loop, on the caller's aiohttp session; endpoint
+        # health, token buckets and hedging stats are shared with post()
+        idempotent, hedge, cost = self._plan(methods)
+        error = None
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(self._retry_delay(attempt))
+            try:
+                if hedge:
+                    return await self._hedged_async(session, data, cost)
+                return await self._send_async(session, await self._pick_async(cost), data, idempotent)
+            except requests.RequestException as e:
+                if not _retryable(e, idempotent):
+                    raise
+                error = e
+        raise error
+
+    def throttled(self):
+        # True when every endpoint is cooling down after a rate limit
+        now = time.monotonic()
+        return all(e.throttled and not e.available(now) for e in self.endpoints)
+
+    def stats(self):
+        return {
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+def _retryable(error, idempotent):
+    # Rate limits are retried for everything (nothing was processed); network
+    # failures and 5xx only for reads
+    if isinstance(error, RateLimitedError):
+        return True
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return idempotent
+    if isinstance(error, requests.HTTPError):
+        return idempotent and error.response is not None and error.response.status_code >= 500
+    return False
+
+
+def _rate_limited_body(content):
+    # Some providers answer over-quota requests with HTTP 200 and an error body
+    if b"error" not in content:
+        return False
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return False
+    items = body if isinstance(body, list) else [body]
+    return any(
+        isinstance(item, dict) and isinstance(item.get("error"), dict)
+        and item["error"].get("code") in RATE_LIMIT_CODES
+        for item in items
+    )
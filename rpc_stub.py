@@ -0,0 +1,451 @@
+# local JSON-RPC chain simulator for benchmarking and testing without an Infura project
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rlp
+import websockets
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_account._utils.typed_transactions import TypedTransaction
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+from clients import BATCH_SIZE, chunked, rpc_batch
+
+CHAIN_ID = 11155111
+ZERO_HASH = "0x" + "00" * 32
+
+
+def account(index):
+    return "0x" + keccak(b"account" + index.to_bytes(4, "big"))[-20:].hex()
+
+
+def decode_transaction(raw):
+    # Fields of a signed raw transaction, typed (EIP-2718) or legacy
+    if raw[0] <= 0x7f:
+        return TypedTransaction.from_bytes(HexBytes(raw)).as_dict()
+    return rlp.decode(raw, Transaction).as_dict()
+
+
+def block_hash(number, fork=0):
+    # fork > 0 gives the hash of the same height on a reorged branch
+    return "0x" + keccak(b"block" + number.to_bytes(8, "big") + (fork.to_bytes(4, "big") if fork else b"")).hex()
+
+
+class StubChain:
+    def __init__(self, block_number=1000, latency=0.0, block_time=0.0, txs_per_block=5, accounts=50,
+                 fail_rate=0.0, rate_limit=None, tail_rate=0.0, tail_latency=0.0, min_tip=0, seed=None):
+        self.start_block = block_number
+        self.txs_per_block = txs_per_block  # synthetic transactions in every block
+        self.accounts = accounts  # size of the synthetic sender/recipient population
+        self.tx_index = {}  # synthetic tx hash -> (block number, index)
+        self.latency = latency  # seconds added to every HTTP round trip
+        self.block_time = block_time  # seconds per block, 0 keeps the head fixed
+        # Fault injection for router tests: share of requests answered 500, HTTP
+        # requests per second before 429s, and share of requests slowed to tail_latency
+        self.fail_rate = fail_rate
+        self.rate_limit = rate_limit
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.random = random.Random(seed)  # a fixed seed makes injected faults repeatable
+        self.window = (0, 0)  # (second, requests seen in it) for rate_limit
+        self.started = time.monotonic()
+        self.balances = {}
+        self.sent = {}  # tx hash -> (sender, block it was submitted in)
+        # Mempool model for replacement tests: sent transactions paying a
+        # priority fee below min_tip are never mined, and a second transaction
+        # for the same (sender, nonce) replaces the first only with a 10% bump
+        self.min_tip = min_tip
+        self.slots = {}  # lowercase sender -> {nonce: hash currently holding that nonce}
+        self.fees = {}  # tx hash -> (priority fee, max fee)
+        self.calls = {}  # JSON-RPC method -> calls answered, batch entries counted one by one
+        self.round_trips = 0  # HTTP requests received
+        self.fork_points = []  # first block of every simulated reorg, see reorg()
+        self.lock = threading.Lock()
+
+    @property
+    def block_number(self):
+        if not self.block_time:
+            return self.start_block
+        return self.start_block + int((time.monotonic() - self.started) / self.block_time)
+
+    def fault(self):
+        # HTTP status to answer this request with instead of a result, or None
+        if self.rate_limit is not None:
+            with self.lock:
+                second = int(time.monotonic())
+                count = self.window[1] + 1 if self.window[0] == second else 1
+                self.window = (second, count)
+            if count > self.rate_limit:
+                return 429
+        if self.fail_rate and self.random.random() < self.fail_rate:
+            return 500
+        return None
+
+    def delay(self):
+        if self.tail_rate and self.random.random() < self.tail_rate:
+            return self.tail_latency
+        return self.latency
+
+    def mine(self, count=1):
+        with self.lock:
+            self.start_block += count
+
+    def reorg(self, depth, extend=0):
+        # Replace the last `depth` blocks with a new branch (different hashes
+        # and transactions) that is `extend` blocks longer than the old one
+        with self.lock:
+            self.fork_points.append(self.block_number - depth + 1)
+            self.start_block += extend
+
+    def fork(self, number):
+        return sum(1 for point in self.fork_points if point <= number)
+
+    def hash_of(self, number):
+        return block_hash(number, self.fork(number))
+
+    def submit(self, raw):
+        tx = decode_transaction(raw)
+        tx_hash = "0x" + keccak(raw).hex()
+        sender = Account.recover_transaction(raw)
+        max_fee = tx.get("maxFeePerGas", tx.get("gasPrice"))
+        tip = tx.get("maxPriorityFeePerGas", max_fee)
+        with self.lock:
+            if tx_hash in self.sent:
+                raise ValueError("already known")
+            slots = self.slots.setdefault(sender.lower(), {})
+            current = slots.get(tx["nonce"])
+            if current is not None:
+                if self.receipt(current) is not None:
+                    raise ValueError("nonce too low")
+                old_tip, old_max_fee = self.fees[current]
+                if tip * 10 < old_tip * 11 or max_fee * 10 < old_max_fee * 11:
+                    raise ValueError("replacement transaction underpriced")
+                del self.sent[current]
+            slots[tx["nonce"]] = tx_hash
+            self.fees[tx_hash] = (tip, max_fee)
+            self.sent[tx_hash] = (sender, self.block_number)
+        return tx_hash
+
+    def transaction_count(self, address, tag):
+        # Next nonce: past the highest mined transaction, or past the highest
+        # one in the mempool for "pending"
+        with self.lock:
+            slots = dict(self.slots.get(address.lower(), {}))
+        nonces = [n for n, h in slots.items() if tag == "pending" or self.receipt(h) is not None]
+        return max(nonces) + 1 if nonces else 0
+
+    def receipt(self, tx_hash):
+        sender, submitted = self.sent[tx_hash]
+        block_number = submitted + 1
+        if block_number > self.block_number:
+            return None
+        tip, max_fee = self.fees.get(tx_hash, (0, None))
+        if max_fee is not None and min(tip, max_fee - self.base_fee(block_number)) < self.min_tip:
+            return None
+        return {
+            "transactionHash": tx_hash, "transactionIndex": "0x0",
+            "blockHash": self.hash_of(block_number),
+            "blockNumber": hex(block_number), "from": sender, "to": None,
+            "cumulativeGasUsed": hex(21000), "gasUsed": hex(21000),
+            "effectiveGasPrice": hex(50 * 10**9), "contractAddress": None,
+            "logs": [], "logsBloom": "0x" + "00" * 256, "status": "0x1", "type": "0x0",
+        }
+
+    def chain_tx(self, number, index):
+        # Deterministic synthetic transfer between two accounts of the population
+        fork = self.fork(number)
+        seed = keccak(number.to_bytes(8, "big") + index.to_bytes(4, "big") + (fork.to_bytes(4, "big") if fork else b""))
+        tx_hash = "0x" + seed.hex()
+        self.tx_index[tx_hash] = (number, index)
+        return {
+            "hash": tx_hash, "blockHash": self.hash_of(number), "blockNumber": hex(number),
+            "transactionIndex": hex(index), "from": account(seed[0] % self.accounts),
+            "to": account(seed[1] % self.accounts), "value": hex(int.from_bytes(seed[2:6], "big") * 10**9),
+            "gas": hex(21000), "gasPrice": hex(50 * 10**9), "nonce": hex(number), "input": "0x",
+            "type": "0x0", "chainId": hex(CHAIN_ID), "v": "0x0", "r": ZERO_HASH, "s": ZERO_HASH,
+        }
+
+    def block(self, number, full_transactions):
+        if number > self.block_number:
+            return None
+        transactions = [self.chain_tx(number, i) for i in range(self.txs_per_block)]
+        return {
+            "number": hex(number), "hash": self.hash_of(number),
+            "parentHash": self.hash_of(number - 1) if number else ZERO_HASH,
+            "nonce": "0x0000000000000000", "sha3Uncles": ZERO_HASH, "logsBloom": "0x" + "00" * 256,
+            "transactionsRoot": ZERO_HASH, "stateRoot": ZERO_HASH, "receiptsRoot": ZERO_HASH,
+            "miner": account(0), "difficulty": "0x0", "totalDifficulty": "0x0", "extraData": "0x",
+            "size": hex(1000), "gasLimit": hex(30000000), "gasUsed": hex(21000 * len(transactions)),
+            "timestamp": hex(1700000000 + number * 12), "baseFeePerGas": hex(self.base_fee(number)), "uncles": [],
+            "transactions": transactions if full_transactions else [tx["hash"] for tx in transactions],
+        }
+
+    def base_fee(self, number):
+        # Deterministic base fee that wanders between 1 and about 2 gwei
+        return 10**9 + keccak(b"basefee" + number.to_bytes(8, "big"))[0] * 4 * 10**6
+
+    def tips(self, number, percentiles):
+        # Priority fees paid in a block at the given percentiles, rising with the percentile
+        seed = keccak(b"tips" + number.to_bytes(8, "big"))[0]
+        return [hex((seed + int(p) * 20) * 10**6) for p in percentiles]
+
+    def fee_history(self, count, newest, percentiles):
+        newest = min(newest, self.block_number)
+        oldest = max(0, newest - count + 1)
+        numbers = range(oldest, newest + 1)
+        return {
+            "oldestBlock": hex(oldest),
+            "baseFeePerGas": [hex(self.base_fee(n)) for n in numbers] + [hex(self.base_fee(newest + 1))],
+            "gasUsedRatio": [0.5 for _ in numbers],
+            "reward": [self.tips(n, percentiles) for n in numbers],
+        }
+
+    def chain_receipt(self, tx_hash):
+        number, index = self.tx_index[tx_hash]
+        tx = self.chain_tx(number, index)
+        return {
+            "transactionHash": tx_hash, "transactionIndex": hex(index),
+            "blockHash": self.hash_of(number), "blockNumber": hex(number), "from": tx["from"], "to": tx["to"],
+            "cumulativeGasUsed": hex(21000 * (index + 1)), "gasUsed": hex(21000),
+            "effectiveGasPrice": hex(50 * 10**9), "contractAddress": None, "logs": [],
+            "logsBloom": "0x" + "00" * 256, "status": "0x0" if bytes.fromhex(tx_hash[2:])[6] % 20 == 0 else "0x1",
+            "type": "0x0",
+        }
+
+    def parse_block(self, tag):
+        if isinstance(tag, int):
+            return tag
+        if tag in ("latest", "pending"):
+            return self.block_number
+        if tag in ("safe", "finalized"):
+            return max(0, self.block_number - 64)
+        if tag == "earliest":
+            return 0
+        return int(tag, 16)
+
+    def handle(self, method, params):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "web3_clientVersion":
+            return "rpc-stub/1.0"
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "eth_blockNumber":
+            return hex(self.block_number)
+        if method == "eth_gasPrice":
+            return hex(50 * 10**9)
+        if method == "eth_maxPriorityFeePerGas":
+            return self.tips(self.block_number, [50])[0]
+        if method == "eth_feeHistory":
+            return self.fee_history(int(params[0], 16) if isinstance(params[0], str) else params[0],
+                                    self.parse_block(params[1]), params[2] if len(params) > 2 else [])
+        if method == "eth_estimateGas":
+            data = params[0].get("data") or params[0].get("input") or "0x"
+            return hex(21000 + 16 * (len(data) - 2) // 2 + (30000 if len(data) > 2 else 0))
+        if method == "eth_getBalance":
+            return hex(self.balances.get(params[0].lower(), 10**18))
+        if method == "eth_getTransactionCount":
+            return hex(self.transaction_count(params[0], params[1] if len(params) > 1 else "latest"))
+        if method == "eth_sendRawTransaction":
+            return self.submit(bytes.fromhex(params[0][2:]))
+        if method == "eth_getTransactionByHash":
+            return None if params[0] not in self.sent else {"hash": params[0], "from": self.sent[params[0]][0]}
+        if method == "eth_getTransactionReceipt":
+            if params[0] in self.tx_index:
+                return self.chain_receipt(params[0])
+            return self.receipt(params[0]) if params[0] in self.sent else None
+        if method == "eth_getBlockReceipts":
+            block = self.block(self.parse_block(params[0]), True)
+            return None if block is None else [self.chain_receipt(tx["hash"]) for tx in block["transactions"]]
+        if method == "eth_getBlockByNumber":
+            return self.block(self.parse_block(params[0]), params[1])
+        raise KeyError(method)
+
+    def dispatch(self, request):
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            response["result"] = self.handle(request["method"], request.get("params", []))
+        except KeyError:
+            response["error"] = {"code": -32601, "message": f"Method {request.get('method')} not found"}
+        except ValueError as e:
+            response["error"] = {"code": -32000, "message": str(e)}
+        return response
+
+
+class FixtureChain(StubChain):
+    # Replays blocks and receipts recorded from a real chain (see record_fixture)
+    def __init__(self, path, latency=0.0):
+        super().__init__(latency=latency)
+        with open(path) as f:
+            fixture = json.load(f)
+        self.start_block = fixture["head"]
+        self.blocks = {int(n): block for n, block in fixture["blocks"].items()}
+        self.receipts = fixture["receipts"]
+        self.tx_index = {tx_hash: None for tx_hash in self.receipts}
+
+    def block(self, number, full_transactions):
+        block = self.blocks.get(number)
+        if block is None or full_transactions:
+            return block
+        return dict(block, transactions=[tx["hash"] for tx in block["transactions"]])
+
+    def chain_receipt(self, tx_hash):
+        return self.receipts[tx_hash]
+
+
+def record_fixture(infura_project_id, start_block, end_block, path):
+    # Save raw blocks and receipts from any endpoint so FixtureChain can replay them offline
+    def batched(calls):
+        results = []
+        for part in chunked(calls, BATCH_SIZE):
+            results.extend(rpc_batch(infura_project_id, part))
+        return results
+
+    numbers = list(range(start_block, end_block + 1))
+    blocks = batched([("eth_getBlockByNumber", [hex(n), True]) for n in numbers])
+    hashes = [tx["hash"] for block in blocks for tx in block["transactions"]]
+    receipts = batched([("eth_getTransactionReceipt", [h]) for h in hashes])
+    with open(path, "w") as f:
+        json.dump({
+            "head": end_block,
+            "blocks": {n: block for n, block in zip(numbers, blocks)},
+            "receipts": dict(zip(hashes, receipts)),
+        }, f)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can hold keep-alive connections open
+    protocol_version = "HTTP/1.1"
+    # Buffer the response so headers and body leave in one segment
+    wbufsize = -1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        payload = json.loads(body)
+        chain = self.server.chain
+        with chain.lock:
+            chain.round_trips += 1
+        delay = chain.delay()
+        if delay:
+            time.sleep(delay)
+        status = chain.fault()
+        if status is not None:
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        if isinstance(payload, list):
+            result = [self.server.chain.dispatch(request) for request in payload]
+        else:
+            result = self.server.chain.dispatch(payload)
+        data = json.dumps(result).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(chain=None, host="127.0.0.1", port=0):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.chain = chain or StubChain()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+async def _ws_session(chain, ws, poll_interval):
+    # eth_subscribe("newHeads") pushes the head whenever its number or hash
+    # changes; every other method is answered like the HTTP endpoint
+    subscription = None
+    last_head = None
+
+    async def push_heads():
+        nonlocal last_head
+        while True:
+            number = chain.block_number
+            head = (number, chain.hash_of(number))
+            if head != last_head:
+                last_head = head
+                header = dict(chain.block(number, False), transactions=None)
+                await ws.send(json.dumps({
+                    "jsonrpc": "2.0", "method": "eth_subscription",
+                    "params": {"subscription": subscription, "result": header},
+                }))
+            await asyncio.sleep(poll_interval)
+
+    pusher = None
+    try:
+        async for message in ws:
+            request = json.loads(message)
+            if request.get("method") == "eth_subscribe" and request["params"][0] == "newHeads":
+                subscription = "0x1"
+                last_head = (chain.block_number, chain.hash_of(chain.block_number))
+                await ws.send(json.dumps({"jsonrpc": "2.0", "id": request.get("id"), "result": subscription}))
+                pusher = pusher or asyncio.ensure_future(push_heads())
+            else:
+                await ws.send(json.dumps(chain.dispatch(request)))
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        if pusher is not None:
+            pusher.cancel()
+
+
+def serve_ws(chain=None, host="127.0.0.1", port=0, poll_interval=0.05):
+    # WebSocket JSON-RPC stand-in with newHeads subscriptions; server.drop()
+    # from any thread cuts every open connection, simulating a provider outage
+    chain = chain or StubChain()
+    loop = asyncio.new_event_loop()
+
+    async def start():
+        return await websockets.serve(lambda ws, path: _ws_session(chain, ws, poll_interval), host, port)
+
+    server = loop.run_until_complete(start())
+    server.chain = chain
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    server.drop = lambda: loop.call_soon_threadsafe(lambda: [ws.transport.abort() for ws in list(server.websockets)])
+    return server, f"ws://{host}:{server.sockets[0].getsockname()[1]}"
+
+
+if __name__ == "__main__":
+    # python rpc_stub.py [port] [latency_seconds] [--block-time S] [--fail-rate P] ...
+    # then point any script at it with RPC_URL_TEMPLATE=http://127.0.0.1:8545
+    parser = argparse.ArgumentParser()
+    parser.add_argument("port", type=int, nargs="?", default=8545)
+    parser.add_argument("latency", type=float, nargs="?", default=0.0, help="seconds added to every round trip")
+    parser.add_argument("--block", type=int, default=1000, help="head block number at start-up")
+    parser.add_argument("--block-time", type=float, default=12.0, help="seconds per block, 0 keeps the head fixed")
+    parser.add_argument("--txs-per-block", type=int, default=5)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit", type=int, help="requests per second before HTTP 429s")
+    parser.add_argument("--min-tip", type=int, default=0, help="wei; sent transactions tipping less are never mined")
+    parser.add_argument("--seed", type=int, help="seed for injected faults")
+    parser.add_argument("--ws-port", type=int, help="also serve newHeads subscriptions over WebSocket")
+    args = parser.parse_args()
+
+    chain = StubChain(block_number=args.block, latency=args.latency, block_time=args.block_time,
+                      txs_per_block=args.txs_per_block, fail_rate=args.fail_rate, rate_limit=args.rate_limit,
+                      min_tip=args.min_tip, seed=args.seed)
+    server, url = serve(chain, port=args.port)
+    print(f"JSON-RPC stub listening on {url}")
+    if args.ws_port is not None:
+        print(f"WebSocket endpoint on {serve_ws(chain, port=args.ws_port)[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
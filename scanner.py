@@ -0,0 +1,152 @@
+# parallel, batched block range scanner shared by the history scripts
+
+import os
+
+from web3 import Web3
+
+from blockstore import compact_block, compact_receipt, get_block_store
+from cache import get_chain_id, get_finalized_block
+from clients import RPCError, chunked, ordered_map, rpc_batch
+
+BLOCK_BATCH = int(os.environ.get("SCAN_BLOCK_BATCH", 10))  # full blocks per JSON-RPC batch
+SCAN_WINDOW = int(os.environ.get("SCAN_WINDOW", 4))  # block batches in flight at once
+
+
+def address_key(address):
+    # 20-byte key for an address in any hex casing
+    return bytes.fromhex(address[2:])
+
+
+def address_matcher(addresses):
+    # Normalize once into a set of 20-byte keys; each transaction then costs
+    # two hex decodes and two set lookups, however many addresses are watched
+    wanted = frozenset(address_key(address) for address in addresses)
+
+    def match(tx):
+        return address_key(tx["from"]) in wanted or (tx["to"] is not None and address_key(tx["to"]) in wanted)
+
+    return match
+
+
+def fetch_blocks(infura_project_id, block_numbers):
+    # Full blocks for the given numbers, in order; blocks that fail come back
+    # as None. Finalized blocks are read through the on-disk store.
+    store = get_block_store()
+    cached = {}
+    if store is not None:
+        chain_id = get_chain_id(infura_project_id)
+        finalized = get_finalized_block(infura_project_id)
+        cached = store.get_blocks(chain_id, [n for n in block_numbers if n <= finalized])
+
+    missing = [n for n in block_numbers if n not in cached]
+    results = rpc_batch(infura_project_id, [("eth_getBlockByNumber", [hex(n), True]) for n in missing])
+    fetched = {}
+    for block_number, result in zip(missing, results):
+        if isinstance(result, RPCError) or result is None:
+            print(f"Error fetching block {block_number}: {result}")
+        else:
+            fetched[block_number] = compact_block(result)
+    if store is not None:
+        store.put_blocks(chain_id, [block for n, block in fetched.items() if n <= finalized])
+
+    return [cached.get(n) or fetched.get(n) for n in block_numbers]
+
+
+def fetch_receipts(infura_project_id, transactions):
+    # Receipts keyed by hash for the given transactions, read through the store
+    store = get_block_store()
+    tx_hashes = [tx["hash"] for tx in transactions]
+    cached = {}
+    if store is not None:
+        chain_id = get_chain_id(infura_project_id)
+        finalized = get_finalized_block(infura_project_id)
+        cached = store.get_receipts(chain_id, tx_hashes)
+
+    missing = [h for h in tx_hashes if h not in cached]
+    results = rpc_batch(infura_project_id, [("eth_getTransactionReceipt", [h]) for h in missing])
+    fetched = {h: compact_receipt(r) for h, r in zip(missing, results) if r and not isinstance(r, RPCError)}
+    if store is not None:
+        store.put_receipts(chain_id, [r for r in fetched.values() if int(r["blockNumber"], 16) <= finalized])
+
+    return {**cached, **fetched}
+
+
+def fetch_block_receipts(infura_project_id, blocks):
+    # Every receipt of the given blocks, keyed by hash: stored ones from disk,
+    # the rest with one eth_getBlockReceipts per block in a single batch.
+    # Blocks the provider can't serve that way fall back to per-hash lookups.
+    store = get_block_store()
+    cached = {}
+    if store is not None:
+        chain_id = get_chain_id(infura_project_id)
+        finalized = get_finalized_block(infura_project_id)
+        cached = store.get_receipts(chain_id, [tx["hash"] for block in blocks for tx in block["transactions"]])
+
+    wanted = [b for b in blocks if any(tx["hash"] not in cached for tx in b["transactions"])]
+    results = rpc_batch(infura_project_id, [("eth_getBlockReceipts", [b["number"]]) for b in wanted])
+    fetched = {}
+    fallback = []
+    for block, result in zip(wanted, results):
+        if isinstance(result, RPCError) or result is None:
+            fallback.extend(tx for tx in block["transactions"] if tx["hash"] not in cached)
+        else:
+            fetched.update((r["transactionHash"], compact_receipt(r)) for r in result)
+    if store is not None:
+        store.put_receipts(chain_id, [r for r in fetched.values() if int(r["blockNumber"], 16) <= finalized])
+
+    receipts = {**cached, **fetched}
+    if fallback:
+        receipts.update(fetch_receipts(infura_project_id, fallback))
+    return receipts
+
+
+def transaction_details(tx, receipt):
+    return {
+        "blockNumber": int(tx["blockNumber"], 16),
+        "from": Web3.to_checksum_address(tx["from"]),
+        "to": Web3.to_checksum_address(tx["to"]) if tx["to"] else None,
+        "value": Web3.from_wei(int(tx["value"], 16), "ether"),
+        "hash": tx["hash"],
+        "gasUsed": int(receipt["gasUsed"], 16) if receipt else None,
+        "status": int(receipt["status"], 16) if receipt else None,
+    }
+
+
+def scan_chunk(infura_project_id, block_numbers, match, reverse=False, details=transaction_details):
+    # One batch for the blocks, one batch for the receipts of whatever matched;
+    # `details` turns each (transaction, receipt) into the row that is returned
+    matched = []
+    for block in fetch_blocks(infura_project_id, block_numbers):
+        if block is None:
+            continue
+        transactions = block["transactions"]
+        matched.extend(tx for tx in (reversed(transactions) if reverse else transactions) if match(tx))
+    if not matched:
+        return []
+    receipts = fetch_receipts(infura_project_id, matched)
+    return [details(tx, receipts.get(tx["hash"])) for tx in matched]
+
+
+def scan_blocks(infura_project_id, start_block, end_block, match, reverse=False,
+                window=SCAN_WINDOW, batch_size=BLOCK_BATCH, details=transaction_details):
+    # Yield matching transactions in block order (newest first when reverse),
+    # keeping `window` batches in flight. Closing the generator early stops
+    # further batches from being requested.
+    if reverse:
+        block_numbers = range(end_block, start_block - 1, -1)
+    else:
+        block_numbers = range(start_block, end_block + 1)
+
+    def work(chunk):
+        return scan_chunk(infura_project_id, chunk, match, reverse, details)
+
+    for rows in ordered_map(work, chunked(block_numbers, batch_size), window):
+        yield from rows
+
+
+def find_latest(infura_project_id, addresses, start_block, end_block, **kwargs):
+    matches = scan_blocks(infura_project_id, start_block, end_block, address_matcher(addresses), reverse=True, **kwargs)
+    try:
+        return next(matches, None)
+    finally:
+        matches.close()
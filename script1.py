@@ -1,8 +1,38 @@
-from flask import Flask, request, jsonify
+import json
+import time
+
+from flask import Flask, Response, request, jsonify, stream_with_context
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
 from eth_account import Account
 
-app = Flask(__name__)
+from analytics import DEFAULT_BUCKETS, wallet_stats
+from balances import block_param, iter_balances
+from cache import get_balance as cached_balance, get_chain_id
+from clients import get_web3, is_connected
+from export import MIMETYPES, check_format, iter_export
+from fees import SPEEDS, estimate_gas, max_cost, quote_fees
+from indexer import start_follower
+from metrics import instrument_flask, render as render_metrics
+from nonces import get_nonce_manager, sign_and_send, sign_and_send_batch
+from receipts import REPLACE_STUCK, get_tracker
+from router import RateLimitedError
+from signing import recover_senders
+from wallets import iter_wallets
+
+app = instrument_flask(Flask(__name__))
+
+RECEIPT_TIMEOUT = 120  # seconds a blocking /send_transaction waits for its receipt
+MAX_LONG_POLL = 60  # upper bound on ?wait= for /transaction/<hash>
+MAX_VERIFY_BATCH = 10000  # raw transactions accepted per /verify call
+MAX_BALANCE_BATCH = 10000  # addresses accepted per /get-wallet-balances call
+MAX_WALLET_BATCH = 100000  # wallets generated per /get-wallets call
+MAX_SEND_BATCH = 1000  # payments accepted per /send_transactions call
+DEFAULT_HISTORY_LIMIT = 100  # transactions returned by /transactions/<address> without ?limit=
+MAX_HISTORY_LIMIT = 1000
+DEFAULT_STATS_BLOCKS = 1000  # blocks summarised by /wallet-stats/<address> without a range
+MAX_STATS_BLOCKS = 50000  # widest block range one /wallet-stats call may scan
+MAX_EXPORT_ADDRESSES = 1000  # addresses one /export call may match
 
 @app.route('/connect', methods=['POST'])
 def connect_to_infura():
@@ -14,33 +44,22 @@ def connect_to_infura():
 
         infura_project_id = data['infura_project_id']
 
-        # Connect to the Ethereum node via Infura
-        web3 = Web3(Web3.HTTPProvider(f"https://sepolia.infura.io/v3/{infura_project_id}"))
-
         # Check if the connection to the node was successful
-        if web3.is_connected():
+        if is_connected(infura_project_id):
             return jsonify({"message": "Successfully connected to Infura."}), 200
         else:
             return jsonify({"error": "Failed to connect to Infura."}), 500
 
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route('/get-wallet', methods=['POST'])
 def create_and_send_wallet():
     try:
-        # Parse the JSON body to get the Infura project ID
-        data = request.get_json()
-        if not data or 'infura_project_id' not in data:
-            return jsonify({"error": "Missing 'infura_project_id' in request body"}), 400
-
-        infura_project_id = data['infura_project_id']
-
-        # Connect to the Ethereum node via Infura
-        web3 = Web3(Web3.HTTPProvider(f"https://sepolia.infura.io/v3/{infura_project_id}"))
-
-        # Generate a new Ethereum account
-        account = web3.eth.account.create()
+        # Key generation is offline; an 'infura_project_id' in the body is accepted but not needed
+        account = Account.create()
 
         # Check if account is created successfully
         if account and account.address and account._private_key:
@@ -51,6 +70,32 @@ def create_and_send_wallet():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
             
+@app.route('/get-wallets', methods=['GET'])
+def create_wallets():
+    # Stream ?count=N new wallets as NDJSON (default) or CSV (?format=csv),
+    # generated offline on the process pool
+    try:
+        count = int(request.args.get('count', 1))
+    except ValueError:
+        return jsonify({"error": "'count' must be an integer"}), 400
+    if not 1 <= count <= MAX_WALLET_BATCH:
+        return jsonify({"error": f"'count' must be between 1 and {MAX_WALLET_BATCH}"}), 400
+    output_format = request.args.get('format', 'ndjson')
+    if output_format not in ('ndjson', 'csv'):
+        return jsonify({"error": "'format' must be 'ndjson' or 'csv'"}), 400
+
+    def generate():
+        if output_format == 'csv':
+            yield "address,private_key\n"
+        for wallet in iter_wallets(count):
+            if output_format == 'csv':
+                yield f"{wallet['address']},{wallet['private_key']}\n"
+            else:
+                yield json.dumps(wallet) + "\n"
+
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    return Response(generate(), mimetype=mimetype, headers={'Cache-Control': 'no-store'})
+
 @app.route('/get-wallet-balance', methods=['POST'])
 def get_balance():
     try:
@@ -64,17 +109,56 @@ def get_balance():
         infura_project_id = data['infura_project_id']
         sender_address = data['sender_address']
             
-        web3 = Web3(Web3.HTTPProvider(f"https://sepolia.infura.io/v3/{infura_project_id}"))
+        web3 = get_web3(infura_project_id)
         
-        if not web3.is_connected():
+        if not is_connected(infura_project_id):
             print("Error: Unable to connect to the Ethereum network.")
             return jsonify({"error": "Cannot connect to Ethereum network"}), 400
 
-        balance = web3.eth.get_balance(sender_address)
+        # Served from the block-keyed cache until the chain head advances
+        balance = cached_balance(infura_project_id, sender_address)
         eth_balance = web3.from_wei(balance, 'ether')
         eth_balance_float = float(eth_balance)
         return jsonify({"balance": eth_balance_float}), 200
             
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/get-wallet-balances', methods=['POST'])
+def get_balances():
+    try:
+        # Parse the JSON body to get the Infura project ID and the address list
+        data = request.get_json()
+        if not data or 'infura_project_id' not in data:
+            return jsonify({"error": "Missing 'infura_project_id' in request body"}), 400
+        if not isinstance(data.get('addresses'), list):
+            return jsonify({"error": "Missing 'addresses' list in request body"}), 400
+        if len(data['addresses']) > MAX_BALANCE_BATCH:
+            return jsonify({"error": f"At most {MAX_BALANCE_BATCH} addresses per request"}), 400
+
+        infura_project_id = data['infura_project_id']
+        addresses = data['addresses']
+        # Pin every chunk to the given block, or to the current head by default
+        block = data.get('block')
+        if block is not None:
+            block = block_param(block)
+
+        # Stream one JSON object per line as each batch comes back
+        def generate():
+            try:
+                for row in iter_balances(infura_project_id, addresses, block):
+                    yield json.dumps(row) + "\n"
+            except Exception as e:
+                yield json.dumps({"error": str(e)}) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -89,66 +173,6 @@ def is_valid_private_key(private_key):
     except ValueError:
         return False
 
-def verify_signature(infura_project_id, sender_private_key, receiver_address):
-    # Connect to Sepolia testnet using Infura
-    web3 = Web3(Web3.HTTPProvider(f'https://sepolia.infura.io/v3/{infura_project_id}'))
-
-    if not web3.is_connected():
-        return jsonify({'error': 'Failed to connect to Ethereum node. Please check your connection.'}), 500
-
-    # Validate sender private key and receiver address
-    if not is_valid_private_key(sender_private_key):
-        return jsonify({'error': 'Invalid sender private key.'}), 400
-
-    sender_account = Account.from_key(sender_private_key)
-
-    if not is_valid_address(receiver_address):
-        return jsonify({'error': 'Invalid receiver address.'}), 400
-
-    try:
-        # Transaction details
-        transaction = {
-            'to': receiver_address,
-            'value': web3.to_wei(0.01, 'ether'),  # Sending 0.01 ETH
-            'gas': 21000,
-            'gasPrice': web3.eth.gas_price,
-            'nonce': web3.eth.get_transaction_count(sender_account.address),
-            'chainId': web3.eth.chain_id
-        }
-
-        # Sign the transaction
-        signed_txn = web3.eth.account.sign_transaction(transaction, sender_private_key)
-
-        # Recover the sender's address from the signature
-        recovered_address = web3.eth.account.recover_transaction(signed_txn.rawTransaction)
-
-        # Check if the recovered address matches the sender's address
-        if recovered_address.lower() == sender_account.address.lower():
-            is_valid_signature = True
-        else:
-            is_valid_signature = False
-
-        '''
-        # Check if the sender has sufficient balance
-        sender_balance = web3.eth.get_balance(recovered_address)
-        has_sufficient_balance = sender_balance >= transaction['value'] + (transaction['gas'] * transaction['gasPrice'])
-        
-        response = {
-            'transaction_hash': web3.to_hex(signed_txn.hash),
-            'recovered_address': recovered_address,
-            'sender_address': sender_account.address,
-            'is_valid_signature': is_valid_signature,
-            'has_sufficient_balance': has_sufficient_balance
-        }'''
-
-        return is_valid_signature
-
-    except ValueError as e:
-        return False
-    except Exception as e:
-        return False
-        
-
 @app.route('/send_transaction', methods=['POST'])
 def send_transaction():
     try:
@@ -159,26 +183,38 @@ def send_transaction():
         private_key = data['private_key']
         eth_amount = data['eth_amount']
         recipient_address = data['recipient_address']
+        speed = data.get('speed', 'normal')
+
+        # Validate sender private key and receiver address
+        if not is_valid_private_key(private_key):
+            return jsonify({'error': 'Invalid sender private key.'}), 400
+        if not is_valid_address(recipient_address):
+            return jsonify({'error': 'Invalid receiver address.'}), 400
+        if speed not in SPEEDS:
+            return jsonify({'error': f"'speed' must be one of {', '.join(SPEEDS)}"}), 400
         
-        # Infura URL
-        infura_url = f"https://sepolia.infura.io/v3/{infura_project_id}"
-
-        # Connect to Infura
-        web3 = Web3(Web3.HTTPProvider(infura_url))
+        # Reuse the pooled Infura client
+        web3 = get_web3(infura_project_id)
 
         # Check connection
-        if not web3.is_connected():
+        if not is_connected(infura_project_id):
             return jsonify({'error': 'Failed to connect to Infura'}), 500
 
-        # Transaction details
-        value_to_send = web3.to_wei(eth_amount, 'ether')
-        gas_limit = 21000  # Standard gas limit for ETH transfer
-        gas_price = web3.to_wei('50', 'gwei')
-        chain_id = 11155111  # Sepolia chain ID
+        # Transaction details: type-2 fees for the requested speed from the
+        # shared fee oracle, gas estimated only when the transfer carries data
+        tx = {
+            'to': Web3.to_checksum_address(recipient_address),
+            'value': web3.to_wei(eth_amount, 'ether'),
+            'chainId': get_chain_id(infura_project_id)  # from the configured node, cached for the process
+        }
+        if data.get('data'):
+            tx['data'] = data['data']
+        tx['gas'] = estimate_gas(infura_project_id, tx, sender_address)
+        tx.update(quote_fees(infura_project_id, speed))
 
-        # Get sender's balance
-        balance = web3.eth.get_balance(sender_address)
-        total_tx_cost = value_to_send + (gas_limit * gas_price)
+        # Get sender's balance as of the current head
+        balance = cached_balance(infura_project_id, sender_address)
+        total_tx_cost = max_cost(tx)
 
         # Check if the balance is sufficient
         if balance < total_tx_cost:
@@ -188,43 +224,326 @@ def send_transaction():
                 'required_balance': float(web3.from_wei(total_tx_cost, 'ether'))
             }), 400
 
-        nonce = web3.eth.get_transaction_count(sender_address)
-        tx = {
-            'nonce': nonce,
-            'to': recipient_address,
-            'value': value_to_send,
-            'gas': gas_limit,
-            'gasPrice': gas_price,
-            'chainId': chain_id
-        }
-
-        # Sign the transaction
-        signed_tx = web3.eth.account.sign_transaction(tx, private_key)
+        # Sign with a locally allocated nonce and send the transaction, then
+        # hand the hash to the background receipt tracker. With 'replace_stuck'
+        # it also speeds the transaction up under the same nonce if it sits unmined
+        tx_hash, signed_tx, nonce = sign_and_send(web3, get_nonce_manager(infura_project_id), sender_address, tx, private_key)
+        tracker = get_tracker(infura_project_id)
+        replace_key = private_key if data.get('replace_stuck', REPLACE_STUCK) else None
+        tx_hash = tracker.track(tx_hash, sender_address, dict(tx, nonce=nonce), replace_key, speed)
 
-        # Send the transaction
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        # Non-blocking mode: return right away, status is served by /transaction/<hash>
+        if not data.get('wait_for_receipt', True):
+            return jsonify({'status': 'pending', 'transaction_hash': tx_hash}), 202
 
         # Wait for the transaction receipt
-        tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-
-        # Check if the transaction was successful and tx signature is verified
-        if tx_receipt.status == 1 and verify_signature(infura_project_id, private_key, recipient_address):
-            updated_balance = web3.eth.get_balance(sender_address)
-            return jsonify({
+        record = tracker.wait(tx_hash, RECEIPT_TIMEOUT)
+        if record['status'] == 'pending':
+            return jsonify({'error': 'Timed out waiting for the transaction receipt',
+                            'transaction_hash': record['transaction_hash']}), 504
+
+        # Check if the transaction was successful (the signature was verified before sending).
+        # After a speed-up the mined hash differs from the one first returned.
+        if record['status'] == 'success':
+            response = {
                 'status': 'success',
-                'transaction_hash': web3.to_hex(tx_hash),
-                'block_number': tx_receipt.blockNumber,
-                'updated_balance': float(web3.from_wei(updated_balance, 'ether'))
-            })
+                'transaction_hash': record['transaction_hash'],
+                'block_number': record['block_number'],
+                'updated_balance': record['updated_balance']
+            }
+            if 'replaced_hashes' in record:
+                response['replaced_hashes'] = record['replaced_hashes']
+            return jsonify(response)
 
         else:
             return jsonify({'error': 'Transaction failed'}), 500
 
     except ValueError as e:
         return jsonify({'error': f'Transaction failed: {str(e)}', 'message': 'Error 400'}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
 
+@app.route('/send_transactions', methods=['POST'])
+def send_transactions():
+    try:
+        data = request.json
+        infura_project_id = data['infura_project_id']
+        sender_address = data['sender_address']
+        private_key = data['private_key']
+        payments = data.get('payments')
+        speed = data.get('speed', 'normal')
+
+        if not is_valid_private_key(private_key):
+            return jsonify({'error': 'Invalid sender private key.'}), 400
+        if speed not in SPEEDS:
+            return jsonify({'error': f"'speed' must be one of {', '.join(SPEEDS)}"}), 400
+        if not isinstance(payments, list) or not payments:
+            return jsonify({'error': "Missing 'payments' list of {recipient_address, eth_amount}"}), 400
+        if len(payments) > MAX_SEND_BATCH:
+            return jsonify({'error': f'At most {MAX_SEND_BATCH} payments per request'}), 400
+        malformed = [i for i, p in enumerate(payments) if not isinstance(p, dict) or p.get('eth_amount') is None]
+        if malformed:
+            return jsonify({'error': "Each payment must be an object with 'recipient_address' and 'eth_amount'",
+                            'payments': malformed}), 400
+        invalid = [p.get('recipient_address') for p in payments if not is_valid_address(p.get('recipient_address'))]
+        if invalid:
+            return jsonify({'error': 'Invalid receiver address.', 'addresses': invalid}), 400
+
+        web3 = get_web3(infura_project_id)
+        if not is_connected(infura_project_id):
+            return jsonify({'error': 'Failed to connect to Infura'}), 500
+
+        # Same transaction shape as /send_transaction, one fee quote for the batch
+        fees = quote_fees(infura_project_id, speed)
+        txs = [dict({
+            'to': Web3.to_checksum_address(p['recipient_address']),
+            'value': web3.to_wei(p['eth_amount'], 'ether'),
+            'gas': 21000,  # Standard gas limit for ETH transfer
+            'chainId': get_chain_id(infura_project_id)  # from the configured node, cached for the process
+        }, **fees) for p in payments]
+
+        # One balance check against the whole payout
+        balance = cached_balance(infura_project_id, sender_address)
+        total_cost = sum(max_cost(tx) for tx in txs)
+        if balance < total_cost:
+            return jsonify({
+                'error': 'Insufficient funds',
+                'balance': float(web3.from_wei(balance, 'ether')),
+                'required_balance': float(web3.from_wei(total_cost, 'ether'))
+            }), 400
+
+        # Consecutive local nonces, parallel signing, batched broadcast;
+        # every hash then shares the tracker's batched receipt polls
+        results = sign_and_send_batch(infura_project_id, get_nonce_manager(infura_project_id),
+                                      sender_address, txs, private_key)
+        tracker = get_tracker(infura_project_id)
+        replace_key = private_key if data.get('replace_stuck', REPLACE_STUCK) else None
+        for payment, tx, result in zip(payments, txs, results):
+            result['recipient_address'] = payment['recipient_address']
+            result['eth_amount'] = payment['eth_amount']
+            # Hashes whose broadcast is unknown are tracked too, so a mined one still shows up
+            if 'transaction_hash' in result:
+                result['transaction_hash'] = tracker.track(result['transaction_hash'], sender_address,
+                                                           dict(tx, nonce=result['nonce']), replace_key, speed)
+                result['status'] = 'unknown' if 'error' in result else 'pending'
+
+        waited = data.get('wait_for_receipt', False)
+        if waited:
+            deadline = time.monotonic() + RECEIPT_TIMEOUT
+            for result in results:
+                if 'transaction_hash' in result:
+                    record = tracker.wait(result['transaction_hash'], max(0, deadline - time.monotonic()))
+                    if record['status'] == 'success':
+                        result.pop('error', None)
+                    result['status'] = record['status']
+                    result['transaction_hash'] = record['transaction_hash']
+                    for field in ('block_number', 'replaced_hashes'):
+                        if field in record:
+                            result[field] = record[field]
+
+        failed = sum(1 for result in results if 'error' in result)
+        # Never 5xx while anything may have gone out: a blind retry would pay twice
+        broadcast = any('transaction_hash' in result for result in results)
+        status_code = 500 if not broadcast else 200 if waited else 202
+        return jsonify({'sent': len(results) - failed, 'failed': failed, 'transactions': results}), status_code
+
+    except ValueError as e:
+        return jsonify({'error': f'Transaction failed: {str(e)}', 'message': 'Error 400'}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': f'An unexpected error occurred: {str(e)}'}), 500
+
+@app.route('/verify', methods=['POST'])
+def verify_transactions():
+    try:
+        # Recover the signer of every raw transaction; no node access is needed
+        data = request.get_json()
+        if not data or not isinstance(data.get('raw_transactions'), list):
+            return jsonify({"error": "Missing 'raw_transactions' list in request body"}), 400
+
+        raw_transactions = data['raw_transactions']
+        if len(raw_transactions) > MAX_VERIFY_BATCH:
+            return jsonify({"error": f"At most {MAX_VERIFY_BATCH} transactions per request"}), 400
+
+        # Optionally check each recovered sender against an expected address
+        expected_senders = data.get('expected_senders')
+        if expected_senders is not None and len(expected_senders) != len(raw_transactions):
+            return jsonify({"error": "'expected_senders' must match 'raw_transactions' in length"}), 400
+
+        results = recover_senders(raw_transactions)
+        if expected_senders is not None:
+            for result, expected in zip(results, expected_senders):
+                result['is_valid_signature'] = (
+                    'sender' in result and is_valid_address(expected)
+                    and result['sender'].lower() == expected.lower()
+                )
+
+        return jsonify({"results": results}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/transaction/<tx_hash>', methods=['GET'])
+def get_transaction_status(tx_hash):
+    try:
+        infura_project_id = request.args.get('infura_project_id')
+        if not infura_project_id:
+            return jsonify({"error": "Missing 'infura_project_id' query parameter"}), 400
+
+        # Optional long poll: hold the request until the status changes or ?wait= seconds pass
+        wait = min(float(request.args.get('wait', 0)), MAX_LONG_POLL)
+        tracker = get_tracker(infura_project_id)
+        record = tracker.wait(tx_hash, wait) if wait > 0 else tracker.get(tx_hash)
+        if record:
+            record.pop('submitted_at', None)
+            record.pop('submitted_block', None)
+            return jsonify(record), 200
+
+        # Not submitted through this worker, so ask the node directly
+        web3 = get_web3(infura_project_id)
+        try:
+            receipt = web3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            try:
+                web3.eth.get_transaction(tx_hash)
+            except TransactionNotFound:
+                return jsonify({'error': 'Unknown transaction', 'transaction_hash': tx_hash}), 404
+            return jsonify({'status': 'pending', 'transaction_hash': tx_hash}), 200
+
+        return jsonify({
+            'status': 'success' if receipt.status == 1 else 'failed',
+            'transaction_hash': tx_hash,
+            'block_number': receipt.blockNumber,
+            'sender_address': receipt['from']
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/transactions/<address>', methods=['GET'])
+def get_address_transactions(address):
+    try:
+        infura_project_id = request.args.get('infura_project_id')
+        if not infura_project_id:
+            return jsonify({"error": "Missing 'infura_project_id' query parameter"}), 400
+        if not is_valid_address(address):
+            return jsonify({"error": "Invalid address"}), 400
+
+        start_block = int(request.args.get('start_block', 0))
+        end_block = request.args.get('end_block')
+        end_block = int(end_block) if end_block is not None else None
+        limit = min(int(request.args.get('limit', DEFAULT_HISTORY_LIMIT)), MAX_HISTORY_LIMIT)
+
+        # Served from the address index, which a background thread keeps caught up
+        index = start_follower(infura_project_id)
+        indexed = index.indexed_range()
+        if indexed is None:
+            return jsonify({"error": "Address index is still being built, try again shortly"}), 503
+
+        transactions = index.history(address, start_block, end_block, limit)
+        for tx in transactions:
+            tx['value'] = str(tx['value'])
+        return jsonify({
+            "address": Web3.to_checksum_address(address),
+            "indexed_from_block": indexed[0],
+            "indexed_to_block": indexed[1],
+            "transactions": transactions,
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/wallet-stats/<address>', methods=['GET'])
+def get_wallet_stats(address):
+    # Totals, net flow, fees, failure rate and a per-block histogram for
+    # ?blocks=N back from the latest block, or ?start_block=&end_block=
+    try:
+        infura_project_id = request.args.get('infura_project_id')
+        if not infura_project_id:
+            return jsonify({"error": "Missing 'infura_project_id' query parameter"}), 400
+        if not is_valid_address(address):
+            return jsonify({"error": "Invalid address"}), 400
+
+        start_block = request.args.get('start_block')
+        start_block = int(start_block) if start_block is not None else None
+        end_block = request.args.get('end_block')
+        end_block = int(end_block) if end_block is not None else get_web3(infura_project_id).eth.block_number
+        num_blocks = int(request.args.get('blocks', DEFAULT_STATS_BLOCKS))
+        buckets = int(request.args.get('buckets', DEFAULT_BUCKETS))
+        if start_block is None:
+            start_block = max(0, end_block - num_blocks)
+        if end_block - start_block + 1 > MAX_STATS_BLOCKS:
+            return jsonify({"error": f"At most {MAX_STATS_BLOCKS} blocks per request"}), 400
+
+        return jsonify(wallet_stats(infura_project_id, address, start_block=start_block,
+                                    end_block=end_block, buckets=buckets)), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/export', methods=['GET'])
+def export_transactions():
+    # Stream the transactions of ?addresses=a,b,... in ?start_block=..&end_block=
+    # as NDJSON (default), an Arrow IPC file (?format=arrow) or Parquet
+    # (?format=parquet), one encoded batch at a time while the range is scanned
+    try:
+        infura_project_id = request.args.get('infura_project_id')
+        if not infura_project_id:
+            return jsonify({"error": "Missing 'infura_project_id' query parameter"}), 400
+        addresses = [a.strip() for a in request.args.get('addresses', '').split(',') if a.strip()]
+        if not addresses:
+            return jsonify({"error": "Missing 'addresses' query parameter"}), 400
+        if len(addresses) > MAX_EXPORT_ADDRESSES:
+            return jsonify({"error": f"At most {MAX_EXPORT_ADDRESSES} addresses per export"}), 400
+        invalid = [a for a in addresses if not is_valid_address(a)]
+        if invalid:
+            return jsonify({"error": "Invalid address", "addresses": invalid}), 400
+        if request.args.get('start_block') is None:
+            return jsonify({"error": "Missing 'start_block' query parameter"}), 400
+
+        start_block = int(request.args['start_block'])
+        end_block = request.args.get('end_block')
+        end_block = int(end_block) if end_block is not None else get_web3(infura_project_id).eth.block_number
+        if start_block > end_block:
+            return jsonify({"error": "'start_block' is after 'end_block'"}), 400
+        output_format = request.args.get('format', 'ndjson')
+        check_format(output_format)
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except RateLimitedError as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    chunks = iter_export(infura_project_id, addresses, start_block, end_block, output_format)
+    filename = f"transactions-{start_block}-{end_block}.{output_format}"
+    return Response(stream_with_context(chunks), mimetype=MIMETYPES[output_format], headers={
+        'Cache-Control': 'no-store',
+        'Content-Disposition': f'attachment; filename="{filename}"',
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text exposition: route and RPC latency histograms, upstream
+    # error and 429 counters, cache and single-flight hit counts, in-flight gauges
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0")
@@ -0,0 +1,241 @@
+# ASGI variant of the script1 API, built on AsyncWeb3
+# run with: uvicorn script1_asgi:app --host 0.0.0.0 --port 8000
+
+import asyncio
+import json
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from web3 import AsyncWeb3
+from eth_account import Account
+
+from clients import async_is_connected, get_async_web3
+from events import get_event_hub
+from fees import SPEEDS, max_cost, quote_fees
+from nonces import async_sign_and_send, get_nonce_manager
+from router import RateLimitedError
+
+MAX_EVENT_ADDRESSES = 1000  # addresses one /events stream may filter on
+EVENT_HEARTBEAT = 15  # seconds between SSE keep-alive comments
+# Comma-separated origins allowed to open /events from another origin, e.g. the
+# static page's; empty allows same-origin only
+CORS_ORIGINS = [o.strip() for o in os.environ.get("CORS_ORIGINS", "").split(",") if o.strip()]
+
+app = FastAPI()
+if CORS_ORIGINS:
+    app.add_middleware(CORSMiddleware, allow_origins=CORS_ORIGINS, allow_methods=["GET"])
+
+
+async def get_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+@app.post('/connect')
+async def connect_to_infura(request: Request):
+    try:
+        # Parse the JSON body to get the Infura project ID
+        data = await get_json(request)
+        if not data or 'infura_project_id' not in data:
+            return JSONResponse({"error": "Missing 'infura_project_id' in request body"}, 400)
+
+        infura_project_id = data['infura_project_id']
+
+        # Check if the connection to the node was successful
+        if await async_is_connected(infura_project_id):
+            return JSONResponse({"message": "Successfully connected to Infura."}, 200)
+        else:
+            return JSONResponse({"error": "Failed to connect to Infura."}, 500)
+
+    except RateLimitedError as e:
+        return JSONResponse({'error': str(e)}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+
+@app.post('/get-wallet')
+async def create_and_send_wallet(request: Request):
+    try:
+        # Key generation is offline; an 'infura_project_id' in the body is accepted but not needed
+        account = Account.create()
+
+        # Check if account is created successfully
+        if account and account.address and account._private_key:
+            return JSONResponse({"sender_address": account.address, "sender_private_key": account._private_key.hex()}, 200)
+        else:
+            return JSONResponse({"error": "Failed to generate wallet credentials"}, 500)
+
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+
+@app.post('/get-wallet-balance')
+async def get_balance(request: Request):
+    try:
+        # Parse the JSON body to get the Infura project ID
+        data = await get_json(request)
+        if not data or 'infura_project_id' not in data:
+            return JSONResponse({"error": "Missing 'infura_project_id' in request body"}, 400)
+        if not data or 'sender_address' not in data:
+            return JSONResponse({"error": "Missing 'sender_address' in request body"}, 400)
+
+        infura_project_id = data['infura_project_id']
+        sender_address = data['sender_address']
+
+        web3 = get_async_web3(infura_project_id)
+
+        if not await async_is_connected(infura_project_id):
+            print("Error: Unable to connect to the Ethereum network.")
+            return JSONResponse({"error": "Cannot connect to Ethereum network"}, 400)
+
+        balance = await web3.eth.get_balance(sender_address)
+        eth_balance = web3.from_wei(balance, 'ether')
+        eth_balance_float = float(eth_balance)
+        return JSONResponse({"balance": eth_balance_float}, 200)
+
+    except RateLimitedError as e:
+        return JSONResponse({'error': str(e)}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, 500)
+
+
+# Helper functions to validate address and private key
+def is_valid_address(address):
+    return AsyncWeb3.is_address(address)
+
+
+def is_valid_private_key(private_key):
+    try:
+        Account.from_key(private_key)
+        return True
+    except ValueError:
+        return False
+
+
+@app.post('/send_transaction')
+async def send_transaction(request: Request):
+    try:
+        # Get the data from the request
+        data = await get_json(request)
+        infura_project_id = data['infura_project_id']
+        sender_address = data['sender_address']
+        private_key = data['private_key']
+        eth_amount = data['eth_amount']
+        recipient_address = data['recipient_address']
+        speed = data.get('speed', 'normal')
+
+        # Validate sender private key and receiver address
+        if not is_valid_private_key(private_key):
+            return JSONResponse({'error': 'Invalid sender private key.'}, 400)
+        if not is_valid_address(recipient_address):
+            return JSONResponse({'error': 'Invalid receiver address.'}, 400)
+        if speed not in SPEEDS:
+            return JSONResponse({'error': f"'speed' must be one of {', '.join(SPEEDS)}"}, 400)
+
+        # Reuse the pooled Infura client
+        web3 = get_async_web3(infura_project_id)
+
+        # Check connection
+        if not await async_is_connected(infura_project_id):
+            return JSONResponse({'error': 'Failed to connect to Infura'}, 500)
+
+        # Get sender's balance and chain ID in one round trip; the fee quote comes
+        # from the shared oracle's memory (off-loop only for its first load)
+        balance, chain_id, fees = await asyncio.gather(
+            web3.eth.get_balance(sender_address),
+            web3.eth.chain_id,
+            asyncio.get_running_loop().run_in_executor(None, quote_fees, infura_project_id, speed),
+        )
+
+        # Transaction details; the nonce is filled in at signing
+        tx = dict({
+            'to': web3.to_checksum_address(recipient_address),
+            'value': web3.to_wei(eth_amount, 'ether'),
+            'gas': 21000,  # Standard gas limit for ETH transfer
+            'chainId': chain_id
+        }, **fees)
+        total_tx_cost = max_cost(tx)
+
+        # Check if the balance is sufficient
+        if balance < total_tx_cost:
+            return JSONResponse({
+                'error': 'Insufficient funds',
+                'balance': float(web3.from_wei(balance, 'ether')),
+                'required_balance': float(web3.from_wei(total_tx_cost, 'ether'))
+            }, 400)
+
+        # Allocate the nonce locally so concurrent sends from one address don't
+        # collide, then sign, check the signature offline and send
+        tx_hash, _, _ = await async_sign_and_send(
+            web3, get_nonce_manager(infura_project_id), sender_address, tx, private_key)
+
+        # Wait for the transaction receipt without blocking the event loop
+        tx_receipt = await web3.eth.wait_for_transaction_receipt(tx_hash)
+
+        # Check if the transaction was successful
+        if tx_receipt.status == 1:
+            updated_balance = await web3.eth.get_balance(sender_address)
+            return JSONResponse({
+                'status': 'success',
+                'transaction_hash': web3.to_hex(tx_hash),
+                'block_number': tx_receipt.blockNumber,
+                'updated_balance': float(web3.from_wei(updated_balance, 'ether'))
+            })
+
+        else:
+            return JSONResponse({'error': 'Transaction failed'}, 500)
+
+    except ValueError as e:
+        return JSONResponse({'error': f'Transaction failed: {str(e)}', 'message': 'Error 400'}, 400)
+    except RateLimitedError as e:
+        return JSONResponse({'error': str(e)}, 503, {'Retry-After': '1'})
+    except Exception as e:
+        return JSONResponse({'error': f'An unexpected error occurred: {str(e)}'}, 500)
+
+
+@app.get('/events')
+async def stream_events(request: Request):
+    # Server-sent events: new heads for everyone, plus matched transactions for
+    # ?addresses=a,b,... Served here rather than from the gunicorn app because
+    # an open stream only costs a coroutine on the event loop, not a worker
+    # thread; every stream shares one block follower per project
+    infura_project_id = request.query_params.get('infura_project_id')
+    if not infura_project_id:
+        return JSONResponse({"error": "Missing 'infura_project_id' query parameter"}, 400)
+    addresses = [a.strip() for a in request.query_params.get('addresses', '').split(',') if a.strip()]
+    if len(addresses) > MAX_EVENT_ADDRESSES:
+        return JSONResponse({"error": f"At most {MAX_EVENT_ADDRESSES} addresses per stream"}, 400)
+    invalid = [a for a in addresses if not is_valid_address(a)]
+    if invalid:
+        return JSONResponse({"error": "Invalid address", "addresses": invalid}, 400)
+
+    hub = get_event_hub(infura_project_id)
+    subscription = hub.subscribe(addresses, asyncio.get_running_loop())
+
+    async def generate():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get_async(EVENT_HEARTBEAT)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event['type'] == 'overflow':
+                    return
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0")
@@ -1,10 +1,37 @@
 # generate an etherium address and a private key
 
+import argparse
+import json
+import sys
+
 from web3 import Web3
 
-# Generate a new Ethereum account
-account = Web3().eth.account.create()
+from wallets import iter_wallets
+
+def write_wallets(count, output_format="csv", out=sys.stdout):
+    # Batch mode: keys are generated on the process pool and written as they arrive
+    if output_format == "csv":
+        out.write("address,private_key\n")
+    for wallet in iter_wallets(count):
+        if output_format == "csv":
+            out.write(f"{wallet['address']},{wallet['private_key']}\n")
+        else:
+            out.write(json.dumps(wallet) + "\n")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage="python script2.py [--count N] [--format csv|ndjson] [--output FILE]")
+    parser.add_argument("--count", type=int, help="number of wallets to generate in batch mode")
+    parser.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    parser.add_argument("--output", help="file to write instead of stdout")
+    args = parser.parse_args()
+
+    if args.count is None:
+        # Generate a new Ethereum account
+        account = Web3().eth.account.create()
 
-# Print the new account's address and private key
-print(f"Address: {account.address}")
-print(f"Private Key: {account._private_key.hex()}")
+        # Print the new account's address and private key
+        print(f"Address: {account.address}")
+        print(f"Private Key: {account._private_key.hex()}")
+    else:
+        with open(args.output, "w") if args.output else sys.stdout as out:
+            write_wallets(args.count, args.format, out)
@@ -1,11 +1,15 @@
 # wallet balance check
 
+import argparse
 import sys
-from web3 import Web3
+
+from balances import iter_balances
+from clients import get_web3
 
 def check_balance(infura_project_id, wallet_address):
     try:
-        web3 = Web3(Web3.HTTPProvider(f"https://sepolia.infura.io/v3/{infura_project_id}"))
+        # Same configurable endpoint (RPC_URL_TEMPLATE / RPC_ENDPOINTS) as every other script
+        web3 = get_web3(infura_project_id)
         if not web3.is_connected():
             print("Error: Unable to connect to the Ethereum network.")
             return
@@ -17,10 +21,41 @@ def check_balance(infura_project_id, wallet_address):
     except Exception as e:
         print(f"Error: {e}")
 
+def check_balances(infura_project_id, wallet_addresses, block=None):
+    # Batch mode: one JSON-RPC batch per chunk of addresses, printed as results arrive
+    try:
+        for row in iter_balances(infura_project_id, wallet_addresses, block):
+            if "error" in row:
+                print(f"{row['address']}: Error: {row['error']}")
+            else:
+                print(f"{row['address']}: {row['balance']} ETH")
+            sys.stdout.flush()
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+def read_addresses(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python script3.py <infura_project_id> <wallet_address>")
-    else:
+    if len(sys.argv) == 3:
         infura_project_id = sys.argv[1]
         wallet_address = sys.argv[2]
         check_balance(infura_project_id, wallet_address)
+    else:
+        parser = argparse.ArgumentParser(
+            usage="python script3.py <infura_project_id> <wallet_address> [<wallet_address> ...] [--file FILE] [--block BLOCK]"
+        )
+        parser.add_argument("infura_project_id")
+        parser.add_argument("wallet_addresses", nargs="*")
+        parser.add_argument("--file", help="file with one wallet address per line")
+        parser.add_argument("--block", help="block number or tag to pin every balance to")
+        args = parser.parse_args()
+
+        wallet_addresses = list(args.wallet_addresses)
+        if args.file:
+            wallet_addresses.extend(read_addresses(args.file))
+        if not wallet_addresses:
+            parser.error("no wallet addresses given")
+        check_balances(args.infura_project_id, wallet_addresses, args.block)
@@ -1,72 +1,152 @@
 # send a transaction
 
+import argparse
+import csv
 import sys
-from web3 import Web3
-
-# Get user inputs from command-line arguments
-infura_project_id = sys.argv[1]
-sender_address = sys.argv[2]
-private_key = sys.argv[3]
-recipient_address = sys.argv[4]
-
-infura_url = f"https://sepolia.infura.io/v3/{infura_project_id}"
-
-# Connect to Infura
-web3 = Web3(Web3.HTTPProvider(infura_url))
-
-# Check connection
-if web3.is_connected():
-    print("Successfully connected to Infura")
-else:
-    raise Exception("Failed to connect to Infura")
-
-# Transaction details
-value_to_send = web3.to_wei(0.01, 'ether')
-gas_limit = 21000  # Standard gas limit for ETH transfer
-gas_price = web3.to_wei('50', 'gwei')
-chain_id = 11155111  # Sepolia chain ID
-
-# Get sender's balance
-balance = web3.eth.get_balance(sender_address)
-total_tx_cost = value_to_send + (gas_limit * gas_price)
-
-print(f"Sender balance: {web3.from_wei(balance, 'ether')} ETH")
-print(f"Total transaction cost: {web3.from_wei(total_tx_cost, 'ether')} ETH")
-
-# Check if the balance is sufficient
-if balance < total_tx_cost:
-    print(f"Insufficient funds\nBalance: {web3.from_wei(balance, 'ether')} ETH, Required Balance: {web3.from_wei(total_tx_cost, 'ether')} ETH")
-else:
-    nonce = web3.eth.get_transaction_count(sender_address)
-    tx = {
-        'nonce': nonce,
-        'to': recipient_address,
-        'value': value_to_send,
-        'gas': gas_limit,
-        'gasPrice': gas_price,
-        'chainId': chain_id
-    }
-
-    # Sign the transaction
-    signed_tx = web3.eth.account.sign_transaction(tx, private_key)
-
-    # Send the transaction
-    try:
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        print(f"Transaction hash: {web3.to_hex(tx_hash)}")
-        
-        # Wait for the transaction receipt
-        tx_receipt = web3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        # Check if the transaction was successful
-        if tx_receipt.status == 1:
-            print("Transaction was successful!")
-            print(f"Transaction inserted into block number: {tx_receipt.blockNumber}")
-            updated_balance = web3.eth.get_balance(sender_address)
-            print(f"Updated sender balance: {web3.from_wei(updated_balance, 'ether')} ETH")
+import time
+
+from cache import get_chain_id
+from clients import get_web3
+from fees import SPEEDS, max_cost, quote_fees
+from nonces import get_nonce_manager, sign_and_send, sign_and_send_batch
+from receipts import REPLACE_STUCK, get_tracker
+
+RECEIPT_TIMEOUT = 600  # seconds batch mode waits for all receipts
+
+def send_one(infura_project_id, sender_address, private_key, recipient_address, speed="normal",
+             speed_up=REPLACE_STUCK):
+    # Connect to Infura
+    web3 = get_web3(infura_project_id)
+
+    # Check connection
+    if web3.is_connected():
+        print("Successfully connected to Infura")
+    else:
+        raise Exception("Failed to connect to Infura")
+
+    # Transaction details, with type-2 fees quoted from recent fee history
+    tx = dict({
+        'to': web3.to_checksum_address(recipient_address),
+        'value': web3.to_wei(0.01, 'ether'),
+        'gas': 21000,  # Standard gas limit for ETH transfer
+        'chainId': get_chain_id(infura_project_id)
+    }, **quote_fees(infura_project_id, speed))
+
+    # Get sender's balance
+    balance = web3.eth.get_balance(sender_address)
+    total_tx_cost = max_cost(tx)
+
+    print(f"Sender balance: {web3.from_wei(balance, 'ether')} ETH")
+    print(f"Total transaction cost: {web3.from_wei(total_tx_cost, 'ether')} ETH")
+
+    # Check if the balance is sufficient
+    if balance < total_tx_cost:
+        print(f"Insufficient funds\nBalance: {web3.from_wei(balance, 'ether')} ETH, Required Balance: {web3.from_wei(total_tx_cost, 'ether')} ETH")
+    else:
+        # Sign with the next pending nonce and send the transaction
+        try:
+            tx_hash, signed_tx, nonce = sign_and_send(web3, get_nonce_manager(infura_project_id), sender_address, tx, private_key)
+            print(f"Transaction hash: {web3.to_hex(tx_hash)}")
+
+            # Wait for the transaction receipt; with speed_up the tracker
+            # re-sends it with higher fees if it sits unmined
+            tracker = get_tracker(infura_project_id)
+            tracked = tracker.track(tx_hash, sender_address, dict(tx, nonce=nonce), private_key if speed_up else None, speed)
+            record = tracker.wait(tracked, RECEIPT_TIMEOUT)
+
+            # Check if the transaction was successful
+            if record['status'] == 'success':
+                print("Transaction was successful!")
+                if record['transaction_hash'] != web3.to_hex(tx_hash):
+                    print(f"Mined as replacement transaction: {record['transaction_hash']}")
+                print(f"Transaction inserted into block number: {record['block_number']}")
+                print(f"Updated sender balance: {record['updated_balance']} ETH")
+            elif record['status'] == 'pending':
+                print(f"Timed out waiting for the receipt of {record['transaction_hash']}")
+            else:
+                print(f"Transaction {record['status']}!")
+        except ValueError as e:
+            print(f"Transaction failed: {e}")
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+
+def read_payments(path):
+    # One "recipient_address,eth_amount" per line; blank lines and # comments are skipped
+    with open(path, newline="") as f:
+        rows = [row for row in csv.reader(f) if row and row[0].strip() and not row[0].startswith("#")]
+    return [(row[0].strip(), row[1].strip()) for row in rows if row[0].strip().lower() != "recipient_address"]
+
+def send_many(infura_project_id, sender_address, private_key, payments, wait=True, speed="normal",
+              speed_up=REPLACE_STUCK):
+    # Batch mode: one balance check for the total, consecutive local nonces,
+    # parallel signing and batched broadcast, then receipts tracked together
+    web3 = get_web3(infura_project_id)
+    if not web3.is_connected():
+        raise Exception("Failed to connect to Infura")
+
+    fees = quote_fees(infura_project_id, speed)
+    txs = [dict({
+        'to': web3.to_checksum_address(recipient),
+        'value': web3.to_wei(amount, 'ether'),
+        'gas': 21000,
+        'chainId': get_chain_id(infura_project_id)
+    }, **fees) for recipient, amount in payments]
+
+    balance = web3.eth.get_balance(sender_address)
+    total_cost = sum(max_cost(tx) for tx in txs)
+    print(f"Sender balance: {web3.from_wei(balance, 'ether')} ETH")
+    print(f"Total cost of {len(txs)} transactions: {web3.from_wei(total_cost, 'ether')} ETH")
+    if balance < total_cost:
+        print("Insufficient funds")
+        return
+
+    results = sign_and_send_batch(infura_project_id, get_nonce_manager(infura_project_id), sender_address, txs, private_key)
+    tracker = get_tracker(infura_project_id)
+    for (recipient, amount), tx, result in zip(payments, txs, results):
+        if 'transaction_hash' in result:
+            # With speed_up, tracked with the key so stuck transactions are sped
+            # up while we wait; a hash whose broadcast is unknown is tracked too
+            tracker.track(result['transaction_hash'], sender_address, dict(tx, nonce=result['nonce']),
+                          private_key if speed_up else None, speed)
+        if 'error' in result:
+            print(f"{recipient}: {amount} ETH failed: {result['error']}"
+                  + (f", hash {result['transaction_hash']}" if 'transaction_hash' in result else ""))
         else:
-            print("Transaction failed!")
-    except ValueError as e:
-        print(f"Transaction failed: {e}")
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
\ No newline at end of file
+            print(f"{recipient}: {amount} ETH sent, nonce {result['nonce']}, hash {result['transaction_hash']}")
+        sys.stdout.flush()
+    if not wait:
+        return
+
+    deadline = time.monotonic() + RECEIPT_TIMEOUT
+    for result in results:
+        if 'transaction_hash' in result:
+            record = tracker.wait(result['transaction_hash'], max(0, deadline - time.monotonic()))
+            print(f"{result['transaction_hash']}: {record['status']}"
+                  + (f" in block {record['block_number']}" if 'block_number' in record else "")
+                  + (f" as {record['transaction_hash']}" if record['transaction_hash'] != result['transaction_hash'] else ""))
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    # Get user inputs from command-line arguments: one recipient, or a payments file
+    parser = argparse.ArgumentParser(
+        usage="python script4.py <infura_project_id> <sender_address> <private_key> "
+              "(<recipient_address> | --payments FILE) [--no-wait] [--speed fast|normal|cheap] [--speed-up]"
+    )
+    parser.add_argument("infura_project_id")
+    parser.add_argument("sender_address")
+    parser.add_argument("private_key")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("recipient_address", nargs="?")
+    target.add_argument("--payments", help="CSV file of recipient_address,eth_amount lines")
+    parser.add_argument("--no-wait", action="store_true", help="exit once everything is broadcast (batch mode)")
+    parser.add_argument("--speed", choices=tuple(SPEEDS), default="normal", help="fee level to pay")
+    parser.add_argument("--speed-up", action="store_true", default=REPLACE_STUCK,
+                        help="re-send with higher fees if unmined for a few blocks (keeps the key in memory meanwhile)")
+    args = parser.parse_args()
+
+    if args.recipient_address is not None:
+        send_one(args.infura_project_id, args.sender_address, args.private_key, args.recipient_address, args.speed,
+                 args.speed_up)
+    else:
+        send_many(args.infura_project_id, args.sender_address, args.private_key,
+                  read_payments(args.payments), wait=not args.no_wait, speed=args.speed, speed_up=args.speed_up)
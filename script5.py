@@ -1,79 +1,70 @@
 # find the latest trasaction
 
 import sys
-from web3 import Web3, HTTPProvider
-from requests.exceptions import RequestException
+from web3 import Web3
 
-# Get Infura Project ID and wallet address from command-line arguments
-if len(sys.argv) != 3:
-    print("Error: Please provide Infura Project ID and wallet address as arguments.")
-    sys.exit(1)
+from clients import get_web3
+from indexer import get_index, index_exists
+from scanner import find_latest
 
-infura_project_id = sys.argv[1]
-wallet_address = sys.argv[2]
+def find_latest_transaction(infura_project_id, address, max_blocks=1000, verbose=True):
+    if verbose:
+        print(f"Searching for the latest transaction for address: {address}")
+    latest_block = get_web3(infura_project_id).eth.block_number
+    if verbose:
+        print(f"Latest block number: {latest_block}")
 
-# Infura endpoint for Sepolia
-infura_url = f"https://sepolia.infura.io/v3/{infura_project_id}"
+    start_block = max(0, latest_block - max_blocks)
 
-# Connect to Infura
-web3 = Web3(HTTPProvider(infura_url))
+    # Blocks an existing address index already holds are read from it, and only
+    # the newer ones are scanned; catching the index up is left to its follower
+    index = get_index() if index_exists() else None
+    indexed_to = index.indexed_through(start_block, latest_block) if index else None
 
-# Check connection
-if not web3.is_connected():
-    print("Failed to connect to Infura")
-    sys.exit(1)
+    # Scan newest-first in parallel block batches and stop at the first match
+    scan_from = start_block if indexed_to is None else indexed_to + 1
+    latest = find_latest(infura_project_id, [address], scan_from, latest_block)
+    if latest is None and indexed_to is not None:
+        matches = index.history(address, start_block, indexed_to, limit=1)
+        latest = matches[0] if matches else None
+    return latest
 
-print("Successfully connected to Infura (Sepolia)")
+def main():
+    # Get Infura Project ID and wallet address from command-line arguments
+    if len(sys.argv) != 3:
+        print("Error: Please provide Infura Project ID and wallet address as arguments.")
+        sys.exit(1)
 
-# Convert wallet address to checksum address
-wallet_address = web3.to_checksum_address(wallet_address)
+    infura_project_id = sys.argv[1]
+    wallet_address = sys.argv[2]
 
-def get_transaction_details(tx):
-    receipt = web3.eth.get_transaction_receipt(tx["hash"])
-    return {
-        "blockNumber": tx["blockNumber"],
-        "from": tx["from"],
-        "to": tx["to"],
-        "value": web3.from_wei(tx["value"], "ether"),
-        "hash": tx["hash"].hex(),
-        "gasUsed": receipt["gasUsed"],
-        "status": receipt["status"]
-    }
+    # Connect to Infura
+    web3 = get_web3(infura_project_id)
 
-def find_latest_transaction(address, max_blocks=1000):
-    print(f"Searching for the latest transaction for address: {address}")
-    latest_block = web3.eth.block_number
-    print(f"Latest block number: {latest_block}")
+    # Check connection
+    if not web3.is_connected():
+        print("Failed to connect to Infura")
+        sys.exit(1)
 
-    start_block = max(0, latest_block - max_blocks)
+    print("Successfully connected to Infura (Sepolia)")
 
-    for block_number in range(latest_block, start_block - 1, -1):
-        print(f"Checking block {block_number}...")
-        try:
-            block = web3.eth.get_block(block_number, full_transactions=True)
-            
-            for tx in block.transactions:
-                if tx["from"].lower() == address.lower() or (tx["to"] and tx["to"].lower() == address.lower()):
-                    return get_transaction_details(tx)
-        
-        except RequestException as e:
-            print(f"Request error: {e}")
-        except Exception as e:
-            print(f"Error: {e}")
+    # Convert wallet address to checksum address
+    wallet_address = Web3.to_checksum_address(wallet_address)
 
-    return None
+    # Find the latest transaction for the wallet address
+    latest_transaction = find_latest_transaction(infura_project_id, wallet_address)
 
-# Find the latest transaction for the wallet address
-latest_transaction = find_latest_transaction(wallet_address)
+    if latest_transaction:
+        print("\nLatest transaction found:")
+        print(f"Block: {latest_transaction['blockNumber']}")
+        print(f"From: {latest_transaction['from']}")
+        print(f"To: {latest_transaction['to']}")
+        print(f"Value: {latest_transaction['value']} ETH")
+        print(f"Transaction Hash: {latest_transaction['hash']}")
+        print(f"Gas Used: {latest_transaction['gasUsed']}")
+        print(f"Status: {'Success' if latest_transaction['status'] == 1 else 'Failed'}\n")
+    else:
+        print("\nNo transactions found in the specified range.")
 
-if latest_transaction:
-    print("\nLatest transaction found:")
-    print(f"Block: {latest_transaction['blockNumber']}")
-    print(f"From: {latest_transaction['from']}")
-    print(f"To: {latest_transaction['to']}")
-    print(f"Value: {latest_transaction['value']} ETH")
-    print(f"Transaction Hash: {latest_transaction['hash']}")
-    print(f"Gas Used: {latest_transaction['gasUsed']}")
-    print(f"Status: {'Success' if latest_transaction['status'] == 1 else 'Failed'}\n")
-else:
-    print("\nNo transactions found in the specified range.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
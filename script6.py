@@ -1,81 +1,87 @@
 # find all the transactions in the last 20 blocks
 
+import json
 import sys
-from web3 import Web3, HTTPProvider
-from requests.exceptions import RequestException
-
-# Get Infura Project ID and wallet address from command-line arguments
-if len(sys.argv) != 3:
-    print("Error: Please provide Infura Project ID and wallet address as arguments.")
-    sys.exit(1)
-
-infura_project_id = sys.argv[1]
-wallet_address = sys.argv[2]
-
-# Infura endpoint for Sepolia
-infura_url = f"https://sepolia.infura.io/v3/{infura_project_id}"
-
-# Connect to Infura
-web3 = Web3(HTTPProvider(infura_url))
-
-# Check connection
-if not web3.is_connected():
-    print("Failed to connect to Infura")
-    sys.exit(1)
-
-print("Successfully connected to Infura (Sepolia)")
-
-# Convert wallet address to checksum address
-wallet_address = web3.to_checksum_address(wallet_address)
-
-def get_transaction_details(tx):
-    receipt = web3.eth.get_transaction_receipt(tx["hash"])
-    return {
-        "blockNumber": tx["blockNumber"],
-        "from": tx["from"],
-        "to": tx["to"],
-        "value": web3.from_wei(tx["value"], "ether"),
-        "hash": tx["hash"].hex(),
-        "gasUsed": receipt["gasUsed"],
-        "status": receipt["status"]
-    }
-
-def check_previous_transactions(address, num_blocks=20):
-    print(f"Checking previous transactions for address: {address}")
-    latest_block = web3.eth.block_number
-    print(f"Latest block number: {latest_block}")
+from web3 import Web3
+
+from analytics import wallet_stats
+
+from clients import get_web3
+from indexer import get_index, index_exists
+from scanner import address_matcher, scan_blocks
+
+def check_previous_transactions(infura_project_id, address, num_blocks=20, verbose=True):
+    if verbose:
+        print(f"Checking previous transactions for address: {address}")
+    latest_block = get_web3(infura_project_id).eth.block_number
+    if verbose:
+        print(f"Latest block number: {latest_block}")
 
     start_block = max(0, latest_block - num_blocks)
-    transactions = []
-
-    for block_number in range(latest_block, start_block - 1, -1):
-        print(f"Checking block {block_number}...")
-        try:
-            block = web3.eth.get_block(block_number, full_transactions=True)
-            
-            for tx in block.transactions:
-                if tx["from"].lower() == address.lower() or (tx["to"] and tx["to"].lower() == address.lower()):
-                    transactions.append(get_transaction_details(tx))
-        
-        except RequestException as e:
-            print(f"Request error: {e}")
-        except Exception as e:
-            print(f"Error: {e}")
 
+    # Blocks an existing address index already holds are read from it, and only
+    # the newer ones are scanned; catching the index up is left to its follower
+    index = get_index() if index_exists() else None
+    indexed_to = index.indexed_through(start_block, latest_block) if index else None
+
+    # Newest block first, fetched in parallel JSON-RPC batches
+    scan_from = start_block if indexed_to is None else indexed_to + 1
+    transactions = list(scan_blocks(infura_project_id, scan_from, latest_block, address_matcher([address]), reverse=True))
+    if indexed_to is not None:
+        transactions += index.history(address, start_block, indexed_to)
     return transactions
 
-# Check previous transactions for the wallet address
-transactions = check_previous_transactions(wallet_address)
-
-if transactions:
-    print("\nTransactions found:")
-    for tx in transactions:
-        print(f"\nTransaction in block {tx['blockNumber']}:")
-        print(f"From: {tx['from']}")
-        print(f"To: {tx['to']}")
-        print(f"Value: {tx['value']} ETH")
-        print(f"Transaction Hash: {tx['hash']}")
-        print(f"Gas Used: {tx['gasUsed']}")
-        print(f"Status: {'Success' if tx['status'] == 1 else 'Failed'}\n")
-else:
-    print("\nNo transactions found in the specified range.")
\ No newline at end of file
+def main():
+    # Get Infura Project ID and wallet address from command-line arguments;
+    # --stats [N] prints a summary of the last N blocks instead of the list
+    args = sys.argv[1:]
+    stats_blocks = None
+    if "--stats" in args:
+        position = args.index("--stats")
+        stats_blocks = 20
+        if position + 1 < len(args) and args[position + 1].isdigit():
+            stats_blocks = int(args.pop(position + 1))
+        args.pop(position)
+    if len(args) != 2:
+        print("Error: Please provide Infura Project ID and wallet address as arguments.")
+        sys.exit(1)
+
+    infura_project_id = args[0]
+    wallet_address = args[1]
+
+    # Connect to Infura
+    web3 = get_web3(infura_project_id)
+
+    # Check connection
+    if not web3.is_connected():
+        print("Failed to connect to Infura")
+        sys.exit(1)
+
+    print("Successfully connected to Infura (Sepolia)")
+
+    # Convert wallet address to checksum address
+    wallet_address = Web3.to_checksum_address(wallet_address)
+
+    if stats_blocks is not None:
+        # Column-backed totals instead of one Decimal per transaction
+        print(json.dumps(wallet_stats(infura_project_id, wallet_address, stats_blocks), indent=2))
+        return
+
+    # Check previous transactions for the wallet address
+    transactions = check_previous_transactions(infura_project_id, wallet_address)
+
+    if transactions:
+        print("\nTransactions found:")
+        for tx in transactions:
+            print(f"\nTransaction in block {tx['blockNumber']}:")
+            print(f"From: {tx['from']}")
+            print(f"To: {tx['to']}")
+            print(f"Value: {tx['value']} ETH")
+            print(f"Transaction Hash: {tx['hash']}")
+            print(f"Gas Used: {tx['gasUsed']}")
+            print(f"Status: {'Success' if tx['status'] == 1 else 'Failed'}\n")
+    else:
+        print("\nNo transactions found in the specified range.")
+
+if __name__ == "__main__":
+    main()
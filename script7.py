@@ -1,44 +1,17 @@
 # live track a wallet
 
+import argparse
+import os
 import sys
-from web3 import Web3, HTTPProvider
-import time
+from web3 import Web3
 
-# Get Infura Project ID and wallet address from command-line arguments
-if len(sys.argv) != 3:
-    print("Error: Please provide Infura Project ID and wallet address as arguments.")
-    sys.exit(1)
+from cache import get_chain_id, get_finalized_block
+from clients import chunked, get_web3, ordered_map
+from follower import BlockFollower
+from monitor_state import STATE_PATH, MonitorState, watch_id
+from scanner import BLOCK_BATCH, SCAN_WINDOW, address_matcher, fetch_receipts, scan_chunk, transaction_details
 
-infura_project_id = sys.argv[1]
-wallet_address = sys.argv[2]
-
-# Infura endpoint for Sepolia
-infura_url = f"https://sepolia.infura.io/v3/{infura_project_id}"
-
-# Connect to Infura
-web3 = Web3(HTTPProvider(infura_url))
-
-# Check connection
-if not web3.is_connected():
-    print("Failed to connect to Infura")
-    sys.exit(1)
-
-print("Successfully connected to Infura (Sepolia)")
-
-# Convert wallet address to checksum address
-wallet_address = web3.to_checksum_address(wallet_address)
-
-def get_transaction_details(tx):
-    receipt = web3.eth.get_transaction_receipt(tx["hash"])
-    return {
-        "blockNumber": tx["blockNumber"],
-        "from": tx["from"],
-        "to": tx["to"],
-        "value": web3.from_wei(tx["value"], "ether"),
-        "hash": tx["hash"].hex(),
-        "gasUsed": receipt["gasUsed"],
-        "status": receipt["status"]
-    }
+MAX_BACKFILL = int(os.environ.get("MONITOR_MAX_BACKFILL", 10000))  # blocks caught up on after downtime, at most
 
 def print_transaction_details(tx):
     print(f"\nNew transaction found:")
@@ -51,31 +24,119 @@ def print_transaction_details(tx):
     print(f"Status: {'Success' if tx['status'] == 1 else 'Failed'}")
     sys.stdout.flush()  # Ensure the output is sent immediately
 
-def monitor_transactions(address):
-    print(f"Starting to monitor transactions for address: {address}")
+def print_retracted_transaction(tx):
+    print(f"\nTransaction retracted (block {tx['blockNumber']} was orphaned by a reorg):")
+    print(f"Transaction Hash: {tx['hash']}")
+    sys.stdout.flush()
+
+def read_addresses(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+def monitor_transactions(infura_project_id, addresses, on_transaction=print_transaction_details,
+                         on_retract=print_retracted_transaction, state_path=STATE_PATH):
+    # Watch one address or any number of them: every block is fetched once and
+    # matched against the whole set, so cost grows with blocks, not wallets
+    if isinstance(addresses, str):
+        addresses = [addresses]
+    match = address_matcher(addresses)
+    if len(addresses) == 1:
+        print(f"Starting to monitor transactions for address: {addresses[0]}")
+    else:
+        print(f"Starting to monitor transactions for {len(addresses)} addresses")
     sys.stdout.flush()
-    last_checked_block = web3.eth.block_number
-
-    while True:
-        try:
-            latest_block = web3.eth.block_number
-            if latest_block > last_checked_block:
-                for block_number in range(last_checked_block + 1, latest_block + 1):
-                    print(f"Checking block {block_number}")
-                    sys.stdout.flush()
-                    block = web3.eth.get_block(block_number, full_transactions=True)
-                    for tx in block.transactions:
-                        if tx["from"].lower() == address.lower() or (tx["to"] and tx["to"].lower() == address.lower()):
-                            tx_details = get_transaction_details(tx)
-                            print_transaction_details(tx_details)
-                
-                last_checked_block = latest_block
-            
-            time.sleep(10)  # Wait for 10 seconds before checking for new blocks
-        except Exception as e:
-            print(f"An error occurred: {e}")
+
+    # The cursor and emitted hashes survive restarts, so downtime is caught up
+    # on and nothing already reported is reported twice
+    state = MonitorState(state_path, watch_id(get_chain_id(infura_project_id), addresses)) if state_path else None
+    cursor = state.cursor() if state else None
+
+    def emit(transactions):
+        for tx in transactions:
+            if state is None:
+                on_transaction(tx)
+            elif not state.is_emitted(tx["hash"]):
+                on_transaction(tx)
+                state.mark(tx)
+
+    head = get_web3(infura_project_id).eth.block_number
+    if cursor is None:
+        start_block, parent_hash = head + 1, None
+        if state:
+            state.commit(head, None)
+    else:
+        start_block, parent_hash = cursor[0] + 1, cursor[1]
+        if head - start_block >= MAX_BACKFILL:
+            print(f"Checkpoint is {head - cursor[0]} blocks behind; only the last {MAX_BACKFILL} are caught up on")
+            start_block, parent_hash = head - MAX_BACKFILL + 1, None
+
+        # Finalized blocks can't be reorged, so they are backfilled in parallel batches
+        finalized = get_finalized_block(infura_project_id)
+        if start_block <= finalized:
+            print(f"Catching up on blocks {start_block} to {finalized}")
             sys.stdout.flush()
-            time.sleep(10)  # Wait for 10 seconds before retrying
+            chunks = chunked(range(start_block, finalized + 1), BLOCK_BATCH)
+            work = lambda chunk: (chunk[-1], scan_chunk(infura_project_id, chunk, match))
+            for last_block, transactions in ordered_map(work, chunks, SCAN_WINDOW):
+                emit(transactions)
+                state.commit(last_block, None)
+            start_block, parent_hash = finalized + 1, None
+
+    # New heads arrive over a newHeads subscription (polling if that fails);
+    # blocks missed while disconnected are backfilled, and transactions in
+    # blocks orphaned by a reorg are retracted before the new branch is reported
+    for event, block in BlockFollower(infura_project_id, start_block, parent_hash=parent_hash).events():
+        block_number = int(block["number"], 16)
+        if event == "retract":
+            if state:
+                retracted = state.emitted_in(block_number)
+                state.retract(block_number)
+            else:
+                retracted = [tx["hash"] for tx in block["transactions"] if match(tx)]
+            for tx_hash in reversed(retracted):
+                on_retract({"blockNumber": block_number, "hash": tx_hash})
+            continue
+
+        matched = [tx for tx in block["transactions"] if match(tx)]
+        if matched:
+            receipts = fetch_receipts(infura_project_id, matched)
+            emit([transaction_details(tx, receipts.get(tx["hash"])) for tx in matched])
+        if state:
+            state.commit(block_number, block["hash"])
+
+def main():
+    # Get Infura Project ID and wallet addresses from command-line arguments
+    parser = argparse.ArgumentParser(
+        usage="python script7.py <infura_project_id> <wallet_address> [<wallet_address> ...] [--addresses-file FILE]"
+    )
+    parser.add_argument("infura_project_id")
+    parser.add_argument("wallet_addresses", nargs="*")
+    parser.add_argument("--addresses-file", help="file with one wallet address per line")
+    parser.add_argument("--state", default=STATE_PATH, help="checkpoint file kept across restarts, empty to disable")
+    args = parser.parse_args()
+
+    wallet_addresses = list(args.wallet_addresses)
+    if args.addresses_file:
+        wallet_addresses.extend(read_addresses(args.addresses_file))
+    if not wallet_addresses:
+        print("Error: Please provide Infura Project ID and wallet address as arguments.")
+        sys.exit(1)
+
+    # Connect to Infura
+    web3 = get_web3(args.infura_project_id)
+
+    # Check connection
+    if not web3.is_connected():
+        print("Failed to connect to Infura")
+        sys.exit(1)
+
+    print("Successfully connected to Infura (Sepolia)")
+
+    # Convert wallet addresses to checksum addresses
+    wallet_addresses = [Web3.to_checksum_address(address) for address in wallet_addresses]
+
+    # Start monitoring transactions
+    monitor_transactions(args.infura_project_id, wallet_addresses, state_path=args.state)
 
-# Start monitoring transactions
-monitor_transactions(wallet_address)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,10 @@ from web3 import Web3
 from eth_account import Account
 from eth_account.messages import encode_defunct
 
+from cache import get_balance, get_chain_id
+from clients import get_web3
+from fees import max_cost, quote_fees
+
 # Get Infura Project ID, sender private key, and receiver address from command-line arguments
 if len(sys.argv) != 4:
     print("Error: Please provide Infura Project ID, sender private key, and receiver address as arguments.")
@@ -25,7 +29,7 @@ def is_valid_private_key(private_key):
         return False
 
 # Connect to Sepolia testnet
-web3 = Web3(Web3.HTTPProvider(f'https://sepolia.infura.io/v3/{infura_project_id}'))
+web3 = get_web3(infura_project_id)
 
 if not web3.is_connected():
     print("\nFailed to connect to Ethereum node. Please check your connection and try again.")
@@ -45,14 +49,13 @@ if not is_valid_address(receiver_address):
 
 try:
     # Transaction details
-    transaction = {
-        'to': receiver_address,
+    transaction = dict({
+        'to': web3.to_checksum_address(receiver_address),
         'value': web3.to_wei(0.01, 'ether'),  # Sending 0.01 ETH
         'gas': 21000,
-        'gasPrice': web3.eth.gas_price,
         'nonce': web3.eth.get_transaction_count(sender_account.address),
-        'chainId': web3.eth.chain_id
-    }
+        'chainId': get_chain_id(infura_project_id)
+    }, **quote_fees(infura_project_id))
 
     print("\n--- Sender's End ---\n")
 
@@ -81,8 +84,8 @@ try:
         print("\nThe signature is invalid or does not match the sender's address.")
 
     # Check if the recovered address has sufficient balance
-    sender_balance = web3.eth.get_balance(recovered_address)
-    if sender_balance >= transaction['value'] + (transaction['gas'] * transaction['gasPrice']):
+    sender_balance = get_balance(infura_project_id, recovered_address)
+    if sender_balance >= max_cost(transaction):
         print("\nThe sender has sufficient balance for this transaction.\n")
     else:
         print("\nThe sender does not have sufficient balance for this transaction.\n")
@@ -0,0 +1,85 @@
+# offline signature checks: recover transaction senders without touching the network
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+from eth_utils import keccak
+from hexbytes import HexBytes
+
+import metrics
+from clients import chunked
+
+POOL_WORKERS = int(os.environ.get("SIGNING_WORKERS", os.cpu_count() or 1))
+MIN_POOL_BATCH = 64  # below this, pickling to worker processes costs more than the ECDSA work
+
+SIGNING_DURATION = metrics.Histogram("signing_duration_seconds", "Time spent signing transactions, per call", ("mode",))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    # Spawned rather than forked so workers don't inherit the server's threads and sockets
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def recover_sender(raw_transaction):
+    return Account.recover_transaction(raw_transaction)
+
+
+def _recover_one(raw_transaction):
+    try:
+        raw = HexBytes(raw_transaction)
+        return {'transaction_hash': "0x" + keccak(raw).hex(), 'sender': Account.recover_transaction(raw)}
+    except Exception as e:
+        return {'error': str(e)}
+
+
+def _recover_chunk(raw_transactions):
+    return [_recover_one(raw) for raw in raw_transactions]
+
+
+def _sign_chunk(private_key, transactions):
+    signed = []
+    for tx in transactions:
+        signed_tx = Account.sign_transaction(tx, private_key)
+        signed.append({'raw_transaction': signed_tx.rawTransaction.hex(), 'transaction_hash': signed_tx.hash.hex()})
+    return signed
+
+
+def sign_transactions(transactions, private_key):
+    # Sign fully populated transaction dicts in input order, fanning large
+    # batches out over the pool like recover_senders
+    started = time.perf_counter()
+    if len(transactions) < MIN_POOL_BATCH or POOL_WORKERS < 2:
+        results = _sign_chunk(private_key, transactions)
+        SIGNING_DURATION.observe(time.perf_counter() - started, "batch")
+        return results
+
+    chunk_size = -(-len(transactions) // (POOL_WORKERS * 4))
+    chunks = chunked(transactions, chunk_size)
+    results = []
+    for part in get_process_pool().map(_sign_chunk, [private_key] * len(chunks), chunks):
+        results.extend(part)
+    SIGNING_DURATION.observe(time.perf_counter() - started, "pool")
+    return results
+
+
+def recover_senders(raw_transactions):
+    # Recover every sender in input order, fanning large batches out over the pool
+    if len(raw_transactions) < MIN_POOL_BATCH or POOL_WORKERS < 2:
+        return _recover_chunk(raw_transactions)
+
+    chunk_size = -(-len(raw_transactions) // (POOL_WORKERS * 4))
+    results = []
+    for part in get_process_pool().map(_recover_chunk, chunked(raw_transactions, chunk_size)):
+        results.extend(part)
+    return results
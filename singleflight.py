@@ -0,0 +1,61 @@
+# collapse identical concurrent reads into one upstream call
+
+import threading
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = {}  # method -> calls seen
+        self.collapsed = {}  # method -> calls answered by another caller's request
+
+    def begin(self, method, key):
+        # (True, flight) if the caller should make the request and finish() it,
+        # (False, flight) if an identical request is already in flight
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            flight = self.flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self.collapsed[method] = self.collapsed.get(method, 0) + 1
+                return False, flight
+            flight = self.flights[key] = Flight()
+            return True, flight
+
+    def finish(self, key, result=None, error=None):
+        with self.lock:
+            flight = self.flights.pop(key)
+        flight.result, flight.error = result, error
+        flight.done.set()
+        return flight
+
+    def do(self, method, key, fn):
+        leader, flight = self.begin(method, key)
+        if not leader:
+            return flight.wait()
+        try:
+            result = fn()
+        except Exception as e:
+            self.finish(key, error=e)
+            raise
+        self.finish(key, result)
+        return result
+
+    def stats(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "collapsed": dict(self.collapsed)}
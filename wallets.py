@@ -0,0 +1,53 @@
+# offline bulk key generation, fanned out over a process pool
+
+import os
+from collections import deque
+
+from eth_keys import keys
+
+from signing import POOL_WORKERS, get_process_pool
+
+WALLET_CHUNK = 256  # keys generated per pool task
+MIN_POOL_COUNT = 512  # below this, generate in-process
+SECP256K1_N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+
+
+def new_wallet():
+    # A uniformly random valid secp256k1 key and its checksummed address. The
+    # ECDSA and keccak work is pure Python unless coincurve is installed.
+    while True:
+        secret = os.urandom(32)
+        if 0 < int.from_bytes(secret, "big") < SECP256K1_N:
+            break
+    private_key = keys.PrivateKey(secret)
+    return {
+        "address": private_key.public_key.to_checksum_address(),
+        "private_key": "0x" + secret.hex(),
+    }
+
+
+def _generate_chunk(count):
+    return [new_wallet() for _ in range(count)]
+
+
+def iter_wallets(count, pool=None, workers=POOL_WORKERS):
+    # Yield `count` wallets as they are produced, keeping at most two chunks
+    # per worker queued so a client that goes away stops the work
+    if pool is None and (count < MIN_POOL_COUNT or workers < 2):
+        for _ in range(count):
+            yield new_wallet()
+        return
+
+    pool = pool or get_process_pool()
+    sizes = iter([WALLET_CHUNK] * (count // WALLET_CHUNK) + ([count % WALLET_CHUNK] if count % WALLET_CHUNK else []))
+    in_flight = deque()
+    try:
+        for size in sizes:
+            in_flight.append(pool.submit(_generate_chunk, size))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+    finally:
+        for future in in_flight:
+            future.cancel()